@@ -0,0 +1,27 @@
+"""
+Celery application for the backend project.
+
+Tasks are discovered from each installed app's ``tasks`` module. Broker and
+execution settings are read from Django settings with the ``CELERY_`` prefix.
+"""
+
+import os
+
+from celery import Celery
+from celery.signals import worker_init
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+app = Celery('backend')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    """Serve the worker's Prometheus metrics if CELERY_WORKER_METRICS_PORT is set."""
+    from django.conf import settings
+    from scraper.metrics import start_metrics_server as serve_metrics
+
+    if settings.CELERY_WORKER_METRICS_PORT:
+        serve_metrics(settings.CELERY_WORKER_METRICS_PORT)
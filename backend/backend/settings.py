@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     # Third party apps
     'rest_framework',
@@ -52,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'scraper.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -81,6 +83,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+# Served by an ASGI server (uvicorn backend.asgi:application) for streaming
+ASGI_APPLICATION = 'backend.asgi.application'
 
 # Database
 DATABASES = {
@@ -195,6 +199,172 @@ CORS_ALLOW_HEADERS = [
     'x-requested-with',
 ]
 
+# Celery settings
+# Use CELERY_BROKER_URL=memory:// with CELERY_TASK_ALWAYS_EAGER=True to run
+# search jobs inline without Redis during local development and tests.
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', 'False') == 'True'
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_IGNORE_RESULT = True
+
+# Refresh sweeps (scraper.refresh): businesses checked per batch and per run,
+# and seconds between sweeps scheduled by Celery beat (0 disables them)
+BUSINESS_REFRESH_BATCH_SIZE = int(os.getenv('BUSINESS_REFRESH_BATCH_SIZE', '100'))
+BUSINESS_REFRESH_LIMIT = int(os.getenv('BUSINESS_REFRESH_LIMIT', '1000'))
+BUSINESS_REFRESH_INTERVAL = int(os.getenv('BUSINESS_REFRESH_INTERVAL', '3600'))
+CELERY_BEAT_SCHEDULE = {
+    'refresh-stale-businesses': {
+        'task': 'scraper.tasks.refresh_stale_businesses',
+        'schedule': BUSINESS_REFRESH_INTERVAL,
+    },
+} if BUSINESS_REFRESH_INTERVAL else {}
+
+# Google Maps settings
+# Places fetched concurrently per search (details call + website scrape)
+GOOGLE_MAPS_MAX_WORKERS = int(os.getenv('GOOGLE_MAPS_MAX_WORKERS', '8'))
+# Text search result pages followed per query (the API stops at 3 pages / 60 results)
+GOOGLE_MAPS_MAX_PAGES = int(os.getenv('GOOGLE_MAPS_MAX_PAGES', '3'))
+# Seconds before a next_page_token becomes valid
+GOOGLE_MAPS_PAGE_TOKEN_DELAY = float(os.getenv('GOOGLE_MAPS_PAGE_TOKEN_DELAY', '2.0'))
+# Area sweeps start from an N x N grid of tiles and split dense tiles into
+# quarters at most this many times
+GOOGLE_MAPS_SWEEP_GRID = int(os.getenv('GOOGLE_MAPS_SWEEP_GRID', '3'))
+GOOGLE_MAPS_SWEEP_MAX_DEPTH = int(os.getenv('GOOGLE_MAPS_SWEEP_MAX_DEPTH', '3'))
+# Async text searches (scraper.async_services): whether search jobs run them
+# instead of the threaded service, places fetched concurrently per search,
+# and seconds allowed per Places API request
+GOOGLE_MAPS_ASYNC = os.getenv('GOOGLE_MAPS_ASYNC', 'False') == 'True'
+GOOGLE_MAPS_ASYNC_CONCURRENCY = int(os.getenv('GOOGLE_MAPS_ASYNC_CONCURRENCY', '64'))
+GOOGLE_MAPS_TIMEOUT = float(os.getenv('GOOGLE_MAPS_TIMEOUT', '10'))
+
+# Shared async HTTP client (scraper.aio), one per event loop: requests in
+# flight at most, connections per origin, origins whose pools are kept open,
+# and whether HTTP/2 is negotiated with servers that offer it
+ASYNC_HTTP_MAX_REQUESTS = int(os.getenv('ASYNC_HTTP_MAX_REQUESTS', '500'))
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv('ASYNC_HTTP_MAX_CONNECTIONS', '16'))
+ASYNC_HTTP_MAX_ORIGINS = int(os.getenv('ASYNC_HTTP_MAX_ORIGINS', '1000'))
+ASYNC_HTTP2 = os.getenv('ASYNC_HTTP2', 'True') == 'True'
+
+# Seconds each cached place field stays fresh. Expired contact fields are
+# recrawled from the website; expired phone or website repeat the details call.
+PLACE_DETAILS_CACHE_TTLS = {
+    'phone': 30 * 24 * 3600,
+    'website': 30 * 24 * 3600,
+    'email': 7 * 24 * 3600,
+    'instagram_link': 7 * 24 * 3600,
+    'youtube_link': 7 * 24 * 3600,
+    'twitter_link': 7 * 24 * 3600,
+    'facebook_link': 7 * 24 * 3600,
+}
+
+# Seconds a query's results are served without refetching. Older results
+# are still served immediately while a refresh runs in the background.
+QUERY_CACHE_FRESHNESS = int(os.getenv('QUERY_CACHE_FRESHNESS', str(24 * 3600)))
+
+# Seconds a search job may stay running. A job running longer lost its
+# worker: the task Celery redelivers (CELERY_TASK_ACKS_LATE) runs it again,
+# and it no longer counts as a refresh of its query in progress.
+SEARCH_JOB_TIMEOUT = int(os.getenv('SEARCH_JOB_TIMEOUT', '3600'))
+
+# Live job progress (scraper.events): seconds between a running job's
+# partial result writes, seconds between polls of an event stream, and
+# seconds before a stream ends (EventSource then reconnects)
+SEARCH_RESULTS_FLUSH_INTERVAL = float(os.getenv('SEARCH_RESULTS_FLUSH_INTERVAL', '1.0'))
+SEARCH_EVENTS_POLL_INTERVAL = float(os.getenv('SEARCH_EVENTS_POLL_INTERVAL', '0.5'))
+SEARCH_EVENTS_TIMEOUT = float(os.getenv('SEARCH_EVENTS_TIMEOUT', '300'))
+
+# Queries accepted by one search batch (POST /api/scraper/batches/)
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv('SEARCH_BATCH_MAX_QUERIES', '500'))
+
+# Text search configuration of Business.search_vector (see migration 0013)
+FULL_TEXT_SEARCH_CONFIG = 'english'
+
+# Businesses written per INSERT ... ON CONFLICT statement
+BUSINESS_UPSERT_BATCH_SIZE = int(os.getenv('BUSINESS_UPSERT_BATCH_SIZE', '1000'))
+
+# Rows fetched per round trip by the server-side cursor of business exports
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
+# Contact page crawler (scraper.crawler): pages fetched per site (homepage
+# included), bytes read per page, seconds allowed per site and per page,
+# connections per host, seconds between requests to a host, and the shared
+# connection/thread pool size
+CRAWLER_MAX_PAGES = int(os.getenv('CRAWLER_MAX_PAGES', '4'))
+CRAWLER_MAX_PAGE_BYTES = int(os.getenv('CRAWLER_MAX_PAGE_BYTES', str(512 * 1024)))
+CRAWLER_SITE_BUDGET = float(os.getenv('CRAWLER_SITE_BUDGET', '8'))
+CRAWLER_PAGE_TIMEOUT = float(os.getenv('CRAWLER_PAGE_TIMEOUT', '5'))
+CRAWLER_PER_DOMAIN_CONCURRENCY = int(os.getenv('CRAWLER_PER_DOMAIN_CONCURRENCY', '2'))
+CRAWLER_PER_DOMAIN_INTERVAL = float(os.getenv('CRAWLER_PER_DOMAIN_INTERVAL', '0.25'))
+CRAWLER_MAX_CONNECTIONS = int(os.getenv('CRAWLER_MAX_CONNECTIONS', '32'))
+CRAWLER_USER_AGENT = os.getenv(
+    'CRAWLER_USER_AGENT', 'Mozilla/5.0 (compatible; GoogleMapDownloader/1.0)'
+)
+
+# Domain enrichment cache (scraper.enrichment): seconds a crawl of a website
+# domain is reused by every business on it, and the shorter time a site that
+# could not be reached or returned an error is remembered before a retry
+DOMAIN_ENRICHMENT_TTL = int(os.getenv('DOMAIN_ENRICHMENT_TTL', str(7 * 24 * 3600)))
+DOMAIN_ENRICHMENT_NEGATIVE_TTL = int(os.getenv('DOMAIN_ENRICHMENT_NEGATIVE_TTL', str(24 * 3600)))
+
+# Metrics: bearer token required by /metrics (open when unset), and the port
+# Celery workers serve their own /metrics on (disabled when unset)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+CELERY_WORKER_METRICS_PORT = int(os.getenv('CELERY_WORKER_METRICS_PORT', '0')) or None
+
+# Duplicate detection (scraper.dedup): minimum match score for two
+# businesses to be merged, and whether search jobs check the businesses
+# they insert
+DEDUP_MATCH_THRESHOLD = float(os.getenv('DEDUP_MATCH_THRESHOLD', '0.75'))
+DEDUP_AFTER_SEARCH = os.getenv('DEDUP_AFTER_SEARCH', 'True') == 'True'
+
+# Google Maps API token buckets (scraper.ratelimit): sustained requests per
+# second and burst size. Text search covers places and places_nearby calls.
+GOOGLE_MAPS_RATE_LIMITS = {
+    'text_search': {
+        'rate': float(os.getenv('GOOGLE_MAPS_TEXT_SEARCH_QPS', '10')),
+        'burst': int(os.getenv('GOOGLE_MAPS_TEXT_SEARCH_BURST', '10')),
+    },
+    'details': {
+        'rate': float(os.getenv('GOOGLE_MAPS_DETAILS_QPS', '50')),
+        'burst': int(os.getenv('GOOGLE_MAPS_DETAILS_BURST', '50')),
+    },
+}
+
+# Cache
+# The place_details cache is an in-process LRU unless PLACE_DETAILS_CACHE_URL
+# points at a Redis-compatible server shared by all workers. Rate limit
+# buckets are shared through RATE_LIMIT_URL (REDIS_URL by default) and fall
+# back to per-process buckets without it.
+PLACE_DETAILS_CACHE_URL = os.getenv('PLACE_DETAILS_CACHE_URL')
+RATE_LIMIT_URL = os.getenv('RATE_LIMIT_URL', os.getenv('REDIS_URL'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'place_details': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': PLACE_DETAILS_CACHE_URL,
+        'KEY_PREFIX': 'details',
+    } if PLACE_DETAILS_CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'place-details',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('PLACE_DETAILS_CACHE_MAX_ENTRIES', '100000')),
+        },
+    },
+    'rate_limit': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': RATE_LIMIT_URL,
+        'KEY_PREFIX': 'ratelimit',
+    } if RATE_LIMIT_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rate-limit',
+    },
+}
+
 # Swagger settings
 SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': False,
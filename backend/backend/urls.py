@@ -22,6 +22,7 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from django.views.generic import RedirectView
+from scraper import views as scraper_views
 
 # API Documentation Schema
 schema_view = get_schema_view(
@@ -54,6 +55,9 @@ urlpatterns = [
     # API endpoints
     path('api/auth/', include('accounts.urls')),
     path('api/scraper/', include('scraper.urls')),
+
+    # Prometheus metrics
+    path('metrics', scraper_views.metrics, name='metrics'),
     
     # Swagger URLs - no authentication required
     path('', RedirectView.as_view(url='/api/docs/', permanent=False)),
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Search, Business
+from .models import Search, Business, SearchJob, SearchBatch, SearchAccess, ApiUsage, DomainEnrichment
 
 @admin.register(Search)
 class SearchAdmin(admin.ModelAdmin):
@@ -16,7 +16,7 @@ class BusinessAdmin(admin.ModelAdmin):
     list_filter = ('category', 'rating', 'created_at')
     search_fields = ('name', 'email', 'phone', 'address', 'place_id', 'uuid', 'instagram_link', 'youtube_link', 'twitter_link', 'facebook_link')
     ordering = ('-created_at',)
-    readonly_fields = ('uuid', 'created_at', 'updated_at')
+    readonly_fields = ('uuid', 'created_at', 'updated_at', 'details_fetched_at', 'contacts_fetched_at')
     fieldsets = (
         ('Basic Information', {
             'fields': ('uuid', 'search', 'name', 'category', 'place_id')
@@ -31,7 +31,45 @@ class BusinessAdmin(admin.ModelAdmin):
             'fields': ('rating', 'reviews_count')
         }),
         ('Timestamps', {
-            'fields': ('created_at', 'updated_at'),
+            'fields': ('created_at', 'updated_at', 'details_fetched_at', 'contacts_fetched_at'),
             'classes': ('collapse',)
         })
     )
+
+@admin.register(SearchJob)
+class SearchJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'search', 'status', 'places_found', 'details_fetched', 'pages_fetched', 'results_saved', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status', 'cache_status', 'created_at')
+    search_fields = ('search__query', 'search__user__email')
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+
+@admin.register(SearchBatch)
+class SearchBatchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'queries_total', 'queries_searched', 'places_found', 'results_saved', 'created_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('user__email',)
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+    raw_id_fields = ('user',)
+
+@admin.register(SearchAccess)
+class SearchAccessAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'search')
+    search_fields = ('user__email', 'search__query')
+    raw_id_fields = ('user', 'search')
+
+@admin.register(ApiUsage)
+class ApiUsageAdmin(admin.ModelAdmin):
+    list_display = ('user', 'date', 'call', 'count')
+    list_filter = ('call', 'date')
+    search_fields = ('user__email',)
+    ordering = ('-date', 'call')
+    raw_id_fields = ('user',)
+
+@admin.register(DomainEnrichment)
+class DomainEnrichmentAdmin(admin.ModelAdmin):
+    list_display = ('domain', 'status_code', 'email', 'fetched_at', 'expires_at')
+    list_filter = ('status_code',)
+    search_fields = ('domain', 'email')
+    ordering = ('domain',)
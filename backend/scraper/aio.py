@@ -0,0 +1,188 @@
+"""
+asyncio plumbing shared by the async search pipeline.
+
+get_async_client() returns the HTTP client of the running event loop: one
+httpx.AsyncClient per loop, with a pool of keep-alive connections per
+origin and HTTP/2 where the server offers it, used for both Places API
+calls and website crawls. Sync code (Celery tasks, management commands) runs coroutines on a
+process-wide background loop with run_async(), so every job of a worker
+process shares that loop's client and connection pool.
+"""
+import asyncio
+import inspect
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple, TypeVar
+import httpx
+from django.conf import settings
+
+T = TypeVar('T')
+
+_loop_locals: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]' = weakref.WeakKeyDictionary()
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_lock = threading.Lock()
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that gives back its origin slot when closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, slots: asyncio.Semaphore):
+        self._stream = stream
+        self._slots = slots
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._slots.release()
+
+
+class OriginPools(httpx.AsyncBaseTransport):
+    """
+    Transport keeping one connection pool per origin, as requests' adapter
+    keeps one per host.
+
+    httpcore's pool scans all of its connections and queued requests every
+    time a request starts or ends, so a single pool holding hundreds of
+    them spends more time on that scan than on the requests. Here a pool
+    only holds its origin's connections, and requests beyond its size wait
+    for a slot outside it. The least recently used pools are dropped beyond
+    ASYNC_HTTP_MAX_ORIGINS and closed once requests still running on them
+    have had time to finish.
+    """
+
+    # Seconds an evicted pool stays open for requests still using it
+    EVICTED_POOL_GRACE = 60
+
+    def __init__(self, max_origins: int, max_connections: int, http2: bool = True):
+        self.max_origins = max_origins
+        self.max_connections = max_connections
+        self.http2 = http2
+        # One TLS context for every pool: loading the CA bundle takes tens
+        # of milliseconds
+        self.ssl_context = httpx.create_ssl_context(http2=http2)
+        self._pools: 'OrderedDict[tuple, Tuple[httpx.AsyncHTTPTransport, asyncio.Semaphore]]' = OrderedDict()
+
+    def _pool(self, origin: tuple) -> Tuple[httpx.AsyncHTTPTransport, asyncio.Semaphore]:
+        pool = self._pools.pop(origin, None)
+        if pool is None:
+            # Keep-alive is capped like the pool: httpcore closes idle
+            # connections while the pool holds more than the keep-alive limit
+            pool = (
+                httpx.AsyncHTTPTransport(
+                    verify=self.ssl_context,
+                    http2=self.http2,
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                    ),
+                ),
+                asyncio.Semaphore(self.max_connections),
+            )
+            while len(self._pools) >= self.max_origins:
+                _, (evicted, _) = self._pools.popitem(last=False)
+                asyncio.get_running_loop().call_later(
+                    self.EVICTED_POOL_GRACE, asyncio.ensure_future, evicted.aclose()
+                )
+        self._pools[origin] = pool
+        return pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        transport, slots = self._pool((request.url.scheme, request.url.host, request.url.port))
+        await slots.acquire()
+        try:
+            response = await transport.handle_async_request(request)
+        except BaseException:
+            slots.release()
+            raise
+        response.stream = _ReleasingStream(response.stream, slots)
+        return response
+
+    async def aclose(self) -> None:
+        pools, self._pools = list(self._pools.values()), OrderedDict()
+        for transport, _ in pools:
+            await transport.aclose()
+
+
+def build_async_client() -> httpx.AsyncClient:
+    """Create an async HTTP client with per-origin pools sized by the ASYNC_HTTP_* settings."""
+    return httpx.AsyncClient(
+        transport=OriginPools(
+            settings.ASYNC_HTTP_MAX_ORIGINS,
+            settings.ASYNC_HTTP_MAX_CONNECTIONS,
+            http2=settings.ASYNC_HTTP2,
+        ),
+        follow_redirects=True,
+    )
+
+
+def loop_local(name: str, factory: Callable[[], T]) -> T:
+    """
+    The running event loop's instance of an object, created on first use.
+
+    Connection pools, semaphores and locks belong to the loop they were
+    first used on, so each loop (the ASGI server's, the background loop,
+    a test's) gets its own.
+    """
+    loop = asyncio.get_running_loop()
+    values = _loop_locals.setdefault(loop, {})
+    if name not in values:
+        values[name] = factory()
+    return values[name]
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the running event loop's shared HTTP client."""
+    return loop_local('http_client', build_async_client)
+
+
+def request_slots() -> asyncio.Semaphore:
+    """
+    The running loop's limit on requests in flight, ASYNC_HTTP_MAX_REQUESTS.
+
+    Requests beyond it wait here rather than in a connection pool, whose
+    bookkeeping scans every queued request each time a request ends.
+    """
+    return loop_local('request_slots', lambda: asyncio.Semaphore(settings.ASYNC_HTTP_MAX_REQUESTS))
+
+
+async def maybe_await(value: Any) -> Any:
+    """Await value if it is awaitable, so callbacks may be sync or async."""
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Return the process-wide event loop, running on a daemon thread."""
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None or _background_loop.is_closed():
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_background_loop.run_forever, name='aio-loop', daemon=True
+            ).start()
+        return _background_loop
+
+
+def run_async(coroutine: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """
+    Run a coroutine on the background loop from sync code and return its
+    result. Must not be called from a coroutine: await it there instead.
+    """
+    loop = get_background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is not None:
+        raise RuntimeError('run_async() called from a running event loop; await the coroutine instead')
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result(timeout)
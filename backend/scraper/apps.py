@@ -1,6 +1,11 @@
+from importlib import import_module
 from django.apps import AppConfig
 
 
 class ScraperConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'scraper'
+
+    def ready(self):
+        # Connect the receivers keeping SearchAccess in sync and timing queries
+        import_module(f'{self.name}.signals')
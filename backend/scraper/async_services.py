@@ -0,0 +1,339 @@
+"""
+asyncio counterpart of GoogleMapsService for text searches.
+
+A search waiting on Google or on a business website holds a suspended
+coroutine rather than a thread, so one process can keep hundreds of
+details calls and page fetches in flight. Places API requests and website
+crawls share the event loop's pooled HTTP client (scraper.aio): keep-alive
+connections, HTTP/2 where the server offers it. Rate limit buckets, the
+place details cache and the domain enrichment cache are the ones the
+threaded service uses, so both can run side by side.
+
+Await the service's methods from async views; sync code (Celery tasks)
+runs them on the process's background loop with aio.run_async().
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+import googlemaps
+import httpx
+from django.conf import settings
+from .aio import get_async_client, maybe_await, request_slots
+from .cache import DETAILS_FIELDS, PlaceDetailsCache, fetch_stamps, get_details_cache
+from .crawler import AsyncContactCrawler
+from .enrichment import ENRICHMENT_FIELDS, DomainEnrichmentCache, get_enrichment_cache
+from .metrics import API_CALLS, observe_stage
+from .ratelimit import TokenBucket, get_bucket
+from .services import (
+    API_BUCKETS, PAGE_TOKEN_RETRIES, GoogleMapsService, contact_fields_of, place_fields,
+    summarize_timings,
+)
+
+logger = logging.getLogger(__name__)
+
+# Places API root; a local stand-in can be given instead (see scraper.benchmark)
+DEFAULT_BASE_URL = 'https://maps.googleapis.com'
+
+# Web service path of each API call
+API_PATHS = {
+    'places': '/maps/api/place/textsearch/json',
+    'place': '/maps/api/place/details/json',
+}
+
+# Attempts at a request failing with a server error, a transport error or
+# OVER_QUERY_LIMIT, and the delay before the first retry (doubled each time)
+API_RETRIES = 3
+API_RETRY_DELAY = 0.5
+
+# HTTP statuses retried, as googlemaps.Client does
+RETRIABLE_STATUSES = {500, 503, 504}
+
+# A callback may be a plain function or a coroutine function
+Callback = Callable[..., Union[None, Awaitable[None]]]
+
+
+class AsyncGoogleMapsService:
+    """Text searches over the Places web service, from coroutines."""
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        details_cache: Optional[PlaceDetailsCache] = None,
+        client: Optional[httpx.AsyncClient] = None,
+        buckets: Optional[Dict[str, TokenBucket]] = None,
+        crawler: Optional[AsyncContactCrawler] = None,
+        enrichment: Optional[DomainEnrichmentCache] = None,
+        key: Optional[str] = None,
+        base_url: Optional[str] = None
+    ):
+        """
+        Args:
+            concurrency: Places fetched concurrently per search (details call
+                plus website crawl), settings.GOOGLE_MAPS_ASYNC_CONCURRENCY
+            details_cache: Cache consulted before each details call. Defaults
+                to the process-wide cache from get_details_cache().
+            client: HTTP client. Defaults to the running loop's shared client,
+                so the service can be created outside the loop it is used on.
+            buckets: Rate limit buckets by name (see API_BUCKETS). Defaults
+                to the shared buckets from ratelimit.get_bucket().
+            crawler: Website crawler; defaults to an AsyncContactCrawler on
+                the same client
+            enrichment: Domain cache consulted before crawling a website.
+                Defaults to the process-wide cache from get_enrichment_cache().
+            key: API key, GOOGLE_MAPS_API_KEY by default
+            base_url: API root, DEFAULT_BASE_URL by default
+        """
+        self.client = client
+        self.key = key or os.getenv('GOOGLE_MAPS_API_KEY')
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip('/')
+        self.buckets = buckets
+        self.crawler = crawler or AsyncContactCrawler(client=client)
+        self.enrichment = enrichment or get_enrichment_cache()
+        self.concurrency = concurrency or settings.GOOGLE_MAPS_ASYNC_CONCURRENCY
+        self.details_cache = details_cache or get_details_cache()
+        # Counters read by search jobs, as on GoogleMapsService
+        self.pages_fetched = 0
+        self.tiles_searched = 0
+        self.details_calls_saved = 0
+        self.api_calls: Counter = Counter()
+        self.rate_limit_wait = 0.0
+        self.call_timings: List[Dict[str, Any]] = []
+
+    def _record(self, call: str, target: str, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        observe_stage(call, elapsed)
+        self.call_timings.append({'call': call, 'target': target, 'seconds': round(elapsed, 4)})
+        logger.debug('%s %s took %.3fs', call, target, elapsed)
+
+    def latency_summary(self) -> Dict[str, Dict[str, float]]:
+        """Aggregate call_timings per call type (count, total, max, avg seconds)."""
+        return summarize_timings(self.call_timings)
+
+    async def _api_call(self, call: str, target: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Wait for a rate limit token, then make a timed, counted API request.
+
+        Raises:
+            googlemaps.exceptions.ApiError: The API answered with an error status
+            googlemaps.exceptions.HTTPError: The API answered with an HTTP error
+            googlemaps.exceptions.TransportError: The API could not be reached
+        """
+        name = API_BUCKETS[call]
+        bucket = self.buckets[name] if self.buckets is not None else get_bucket(name)
+        waited = await bucket.aacquire()
+        observe_stage('rate_limit_wait', waited)
+        self.api_calls[call] += 1
+        self.rate_limit_wait += waited
+        started = time.perf_counter()
+        try:
+            result = await self._request(API_PATHS[call], params)
+        except Exception:
+            API_CALLS.labels(call, 'error').inc()
+            raise
+        finally:
+            self._record(call, target, started)
+        API_CALLS.labels(call, 'ok').inc()
+        return result
+
+    async def _request(self, path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """GET an API path, retrying server errors and OVER_QUERY_LIMIT with backoff."""
+        client = self.client or get_async_client()
+        params = {**params, 'key': self.key}
+        for attempt in range(API_RETRIES):
+            last_attempt = attempt == API_RETRIES - 1
+            try:
+                async with request_slots():
+                    response = await client.get(
+                        self.base_url + path, params=params, timeout=settings.GOOGLE_MAPS_TIMEOUT
+                    )
+            except httpx.TimeoutException:
+                if last_attempt:
+                    raise googlemaps.exceptions.Timeout()
+            except httpx.TransportError as e:
+                if last_attempt:
+                    raise googlemaps.exceptions.TransportError(e)
+            else:
+                if response.status_code == 200:
+                    body = response.json()
+                    status = body.get('status')
+                    if status in ('OK', 'ZERO_RESULTS'):
+                        return body
+                    if status != 'OVER_QUERY_LIMIT' or last_attempt:
+                        raise googlemaps.exceptions.ApiError(status, body.get('error_message'))
+                elif response.status_code not in RETRIABLE_STATUSES or last_attempt:
+                    raise googlemaps.exceptions.HTTPError(response.status_code)
+            await asyncio.sleep(API_RETRY_DELAY * 2 ** attempt)
+
+    async def fetch_place_details(self, place_id: str) -> Dict[str, Any]:
+        """Place Details result for a place, limited to the fields we store."""
+        return (await self._api_call(
+            'place', place_id, {'place_id': place_id, 'fields': ','.join(DETAILS_FIELDS)}
+        ))['result']
+
+    async def enrich_website(self, website_url: str) -> Dict[str, Optional[str]]:
+        """
+        Email and social links found on a website, through the domain cache.
+
+        Returns:
+            A value (possibly None) for each of enrichment.ENRICHMENT_FIELDS
+        """
+        if not website_url:
+            return dict.fromkeys(ENRICHMENT_FIELDS)
+        started = time.perf_counter()
+        try:
+            return await self.enrichment.alookup(website_url, self.crawler)
+        finally:
+            self._record('scrape', website_url, started)
+
+    async def extract_email_from_website(self, website_url: str) -> Optional[str]:
+        """Find a contact email on a website: its homepage, then likely contact pages."""
+        return (await self.enrich_website(website_url))['email']
+
+    async def search_places(
+        self,
+        query: str,
+        progress: Optional[Callback] = None,
+        max_pages: Optional[int] = None,
+        on_results: Optional[Callback] = None,
+        concurrency: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Search for places as GoogleMapsService.search_places() does.
+
+        Each place is fetched by its own task, at most `concurrency` at a
+        time; a page's places are fetched while the token for the next page
+        activates. Results are returned in the order Google Maps ranked
+        them.
+
+        Args:
+            query: Search query string or Google Maps URL
+            progress: Called as progress(fetched, total, pages) after each
+                page and each batch of fetched places; may be a coroutine
+                function. Plain functions run on the event loop and must not
+                block: wrap database work with asgiref's sync_to_async.
+            max_pages: Override settings.GOOGLE_MAPS_MAX_PAGES
+            on_results: Called with the businesses just fetched, in
+                completion order, before progress; sync or async like progress
+            concurrency: Override the instance concurrency for this search
+
+        Returns:
+            List of business details
+        """
+        query, search_kwargs = GoogleMapsService._text_search_args(query)
+        params = {'query': query}
+        if 'location' in search_kwargs:
+            params['location'] = '%s,%s' % search_kwargs['location']
+            params['radius'] = search_kwargs['radius']
+        max_pages = max_pages or settings.GOOGLE_MAPS_MAX_PAGES
+        semaphore = asyncio.Semaphore(max(1, concurrency or self.concurrency))
+        self.pages_fetched = 0
+        seen_place_ids = set()
+        tasks: List[asyncio.Task] = []
+        pending = set()
+        fetched = 0
+
+        async def fetch(place: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._fetch_business(place)
+
+        async def report():
+            if progress:
+                await maybe_await(progress(fetched, len(tasks), self.pages_fetched))
+
+        async def drain(timeout: Optional[float] = None):
+            """Wait for pending places, reporting progress, for up to timeout seconds."""
+            nonlocal pending, fetched
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                fetched += len(done)
+                if on_results:
+                    await maybe_await(on_results([
+                        task.result() for task in done if task.exception() is None
+                    ]))
+                await report()
+            if deadline is not None:
+                await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+
+        try:
+            places_result = await self._api_call('places', query, params)
+            while True:
+                self.pages_fetched += 1
+                for place in places_result.get('results', []):
+                    if place['place_id'] in seen_place_ids:
+                        continue
+                    seen_place_ids.add(place['place_id'])
+                    task = asyncio.ensure_future(fetch(place))
+                    tasks.append(task)
+                    pending.add(task)
+                await report()
+
+                page_token = places_result.get('next_page_token')
+                if not page_token or self.pages_fetched >= max_pages:
+                    break
+                await drain(timeout=settings.GOOGLE_MAPS_PAGE_TOKEN_DELAY)
+                places_result = await self._next_page(
+                    f'{query} (page {self.pages_fetched + 1})', page_token
+                )
+
+            await drain()
+            # Collect in submission order; re-raises the first failure
+            businesses = [task.result() for task in tasks]
+        finally:
+            # A failed or cancelled search stops its remaining places
+            for task in pending:
+                task.cancel()
+
+        logger.info(
+            'async search_places(%r): %d results from %d pages, latency %s, details cache %s',
+            query, len(businesses), self.pages_fetched, self.latency_summary(),
+            self.details_cache.stats()
+        )
+        return businesses
+
+    async def _next_page(self, target: str, page_token: str) -> Dict[str, Any]:
+        """Fetch the next page of a search, retrying while the token activates."""
+        for attempt in range(PAGE_TOKEN_RETRIES):
+            try:
+                return await self._api_call('places', target, {'pagetoken': page_token})
+            except googlemaps.exceptions.ApiError as e:
+                if e.status != 'INVALID_REQUEST' or attempt == PAGE_TOKEN_RETRIES - 1:
+                    raise
+                await asyncio.sleep(settings.GOOGLE_MAPS_PAGE_TOKEN_DELAY / 2)
+
+    async def _fetch_business(self, place: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Fetch details and crawl the website for a single search result,
+        only for the fields expired from the details cache (see
+        GoogleMapsService._fetch_business).
+        """
+        business = place_fields(place)
+        cached = await self.details_cache.aget(place['place_id'])
+        business.update(cached.fields)
+        if not cached.expired:
+            business.update(fetch_stamps(cached.fetched_at))
+            return business
+
+        if cached.needs_details_call:
+            place_details = await self.fetch_place_details(place['place_id'])
+        else:
+            place_details = cached.place_details()
+        if cached.needs_crawl:
+            contacts = await self.enrich_website(place_details.get('website', ''))
+        else:
+            contacts = cached.contacts()
+        fetched = contact_fields_of(place_details, contacts)
+        refreshed = {field: fetched.get(field) for field in cached.expired}
+        refreshed_at = cached.refetch_times(place_details.get('website', ''), contacts)
+        business.update(refreshed)
+        business.update(fetch_stamps({**cached.fetched_at, **refreshed_at}))
+        await self.details_cache.aset(place['place_id'], refreshed, refreshed_at)
+        return business
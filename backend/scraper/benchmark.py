@@ -0,0 +1,491 @@
+"""
+Offline benchmark of the search pipeline.
+
+FakeMapsAPI stands in for the Places API (text search, nearby search and
+details) and FakeWebsites serves the business websites it points to, both on
+local HTTP servers with configurable latency. run_benchmark drives real
+GoogleMapsService (or AsyncGoogleMapsService) searches against them, saves the results like a search
+job does (rolled back afterwards) and reports latency percentiles, API calls
+and database queries per configuration. run_extractor_benchmark times the
+contact extractor alone over saved or synthetic pages.
+"""
+import hashlib
+import json
+import math
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qs, urlsplit
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from .aio import run_async
+from .async_services import AsyncGoogleMapsService
+from .cache import PlaceDetailsCache
+from .crawler import AsyncContactCrawler, AsyncDomainLimiter, ContactCrawler, DomainLimiter
+from .dedup import deduplicate_businesses
+from .extract import extract_chunks, find_emails
+from .models import Search
+from .ratelimit import TokenBucket
+from .services import GoogleMapsService, build_maps_client, save_search_results
+
+# Results per page of a Places API search
+PAGE_SIZE = 20
+
+# Passes googlemaps.Client's key format check; never sent to Google
+BENCHMARK_API_KEY = 'AIza-benchmark-offline-key'
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # Concurrent searches open hundreds of connections at once
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class _FakeServer:
+    """ThreadingHTTPServer on a free local port, served from a daemon thread."""
+
+    def __init__(self, handler_class):
+        self.requests: Counter = Counter()
+        self._lock = threading.Lock()
+        handler = type(handler_class.__name__, (handler_class,), {'fake': self})
+        self.httpd = _HTTPServer(('127.0.0.1', 0), handler)
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.requests[name] += 1
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.requests.clear()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, as the real servers offer
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    fake = None
+
+    def send_body(self, body: bytes, content_type: str, status: int = 200) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _MapsHandler(_Handler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        endpoint = url.path.rsplit('/', 2)[-2]
+        self.fake.count(endpoint)
+        time.sleep(self.fake.latency)
+
+        if endpoint in ('textsearch', 'nearbysearch'):
+            body = self.fake.search(params.get('query') or params.get('keyword', ''), params.get('pagetoken'))
+        elif endpoint == 'details':
+            body = self.fake.details(params.get('placeid') or params['place_id'])
+        else:
+            body = {'status': 'INVALID_REQUEST', 'error_message': f'Unknown endpoint {url.path}'}
+        self.send_body(json.dumps(body).encode(), 'application/json')
+
+
+class FakeMapsAPI(_FakeServer):
+    """
+    Local stand-in for the Places API endpoints GoogleMapsService uses.
+
+    Every query has `results` places with stable ids, served PAGE_SIZE at a
+    time. Like the real API, a next_page_token is rejected with
+    INVALID_REQUEST until token_delay seconds after it was issued. Details
+    point each place's website at `website_url`.
+    """
+
+    def __init__(
+        self,
+        results: int = 60,
+        latency: float = 0.05,
+        token_delay: float = 2.0,
+        website_url: Optional[str] = None
+    ):
+        super().__init__(_MapsHandler)
+        self.results = results
+        self.latency = latency
+        self.token_delay = token_delay
+        self.website_url = website_url
+        self._tokens: Dict[str, Any] = {}
+
+    def search(self, query: str, page_token: Optional[str]) -> Dict[str, Any]:
+        offset = 0
+        if page_token:
+            with self._lock:
+                token = self._tokens.get(page_token)
+            if token is None or time.monotonic() - token['issued'] < self.token_delay:
+                return {'status': 'INVALID_REQUEST', 'results': []}
+            query, offset = token['query'], token['offset']
+
+        prefix = hashlib.sha1(query.encode()).hexdigest()[:10]
+        count = min(PAGE_SIZE, self.results - offset)
+        body = {
+            'status': 'OK' if count > 0 else 'ZERO_RESULTS',
+            'results': [self.place(prefix, offset + i) for i in range(max(count, 0))],
+        }
+        if offset + PAGE_SIZE < self.results:
+            token = uuid.uuid4().hex
+            with self._lock:
+                self._tokens[token] = {
+                    'query': query, 'offset': offset + PAGE_SIZE, 'issued': time.monotonic()
+                }
+            body['next_page_token'] = token
+        return body
+
+    @staticmethod
+    def place(prefix: str, index: int) -> Dict[str, Any]:
+        # Spread over a grid ~1 km apart so places never look like duplicates
+        return {
+            'place_id': f'bench-{prefix}-{index}',
+            'name': f'Benchmark Business {prefix} {index}',
+            'formatted_address': f'{index} Benchmark Ave',
+            'geometry': {'location': {'lat': 30 + (index // 100) * 0.01, 'lng': -97 + (index % 100) * 0.01}},
+            'rating': 4.0 + index % 10 / 10,
+            'user_ratings_total': index,
+            'types': ['store', 'point_of_interest'],
+        }
+
+    def details(self, place_id: str) -> Dict[str, Any]:
+        index = int(place_id.rsplit('-', 1)[-1])
+        result = {'formatted_phone_number': f'(512) 555-{index % 10000:04d}'}
+        if self.website_url:
+            result['website'] = f'{self.website_url}/site/{place_id}'
+        return {'status': 'OK', 'result': result}
+
+
+class _SiteHandler(_Handler):
+    def do_GET(self):
+        self.fake.count('page')
+        time.sleep(self.fake.latency)
+        self.send_body(self.fake.page(self.path), 'text/html; charset=utf-8')
+
+
+class FakeWebsites(_FakeServer):
+    """
+    Serves a synthetic site of pages of about `size` bytes per place at
+    /site/<place_id>. The email is on the homepage, or with
+    email_page='contact' only on the contact page the homepage links to.
+    """
+
+    def __init__(self, latency: float = 0.1, size: int = 20_000, email_page: str = 'home'):
+        super().__init__(_SiteHandler)
+        self.latency = latency
+        self.size = size
+        self.email_page = email_page
+
+    def page(self, path: str) -> bytes:
+        parts = path.strip('/').split('/')
+        place_id = parts[1] if len(parts) > 1 else ''
+        name = parts[2] if len(parts) > 2 else 'home'
+        head = (
+            f'<html><head><title>{place_id}</title></head><body>'
+            f'<h1>{place_id}</h1>'
+            f'<a href="/site/{place_id}/about">About us</a>'
+            f'<a href="/site/{place_id}/contact">Contact</a>'
+            f'<a href="https://www.facebook.com/{place_id}">Facebook</a>'
+        )
+        if name == self.email_page:
+            head += f'<a href="mailto:info@{place_id}.test">info@{place_id}.test</a>'
+
+        tail = '</body></html>'
+        filler = '<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>'
+        repeat = max(0, self.size - len(head) - len(tail)) // len(filler) + 1
+        return (head + filler * repeat + tail).encode()
+
+
+# Chunk size the crawler streams pages in
+EXTRACT_CHUNK_SIZE = 16 * 1024
+
+
+def synthetic_corpus() -> Dict[str, bytes]:
+    """
+    Pages standing in for saved business websites: small and large, with
+    the contacts in links, in text, obfuscated, or past the byte cap.
+    """
+    filler = '<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>'
+    script = '<script>var config = {"analytics": "UA-0000-1", "cdn": "https://cdn.test/app.js"};</script>'
+    nav = (
+        '<nav><a href="/">Home</a><a href="/about">About</a><a href="/contact">Contact</a>'
+        '<a href="https://www.instagram.com/shop">Instagram</a></nav>'
+    )
+
+    def page(body: str, size: int) -> bytes:
+        head = f'<!DOCTYPE html><html><head><title>Shop</title>{script * 20}</head><body>{nav}'
+        padding = filler * (max(0, size - len(head) - len(body)) // len(filler))
+        return (head + padding + body + '</body></html>').encode()
+
+    return {
+        'mailto-20k': page('<a href="mailto:hello@shop.test">Email us</a>', 20_000),
+        'text-email-200k': page('<p>Write to sales@shop.test or call +1 (512) 555-0100</p>', 200_000),
+        'obfuscated-50k': page('<p>info [at] shop [dot] test</p><a href="tel:+15125550100">Call</a>', 50_000),
+        'no-contacts-100k': page('<p>Opening hours: 9-17</p>', 100_000),
+        'email-past-cap-2m': page('<a href="mailto:late@shop.test">Email</a>', 2_000_000),
+    }
+
+
+def run_extractor_benchmark(
+    pages: Dict[str, bytes],
+    repeat: int = 20,
+    max_bytes: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Time contact extraction per page: the streaming extractor (fed in the
+    crawler's chunk size, stopping at max_bytes) against decoding the whole
+    body and running the email regex over it.
+
+    Args:
+        pages: Page bodies by name
+        repeat: Timed runs per page and method
+        max_bytes: Byte cap of the extractor, settings.CRAWLER_MAX_PAGE_BYTES by default
+
+    Returns:
+        JSON-serializable report
+    """
+    if max_bytes is None:
+        max_bytes = settings.CRAWLER_MAX_PAGE_BYTES
+    runs = []
+    for name, body in pages.items():
+        chunks = [body[i:i + EXTRACT_CHUNK_SIZE] for i in range(0, len(body), EXTRACT_CHUNK_SIZE)]
+        extractor_times, regex_times = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            extractor, read, truncated = extract_chunks(chunks, max_bytes=max_bytes)
+            extractor_times.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            regex_emails = find_emails(body.decode('utf-8', errors='replace'))
+            regex_times.append(time.perf_counter() - started)
+        runs.append({
+            'page': name,
+            'bytes': len(body),
+            'bytes_read': read,
+            'truncated': truncated,
+            'extractor_seconds': percentiles(extractor_times),
+            'regex_seconds': percentiles(regex_times),
+            'emails': extractor.emails,
+            'phones': extractor.phones,
+            'social_links': extractor.social_links,
+            'regex_emails': list(dict.fromkeys(regex_emails)),
+        })
+
+    total_bytes = sum(run['bytes'] for run in runs)
+    totals = {}
+    for method in ('extractor', 'regex'):
+        seconds = sum(run[f'{method}_seconds']['p50'] for run in runs)
+        totals[method] = {
+            'seconds': round(seconds, 4),
+            'mb_per_second': round(total_bytes / seconds / 1e6, 1) if seconds else None,
+        }
+    return {
+        'config': {'pages': len(pages), 'repeat': repeat, 'max_bytes': max_bytes},
+        'runs': runs,
+        'totals': totals,
+    }
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """p50/p95/min/max of a list of seconds, rounded to 0.1 ms."""
+    ordered = sorted(values)
+    if len(ordered) > 1:
+        p95 = statistics.quantiles(ordered, n=20, method='inclusive')[-1]
+    else:
+        p95 = ordered[0]
+    return {
+        'p50': round(statistics.median(ordered), 4),
+        'p95': round(p95, 4),
+        'min': round(ordered[0], 4),
+        'max': round(ordered[-1], 4),
+    }
+
+
+def run_search(
+    api: FakeMapsAPI,
+    sites: FakeWebsites,
+    workers: int,
+    buckets: Dict[str, TokenBucket],
+    async_service: bool = False
+) -> Dict[str, Any]:
+    """
+    One search through the pipeline: search_places, then the job's save
+    and deduplication inside a transaction that is rolled back.
+
+    Args:
+        workers: max_workers, or concurrency of an async search
+        async_service: Search with AsyncGoogleMapsService on the background
+            event loop instead of the threaded service
+    """
+    api.reset_counts()
+    sites.reset_counts()
+    # A fresh query gives fresh place ids, so the details cache never hits
+    query = f'benchmark {uuid.uuid4().hex[:12]}'
+    max_pages = math.ceil(api.results / PAGE_SIZE)
+    # Every fake site is on the same host, so per-domain politeness would
+    # serialize all scrapes; real sites are on different hosts
+    if async_service:
+        service = AsyncGoogleMapsService(
+            concurrency=workers,
+            details_cache=PlaceDetailsCache(alias='default'),
+            buckets=buckets,
+            crawler=AsyncContactCrawler(limiter=AsyncDomainLimiter(concurrency=1000, interval=0)),
+            key=BENCHMARK_API_KEY,
+            base_url=api.url
+        )
+    else:
+        service = GoogleMapsService(
+            max_workers=workers,
+            details_cache=PlaceDetailsCache(alias='default'),
+            client=build_maps_client(key=BENCHMARK_API_KEY, base_url=api.url),
+            buckets=buckets,
+            crawler=ContactCrawler(limiter=DomainLimiter(concurrency=1000, interval=0))
+        )
+
+    started = time.perf_counter()
+    if async_service:
+        businesses_data = run_async(service.search_places(query, max_pages=max_pages))
+    else:
+        businesses_data = service.search_places(query, max_pages=max_pages)
+    search_seconds = time.perf_counter() - started
+
+    User = get_user_model()
+    with transaction.atomic():
+        user = User.objects.create_user(f'{uuid.uuid4().hex[:12]}@benchmark.invalid', None, name='Benchmark')
+        search = Search.objects.create(user=user, query=query)
+        save_started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            businesses = save_search_results(search, businesses_data)
+            if settings.DEDUP_AFTER_SEARCH:
+                deduplicate_businesses(businesses)
+        save_seconds = time.perf_counter() - save_started
+        transaction.set_rollback(True)
+
+    return {
+        'places': len(businesses_data),
+        'search_seconds': search_seconds,
+        'save_seconds': save_seconds,
+        'total_seconds': search_seconds + save_seconds,
+        'api_calls': dict(service.api_calls),
+        'api_requests': dict(api.requests),
+        'website_requests': sites.requests['page'],
+        'emails_found': sum(1 for data in businesses_data if data.get('email')),
+        'db_queries': len(queries.captured_queries),
+        'rate_limit_wait': service.rate_limit_wait,
+    }
+
+
+def run_benchmark(
+    result_counts: Iterable[int],
+    worker_counts: Iterable[int],
+    repeat: int = 3,
+    api_latency: float = 0.05,
+    site_latency: float = 0.1,
+    site_size: int = 20_000,
+    email_page: str = 'home',
+    token_delay: Optional[float] = None,
+    throttled: bool = True,
+    async_service: bool = False,
+    progress=None
+) -> Dict[str, Any]:
+    """
+    Benchmark every combination of result count and worker count.
+
+    Args:
+        result_counts: Places returned per search
+        worker_counts: GoogleMapsService max_workers values
+        repeat: Searches per combination
+        api_latency: Seconds the fake Places API takes per request
+        site_latency: Seconds the fake websites take per page
+        site_size: Bytes per website page
+        email_page: Page of each site with the email, 'home' or 'contact'
+        token_delay: Seconds before a next_page_token works, defaults to
+            settings.GOOGLE_MAPS_PAGE_TOKEN_DELAY (the service waits as long)
+        throttled: Apply settings.GOOGLE_MAPS_RATE_LIMITS (with private,
+            in-memory buckets); False removes rate limiting
+        async_service: Benchmark AsyncGoogleMapsService, with worker counts
+            used as its concurrency
+        progress: Called with each finished combination's report entry
+
+    Returns:
+        JSON-serializable report
+    """
+    if token_delay is None:
+        token_delay = settings.GOOGLE_MAPS_PAGE_TOKEN_DELAY
+    config = {
+        'result_counts': list(result_counts),
+        'worker_counts': list(worker_counts),
+        'repeat': repeat,
+        'api_latency': api_latency,
+        'site_latency': site_latency,
+        'site_size': site_size,
+        'email_page': email_page,
+        'token_delay': token_delay,
+        'throttled': throttled,
+        'async_service': async_service,
+        'rate_limits': settings.GOOGLE_MAPS_RATE_LIMITS,
+        'database': connection.vendor,
+    }
+    runs = []
+    with FakeWebsites(latency=site_latency, size=site_size, email_page=email_page) as sites, \
+            FakeMapsAPI(latency=api_latency, token_delay=token_delay, website_url=sites.url) as api, \
+            override_settings(GOOGLE_MAPS_PAGE_TOKEN_DELAY=token_delay):
+        for results in config['result_counts']:
+            api.results = results
+            for workers in config['worker_counts']:
+                samples = []
+                for _ in range(repeat):
+                    # Fresh buckets so each search starts with a full burst
+                    buckets = {
+                        name: TokenBucket(name, limits['rate'], limits['burst'], alias=None)
+                        if throttled else TokenBucket(name, 1e9, 10 ** 9, alias=None)
+                        for name, limits in settings.GOOGLE_MAPS_RATE_LIMITS.items()
+                    }
+                    samples.append(run_search(api, sites, workers, buckets, async_service))
+                last = samples[-1]
+                total = percentiles([s['total_seconds'] for s in samples])
+                entry = {
+                    'results': results,
+                    'workers': workers,
+                    'places': last['places'],
+                    'total_seconds': total,
+                    'search_seconds': percentiles([s['search_seconds'] for s in samples]),
+                    'save_seconds': percentiles([s['save_seconds'] for s in samples]),
+                    'places_per_second': round(last['places'] / total['p50'], 2) if total['p50'] else None,
+                    'api_calls': last['api_calls'],
+                    'api_requests': last['api_requests'],
+                    'website_requests': last['website_requests'],
+                    'emails_found': last['emails_found'],
+                    'db_queries': max(s['db_queries'] for s in samples),
+                    'rate_limit_wait': percentiles([s['rate_limit_wait'] for s in samples]),
+                }
+                runs.append(entry)
+                if progress:
+                    progress(entry)
+    return {'config': config, 'runs': runs}
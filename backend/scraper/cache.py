@@ -0,0 +1,217 @@
+import threading
+from datetime import datetime
+from typing import Dict, Any, Iterable, List, NamedTuple, Optional
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from .metrics import DETAILS_CACHE_LOOKUPS
+
+# Place Details fields requested from the API. Everything else we store
+# (name, address, rating, location, ...) already comes with the text search
+# result, so asking for more would only add billed data SKUs.
+DETAILS_FIELDS = ['formatted_phone_number', 'website']
+
+# Cached business fields that come from the details call; the others
+# (email, social links) come from crawling the place's website
+DETAILS_CALL_FIELDS = {'phone', 'website'}
+
+
+class CachedDetails(NamedTuple):
+    """Outcome of PlaceDetailsCache.get()."""
+    # Cached fields still within their TTL
+    fields: Dict[str, Any]
+    # Fields to fetch again: expired, evicted or never cached
+    expired: List[str]
+    # When each cached field was fetched; None for a crawl that found nothing
+    fetched_at: Dict[str, Optional[datetime]]
+
+    @property
+    def needs_details_call(self) -> bool:
+        """Whether a field only the paid details call provides has expired."""
+        return any(field in DETAILS_CALL_FIELDS for field in self.expired)
+
+    @property
+    def needs_crawl(self) -> bool:
+        """Whether a field found by crawling the website has expired."""
+        return any(field not in DETAILS_CALL_FIELDS for field in self.expired)
+
+    def refetch_times(self, website: str, contacts: Dict[str, Any]) -> Dict[str, Optional[datetime]]:
+        """
+        Fetch times of the expired fields, fetched again just now with these
+        website contacts. A crawl of a website that found nothing (dead
+        site, timeout) gives the crawled fields no fetch time.
+        """
+        now = timezone.now()
+        crawl_failed = bool(website) and not any(contacts.values())
+        return {
+            field: None if crawl_failed and field not in DETAILS_CALL_FIELDS else now
+            for field in self.expired
+        }
+
+    def place_details(self) -> Dict[str, Any]:
+        """Place Details result rebuilt from the cached fields, used instead of the details call."""
+        return {
+            'formatted_phone_number': self.fields.get('phone'),
+            'website': self.fields.get('website') or '',
+        }
+
+    def contacts(self) -> Dict[str, Any]:
+        """Website contacts rebuilt from the cached fields, used instead of a crawl."""
+        contacts = {
+            field: value for field, value in self.fields.items() if field not in DETAILS_CALL_FIELDS
+        }
+        # The cached phone is already in place_details()
+        contacts['phone'] = None
+        return contacts
+
+
+def _oldest(times: Iterable[Optional[datetime]]) -> Optional[datetime]:
+    times = list(times)
+    return None if not times or None in times else min(times)
+
+
+def fetch_stamps(fetched_at: Dict[str, Optional[datetime]]) -> Dict[str, Optional[datetime]]:
+    """
+    details_fetched_at and contacts_fetched_at of a business from the fetch
+    times of its fields: each group is as old as its oldest field, and has
+    no fetch time while one of its fields has none.
+    """
+    return {
+        'details_fetched_at': _oldest(
+            time for field, time in fetched_at.items() if field in DETAILS_CALL_FIELDS
+        ),
+        'contacts_fetched_at': _oldest(
+            time for field, time in fetched_at.items() if field not in DETAILS_CALL_FIELDS
+        ),
+    }
+
+
+class PlaceDetailsCache:
+    """
+    Cache of the business fields derived from a place's details call and
+    website scrape, keyed by place_id.
+
+    Each field is stored under its own key with its own timeout (see
+    settings.PLACE_DETAILS_CACHE_TTLS), so volatile fields expire before
+    stable ones and only the expired ones are fetched again. A value is
+    stored with the time it was fetched, so a business served from the
+    cache keeps the age of its data. Storage is any
+    Django cache alias: LocMemCache gives an in-process LRU, RedisCache a
+    store shared by every worker.
+    """
+
+    def __init__(self, alias: str = 'place_details', ttls: Optional[Dict[str, int]] = None):
+        self.alias = alias
+        self.ttls = ttls or settings.PLACE_DETAILS_CACHE_TTLS
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, place_id: str, field: str) -> str:
+        return f'place:{place_id}:{field}'
+
+    def _keys(self, place_id: str) -> Dict[str, str]:
+        return {self._key(place_id, field): field for field in self.ttls}
+
+    def get(self, place_id: str) -> CachedDetails:
+        """Return the fresh cached fields for place_id and the ones to fetch again."""
+        keys = self._keys(place_id)
+        return self._lookup(keys, self.cache.get_many(list(keys)))
+
+    async def aget(self, place_id: str) -> CachedDetails:
+        """get() for coroutines, reading through the cache's async API."""
+        keys = self._keys(place_id)
+        return self._lookup(keys, await self.cache.aget_many(list(keys)))
+
+    def _lookup(self, keys: Dict[str, str], found: Dict[str, Any]) -> CachedDetails:
+        fields = {}
+        fetched_at = {}
+        for key, stored in found.items():
+            # Values cached before fetch times were stored have none
+            value, time = stored if isinstance(stored, tuple) else (stored, None)
+            fields[keys[key]] = value
+            fetched_at[keys[key]] = time
+        expired = [field for field in self.ttls if field not in fields]
+        if not expired:
+            result = 'hit'
+        elif fields:
+            result = 'partial'
+        else:
+            result = 'miss'
+        DETAILS_CACHE_LOOKUPS.labels(result).inc()
+        with self._lock:
+            if result == 'hit':
+                self.hits += 1
+            elif result == 'partial':
+                self.partial_hits += 1
+            else:
+                self.misses += 1
+        return CachedDetails(fields, expired, fetched_at)
+
+    def _by_ttl(
+        self,
+        place_id: str,
+        data: Dict[str, Any],
+        fetched_at: Optional[Dict[str, Optional[datetime]]]
+    ) -> Dict[int, Dict[str, Any]]:
+        if fetched_at is None:
+            fetched_at = dict.fromkeys(data, timezone.now())
+        by_ttl: Dict[int, Dict[str, Any]] = {}
+        for field, ttl in self.ttls.items():
+            if field in data:
+                by_ttl.setdefault(ttl, {})[self._key(place_id, field)] = (data[field], fetched_at.get(field))
+        return by_ttl
+
+    def set(
+        self,
+        place_id: str,
+        data: Dict[str, Any],
+        fetched_at: Optional[Dict[str, Optional[datetime]]] = None
+    ) -> None:
+        """
+        Store the cacheable fields of data, grouped by their TTL.
+
+        Args:
+            fetched_at: When each field was fetched; now by default
+        """
+        for ttl, values in self._by_ttl(place_id, data, fetched_at).items():
+            self.cache.set_many(values, timeout=ttl)
+
+    async def aset(
+        self,
+        place_id: str,
+        data: Dict[str, Any],
+        fetched_at: Optional[Dict[str, Optional[datetime]]] = None
+    ) -> None:
+        """set() for coroutines, writing through the cache's async API."""
+        for ttl, values in self._by_ttl(place_id, data, fetched_at).items():
+            await self.cache.aset_many(values, timeout=ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process."""
+        with self._lock:
+            lookups = self.hits + self.partial_hits + self.misses
+            return {
+                'hits': self.hits,
+                'partial_hits': self.partial_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_details_cache = None
+_details_cache_lock = threading.Lock()
+
+
+def get_details_cache() -> PlaceDetailsCache:
+    """Return the process-wide place details cache."""
+    global _details_cache
+    with _details_cache_lock:
+        if _details_cache is None:
+            _details_cache = PlaceDetailsCache()
+        return _details_cache
@@ -0,0 +1,560 @@
+"""
+Contact page crawler used to find a business's email address.
+
+A site's homepage is fetched first; if it has no email, the links most
+likely to lead to a contact page are fetched concurrently and the crawl
+stops at the first page with an email. Phone numbers and links to the
+business's social media profiles are collected from the pages on the way
+(see scraper.extract). Requests share one connection pool and one thread
+pool, are limited per domain (concurrency and spacing) and must finish
+within a time budget per site. AsyncContactCrawler does the same from
+coroutines, on the event loop's shared HTTP client.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from .aio import get_async_client, loop_local, request_slots
+from .extract import PageExtractor, aextract_chunks, charset_of, extract_chunks, extract_page, is_html
+from .metrics import BYTES_DOWNLOADED, WEBSITE_SCRAPES, ContextThreadPool, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Words marking a link as a likely contact page, best first
+CONTACT_KEYWORDS = [
+    'contact', 'kontakt', 'contacto', 'get-in-touch', 'impressum',
+    'about', 'team', 'support', 'info',
+]
+
+# Tried when the homepage links to none of the above
+FALLBACK_PATHS = ['/contact', '/contact-us', '/about']
+
+
+class FetchedPage(NamedTuple):
+    """Outcome of one page request."""
+    # HTTP status, None when the request failed or the budget ran out
+    status: Optional[int] = None
+    # Set for HTML pages with status 200
+    extractor: Optional[PageExtractor] = None
+    # Validators for conditional requests
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # URL the page was served from, after redirects
+    url: Optional[str] = None
+
+
+class SiteContacts(NamedTuple):
+    """What a crawl found on a site."""
+    # Homepage HTTP status, None when the site could not be reached; 304
+    # when a conditional crawl found the homepage unchanged (nothing else
+    # is set then)
+    status: Optional[int]
+    email: Optional[str]
+    phone: Optional[str]
+    # Business social link field -> profile URL
+    social_links: Dict[str, str]
+    # Homepage validators, for the next conditional crawl
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+def contact_links(html: str, base_url: str, limit: int) -> List[str]:
+    """
+    Up to `limit` same-host links most likely to be contact pages.
+
+    Links are ranked by the best CONTACT_KEYWORDS match in their URL path or
+    text; FALLBACK_PATHS fill in when the page has none.
+    """
+    return _rank_contact_links(extract_page(html).links, base_url, limit)
+
+
+def _rank_contact_links(links: List[Tuple[str, str]], base_url: str, limit: int) -> List[str]:
+    host = urlsplit(base_url).hostname
+    ranked: Dict[str, int] = {}
+    for href, text in links:
+        url = urljoin(base_url, href).split('#')[0]
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or parts.hostname != host or url == base_url:
+            continue
+        haystack = f'{parts.path} {text}'.lower()
+        for rank, keyword in enumerate(CONTACT_KEYWORDS):
+            if keyword in haystack:
+                ranked[url] = min(rank, ranked.get(url, rank))
+                break
+
+    links = sorted(ranked, key=ranked.get)[:limit]
+    for path in FALLBACK_PATHS:
+        if len(links) >= limit:
+            break
+        url = urljoin(base_url, path)
+        if url not in links and url != base_url:
+            links.append(url)
+    return links
+
+
+def _homepage_url(website_url: str) -> str:
+    if not website_url.startswith(('http://', 'https://')):
+        return 'https://' + website_url
+    return website_url
+
+
+def _conditional_headers(etag: Optional[str], last_modified: Optional[str]) -> Dict[str, str]:
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+
+def _site_contacts(
+    pages: List[PageExtractor],
+    email: Optional[str],
+    status: Optional[int],
+    etag: Optional[str],
+    last_modified: Optional[str]
+) -> SiteContacts:
+    """SiteContacts of the pages crawled: the first phone and profile link per network."""
+    phones = [phone for page in pages for phone in page.phones]
+    socials: Dict[str, str] = {}
+    for page in pages:
+        for field, link in page.social_links.items():
+            socials.setdefault(field, link)
+    return SiteContacts(status, email, phones[0] if phones else None, socials, etag, last_modified)
+
+
+def _until(chunks: Iterator[bytes], deadline: float) -> Iterator[bytes]:
+    """
+    Pass chunks through until the deadline, then raise requests.Timeout.
+
+    requests' timeout applies per read, so a server sending a byte at a
+    time would otherwise keep a page going past the site budget.
+    """
+    for chunk in chunks:
+        if time.monotonic() >= deadline:
+            raise requests.Timeout('Site budget used up while reading the page')
+        yield chunk
+
+
+class DomainLimiter:
+    """
+    Per-host politeness: at most `concurrency` requests in flight to a host,
+    started at least `interval` seconds apart.
+    """
+
+    # Hosts tracked before idle ones are forgotten
+    MAX_HOSTS = 10_000
+
+    def __init__(self, concurrency: int, interval: float):
+        self.concurrency = concurrency
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, Dict] = {}
+
+    @contextmanager
+    def slot(self, host: str):
+        with self._lock:
+            if host not in self._hosts and len(self._hosts) >= self.MAX_HOSTS:
+                idle_since = time.monotonic() - 60
+                self._hosts = {
+                    name: state for name, state in self._hosts.items()
+                    if state['next_start'] > idle_since
+                }
+            state = self._hosts.setdefault(host, {
+                'semaphore': threading.BoundedSemaphore(self.concurrency),
+                'lock': threading.Lock(),
+                'next_start': 0.0,
+            })
+        with state['semaphore']:
+            with state['lock']:
+                delay = state['next_start'] - time.monotonic()
+                state['next_start'] = max(time.monotonic(), state['next_start']) + self.interval
+            if delay > 0:
+                time.sleep(delay)
+            yield
+
+
+class ContactCrawler:
+    """Finds a contact email on a business website."""
+
+    def __init__(
+        self,
+        session: Optional[requests.Session] = None,
+        executor: Optional[ThreadPoolExecutor] = None,
+        limiter: Optional[DomainLimiter] = None,
+        max_pages: Optional[int] = None,
+        site_budget: Optional[float] = None,
+        page_timeout: Optional[float] = None,
+        max_page_bytes: Optional[int] = None
+    ):
+        """
+        Args:
+            session: HTTP session; defaults to the process-wide pooled session
+            executor: Thread pool for contact page fetches; defaults to the
+                process-wide pool of settings.CRAWLER_MAX_CONNECTIONS threads
+            limiter: Per-domain limits; defaults to the process-wide limiter
+            max_pages: Pages fetched per site, homepage included
+                (settings.CRAWLER_MAX_PAGES)
+            site_budget: Seconds allowed per site (settings.CRAWLER_SITE_BUDGET)
+            page_timeout: Seconds allowed per page (settings.CRAWLER_PAGE_TIMEOUT)
+            max_page_bytes: Bytes read per page (settings.CRAWLER_MAX_PAGE_BYTES)
+        """
+        self.session = session or get_crawler_session()
+        self.executor = executor or get_crawler_executor()
+        self.limiter = limiter or get_domain_limiter()
+        self.max_pages = max_pages or settings.CRAWLER_MAX_PAGES
+        self.site_budget = site_budget or settings.CRAWLER_SITE_BUDGET
+        self.page_timeout = page_timeout or settings.CRAWLER_PAGE_TIMEOUT
+        self.max_page_bytes = max_page_bytes or settings.CRAWLER_MAX_PAGE_BYTES
+
+    def fetch(self, url: str, deadline: float, headers: Optional[Dict[str, str]] = None) -> FetchedPage:
+        """
+        Fetch a page and extract its contact details while it streams in.
+
+        At most max_page_bytes are read, and bodies that are not HTML are
+        not read at all. Reading stops at the deadline however slowly the
+        body arrives.
+
+        Args:
+            headers: Extra request headers, e.g. If-None-Match
+        """
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return FetchedPage()
+        started = time.perf_counter()
+        try:
+            with self.limiter.slot(urlsplit(url).hostname or ''):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return FetchedPage()
+                timeout = min(self.page_timeout, remaining)
+                with self.session.get(url, timeout=timeout, stream=True, headers=headers) as response:
+                    page = FetchedPage(
+                        response.status_code,
+                        etag=response.headers.get('ETag'),
+                        last_modified=response.headers.get('Last-Modified'),
+                        url=response.url
+                    )
+                    if response.status_code == 304:
+                        WEBSITE_SCRAPES.labels('not_modified').inc()
+                        return page
+                    if response.status_code != 200:
+                        WEBSITE_SCRAPES.labels('http_error').inc()
+                        return page
+                    content_type = response.headers.get('Content-Type')
+                    if not is_html(content_type):
+                        WEBSITE_SCRAPES.labels('not_html').inc()
+                        return page
+                    extractor, read, truncated = extract_chunks(
+                        _until(response.iter_content(chunk_size=16 * 1024), deadline),
+                        charset_of(content_type),
+                        self.max_page_bytes
+                    )
+            BYTES_DOWNLOADED.inc(read)
+            WEBSITE_SCRAPES.labels('truncated' if truncated else 'success').inc()
+            return page._replace(extractor=extractor)
+        except requests.Timeout:
+            WEBSITE_SCRAPES.labels('timeout').inc()
+            return FetchedPage()
+        except Exception as e:
+            WEBSITE_SCRAPES.labels('error').inc()
+            logger.debug('Fetching %s failed: %s', url, e)
+            return FetchedPage()
+        finally:
+            observe_stage('scrape_page', time.perf_counter() - started)
+
+    def crawl(
+        self,
+        website_url: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ) -> SiteContacts:
+        """
+        Crawl a site for an email (the homepage, then likely contact pages),
+        collecting phone numbers and social profile links from the pages
+        fetched.
+
+        Args:
+            website_url: Homepage URL
+            etag, last_modified: Validators from an earlier crawl of the
+                same homepage. The homepage is then requested conditionally,
+                and an unchanged homepage ends the crawl with status 304.
+        """
+        website_url = _homepage_url(website_url)
+        deadline = time.monotonic() + self.site_budget
+
+        status, homepage, etag, last_modified, homepage_url = self.fetch(
+            website_url, deadline, _conditional_headers(etag, last_modified)
+        )
+        if homepage is None:
+            return SiteContacts(status, None, None, {}, etag, last_modified)
+        pages = [homepage]
+
+        def contacts(email: Optional[str]) -> SiteContacts:
+            return _site_contacts(pages, email, status, etag, last_modified)
+
+        if homepage.emails or self.max_pages <= 1:
+            return contacts(homepage.emails[0] if homepage.emails else None)
+
+        # Links are relative to, and on the host of, the homepage a redirect led to
+        pending = {
+            self.executor.submit(self.fetch, url, deadline)
+            for url in _rank_contact_links(homepage.links, homepage_url or website_url, self.max_pages - 1)
+        }
+        try:
+            while pending:
+                done, pending = wait(
+                    pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for future in done:
+                    page = future.result().extractor
+                    if page is None:
+                        continue
+                    pages.append(page)
+                    if page.emails:
+                        return contacts(page.emails[0])
+            return contacts(None)
+        finally:
+            # Pages not started yet are skipped; running ones end within the budget
+            for future in pending:
+                future.cancel()
+
+    def find_email(self, website_url: str) -> Optional[str]:
+        """The first email found by crawl(), or None."""
+        return self.crawl(website_url).email
+
+
+class AsyncDomainLimiter:
+    """
+    DomainLimiter for coroutines: waiting for a slot suspends the coroutine
+    instead of blocking a thread. Belongs to one event loop.
+    """
+
+    MAX_HOSTS = DomainLimiter.MAX_HOSTS
+
+    def __init__(self, concurrency: int, interval: float):
+        self.concurrency = concurrency
+        self.interval = interval
+        self._hosts: Dict[str, Dict] = {}
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        if host not in self._hosts and len(self._hosts) >= self.MAX_HOSTS:
+            idle_since = time.monotonic() - 60
+            self._hosts = {
+                name: state for name, state in self._hosts.items()
+                if state['next_start'] > idle_since
+            }
+        state = self._hosts.setdefault(host, {
+            'semaphore': asyncio.Semaphore(self.concurrency),
+            'next_start': 0.0,
+        })
+        async with state['semaphore']:
+            delay = state['next_start'] - time.monotonic()
+            state['next_start'] = max(time.monotonic(), state['next_start']) + self.interval
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield
+
+
+class AsyncContactCrawler:
+    """
+    ContactCrawler for coroutines. Pages are fetched with the event loop's
+    shared async HTTP client, and a site's contact pages are fetched as
+    concurrent tasks instead of on a thread pool.
+    """
+
+    def __init__(
+        self,
+        client: Optional[httpx.AsyncClient] = None,
+        limiter: Optional[AsyncDomainLimiter] = None,
+        max_pages: Optional[int] = None,
+        site_budget: Optional[float] = None,
+        page_timeout: Optional[float] = None,
+        max_page_bytes: Optional[int] = None
+    ):
+        """
+        Args:
+            client: HTTP client; defaults to the running loop's shared client
+            limiter: Per-domain limits; defaults to the running loop's limiter
+            max_pages, site_budget, page_timeout, max_page_bytes: As for
+                ContactCrawler
+        """
+        self.client = client
+        self.limiter = limiter
+        self.max_pages = max_pages or settings.CRAWLER_MAX_PAGES
+        self.site_budget = site_budget or settings.CRAWLER_SITE_BUDGET
+        self.page_timeout = page_timeout or settings.CRAWLER_PAGE_TIMEOUT
+        self.max_page_bytes = max_page_bytes or settings.CRAWLER_MAX_PAGE_BYTES
+
+    async def fetch(self, url: str, deadline: float, headers: Optional[Dict[str, str]] = None) -> FetchedPage:
+        """
+        Fetch a page and extract its contact details while it streams in.
+
+        Args:
+            headers: Extra request headers, e.g. If-None-Match
+        """
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return FetchedPage()
+        started = time.perf_counter()
+        limiter = self.limiter or get_async_domain_limiter()
+        try:
+            async with limiter.slot(urlsplit(url).hostname or ''):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return FetchedPage()
+                # The client's timeout applies per read; wait_for keeps the
+                # whole page within the site budget
+                return await asyncio.wait_for(
+                    self._get(url, min(self.page_timeout, remaining), headers), remaining
+                )
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            WEBSITE_SCRAPES.labels('timeout').inc()
+            return FetchedPage()
+        except Exception as e:
+            WEBSITE_SCRAPES.labels('error').inc()
+            logger.debug('Fetching %s failed: %s', url, e)
+            return FetchedPage()
+        finally:
+            observe_stage('scrape_page', time.perf_counter() - started)
+
+    async def _get(self, url: str, timeout: float, headers: Optional[Dict[str, str]]) -> FetchedPage:
+        client = self.client or get_async_client()
+        headers = {'User-Agent': settings.CRAWLER_USER_AGENT, **(headers or {})}
+        async with request_slots(), client.stream('GET', url, headers=headers, timeout=timeout) as response:
+            page = FetchedPage(
+                response.status_code,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+                url=str(response.url)
+            )
+            if response.status_code == 304:
+                WEBSITE_SCRAPES.labels('not_modified').inc()
+                return page
+            if response.status_code != 200:
+                WEBSITE_SCRAPES.labels('http_error').inc()
+                return page
+            content_type = response.headers.get('Content-Type')
+            if not is_html(content_type):
+                WEBSITE_SCRAPES.labels('not_html').inc()
+                return page
+            extractor, read, truncated = await aextract_chunks(
+                response.aiter_bytes(16 * 1024),
+                charset_of(content_type),
+                self.max_page_bytes
+            )
+        BYTES_DOWNLOADED.inc(read)
+        WEBSITE_SCRAPES.labels('truncated' if truncated else 'success').inc()
+        return page._replace(extractor=extractor)
+
+    async def crawl(
+        self,
+        website_url: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ) -> SiteContacts:
+        """Crawl a site as ContactCrawler.crawl() does."""
+        website_url = _homepage_url(website_url)
+        deadline = time.monotonic() + self.site_budget
+
+        status, homepage, etag, last_modified, homepage_url = await self.fetch(
+            website_url, deadline, _conditional_headers(etag, last_modified)
+        )
+        if homepage is None:
+            return SiteContacts(status, None, None, {}, etag, last_modified)
+        pages = [homepage]
+
+        def contacts(email: Optional[str]) -> SiteContacts:
+            return _site_contacts(pages, email, status, etag, last_modified)
+
+        if homepage.emails or self.max_pages <= 1:
+            return contacts(homepage.emails[0] if homepage.emails else None)
+
+        pending = {
+            asyncio.ensure_future(self.fetch(url, deadline))
+            for url in _rank_contact_links(homepage.links, homepage_url or website_url, self.max_pages - 1)
+        }
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for task in done:
+                    page = task.result().extractor
+                    if page is None:
+                        continue
+                    pages.append(page)
+                    if page.emails:
+                        return contacts(page.emails[0])
+            return contacts(None)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def find_email(self, website_url: str) -> Optional[str]:
+        """The first email found by crawl(), or None."""
+        return (await self.crawl(website_url)).email
+
+
+_session = None
+_executor = None
+_limiter = None
+_shared_lock = threading.Lock()
+
+
+def get_crawler_session() -> requests.Session:
+    """Return the process-wide crawler session (one connection pool per host)."""
+    global _session
+    with _shared_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers['User-Agent'] = settings.CRAWLER_USER_AGENT
+            adapter = HTTPAdapter(
+                pool_connections=settings.CRAWLER_MAX_CONNECTIONS,
+                pool_maxsize=settings.CRAWLER_PER_DOMAIN_CONCURRENCY
+            )
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def get_crawler_executor() -> ThreadPoolExecutor:
+    """Return the process-wide thread pool for contact page fetches."""
+    global _executor
+    with _shared_lock:
+        if _executor is None:
+            _executor = ContextThreadPool(
+                max_workers=settings.CRAWLER_MAX_CONNECTIONS, thread_name_prefix='crawler'
+            )
+        return _executor
+
+
+def get_domain_limiter() -> DomainLimiter:
+    """Return the process-wide per-domain limiter."""
+    global _limiter
+    with _shared_lock:
+        if _limiter is None:
+            _limiter = DomainLimiter(
+                settings.CRAWLER_PER_DOMAIN_CONCURRENCY, settings.CRAWLER_PER_DOMAIN_INTERVAL
+            )
+        return _limiter
+
+
+def get_async_domain_limiter() -> AsyncDomainLimiter:
+    """Return the running event loop's per-domain limiter."""
+    return loop_local('domain_limiter', lambda: AsyncDomainLimiter(
+        settings.CRAWLER_PER_DOMAIN_CONCURRENCY, settings.CRAWLER_PER_DOMAIN_INTERVAL
+    ))
@@ -0,0 +1,291 @@
+import logging
+from collections import defaultdict
+from itertools import combinations, groupby
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from .matching import match_score
+from .metrics import DUPLICATES_MERGED, timed_stage
+from .models import Business, Search, SearchAccess, DERIVED_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Geohash prefix length of the spatial blocks (cells of about 150 x 150 m)
+GEO_BLOCK_PRECISION = 7
+
+# Larger blocks are skipped: a key shared by that many rows (a call center
+# number, a mall) does not single out a place, and comparing all pairs in
+# the block would be quadratic
+MAX_BLOCK_SIZE = 200
+
+# Columns read to score candidate pairs
+MATCH_FIELDS = [
+    'id', 'search_id', 'place_id', 'name', 'address', 'latitude', 'longitude', 'geohash',
+    'normalized_phone', 'website_domain',
+]
+
+# Fields a kept business takes from the duplicates merged into it when it
+# has no value of its own
+FILL_FIELDS = [
+    'email', 'website', 'phone', 'address', 'category', 'rating',
+    'latitude', 'longitude', 'instagram_link', 'youtube_link',
+    'twitter_link', 'facebook_link',
+]
+
+
+def _block_keys(business: Business) -> List[Tuple[str, str]]:
+    """Blocking keys of a business: only rows sharing a key are compared."""
+    keys = []
+    if business.normalized_phone:
+        keys.append(('phone', business.normalized_phone))
+    if business.website_domain:
+        keys.append(('domain', business.website_domain))
+    if business.geohash:
+        keys.append(('geo', business.geohash[:GEO_BLOCK_PRECISION]))
+    return keys
+
+
+def _all_blocks() -> Iterator[List[Business]]:
+    """
+    Every block of the table with more than one row.
+
+    Rows are streamed ordered by each key in turn, so a block is a run of
+    consecutive rows and only one block is held in memory at a time. Geohash
+    order keeps cells sharing a prefix contiguous as well.
+    """
+    for field, block_of in (
+        ('normalized_phone', lambda b: b.normalized_phone),
+        ('website_domain', lambda b: b.website_domain),
+        ('geohash', lambda b: b.geohash[:GEO_BLOCK_PRECISION]),
+    ):
+        rows = Business.objects.exclude(**{field: None}).only(*MATCH_FIELDS).order_by(field)
+        for _, members in groupby(rows.iterator(chunk_size=2000), key=block_of):
+            block = list(members)
+            if len(block) > 1:
+                yield block
+
+
+def _blocks_of(candidates: List[Business]) -> Iterator[List[Business]]:
+    """Blocks containing at least one of the candidates, with all their rows."""
+    keys = defaultdict(set)
+    for business in candidates:
+        for kind, key in _block_keys(business):
+            keys[kind].add(key)
+    if not keys:
+        return
+
+    cells = Q(pk__in=[])
+    for cell in keys['geo']:
+        cells |= Q(geohash__startswith=cell)
+    members = Business.objects.filter(
+        Q(normalized_phone__in=keys['phone']) |
+        Q(website_domain__in=keys['domain']) |
+        cells
+    ).only(*MATCH_FIELDS)
+
+    blocks = defaultdict(list)
+    for business in members.iterator(chunk_size=2000):
+        for block_key in _block_keys(business):
+            if block_key[1] in keys[block_key[0]]:
+                blocks[block_key].append(business)
+    for block in blocks.values():
+        if len(block) > 1:
+            yield block
+
+
+def _search_access(search_ids: Iterable[int]) -> Dict[int, FrozenSet[int]]:
+    """Users who may see each search (SearchAccess)."""
+    search_ids = set(search_ids)
+    grants = defaultdict(set)
+    for search_id, user_id in SearchAccess.objects.filter(
+        search_id__in=search_ids
+    ).values_list('search_id', 'user_id'):
+        grants[search_id].add(user_id)
+    return {search_id: frozenset(grants[search_id]) for search_id in search_ids}
+
+
+def find_duplicate_groups(
+    candidates: Optional[Iterable[Business]] = None,
+    threshold: Optional[float] = None
+) -> List[List[int]]:
+    """
+    Find groups of businesses that are the same place.
+
+    Pairs sharing a normalized phone, registered website domain or geohash
+    cell are scored with matching.match_score; pairs at or above the
+    threshold are joined into groups (transitively), best match first.
+
+    A place_id is Google's identity for a place, so a group holds at most
+    one business with a place_id: rows without one are folded into the
+    place they match best, and two places are never merged. A place whose
+    place_id changed therefore stays listed under both ids, since a
+    changed id cannot be told apart from a second branch.
+
+    Businesses are listed to the users of the search that saved them, so
+    only businesses whose searches are visible to the same users are
+    grouped; merging others would hide the kept row from some of them.
+
+    Args:
+        candidates: Only look for duplicates of these businesses (e.g. the
+            rows a search just inserted); None checks the whole table
+        threshold: Minimum match score, settings.DEDUP_MATCH_THRESHOLD by default
+
+    Returns:
+        Groups of business ids, each with at least two ids
+    """
+    if threshold is None:
+        threshold = settings.DEDUP_MATCH_THRESHOLD
+
+    focus_ids = None
+    if candidates is None:
+        blocks = _all_blocks()
+    else:
+        focus_ids = {business.pk for business in candidates}
+        blocks = _blocks_of(list(Business.objects.filter(pk__in=focus_ids).only(*MATCH_FIELDS)))
+
+    parent: Dict[int, int] = {}
+    # place_id of each group, by root
+    place_of: Dict[int, Optional[str]] = {}
+
+    def find(business_id: int) -> int:
+        parent.setdefault(business_id, business_id)
+        while parent[business_id] != business_id:
+            parent[business_id] = parent[parent[business_id]]
+            business_id = parent[business_id]
+        return business_id
+
+    scored: Set[Tuple[int, int]] = set()
+    matches: List[Tuple[float, Business, Business]] = []
+    for block in blocks:
+        if len(block) > MAX_BLOCK_SIZE:
+            continue
+        for a, b in combinations(block, 2):
+            pair = (min(a.pk, b.pk), max(a.pk, b.pk))
+            if pair in scored or a.pk == b.pk:
+                continue
+            if focus_ids is not None and a.pk not in focus_ids and b.pk not in focus_ids:
+                continue
+            scored.add(pair)
+            if a.place_id and b.place_id:
+                continue
+            score = match_score(a, b)
+            if score >= threshold:
+                matches.append((score, a, b))
+
+    # Every member of a group has the same access, so comparing the pair is enough
+    access = _search_access(business.search_id for _, a, b in matches for business in (a, b))
+    matches.sort(key=lambda match: (-match[0], match[1].pk, match[2].pk))
+    for _, a, b in matches:
+        root_a, root_b = find(a.pk), find(b.pk)
+        if root_a == root_b or access[a.search_id] != access[b.search_id]:
+            continue
+        place_a = place_of.setdefault(root_a, a.place_id)
+        place_b = place_of.setdefault(root_b, b.place_id)
+        if place_a and place_b:
+            # Joining them would merge two places
+            continue
+        parent[root_a] = root_b
+        place_of[root_b] = place_a or place_b
+
+    groups = defaultdict(list)
+    for business_id in parent:
+        groups[find(business_id)].append(business_id)
+    return [sorted(group) for group in groups.values() if len(group) > 1]
+
+
+def merge_duplicate_groups(groups: List[List[int]]) -> int:
+    """
+    Merge each group of duplicates into one business.
+
+    The kept business is the group's one business with a place_id, or the
+    one refreshed last if none has a place_id; groups with several
+    place_ids or whose searches are visible to different users are skipped
+    (see find_duplicate_groups). The kept business fills its empty fields
+    from the others and takes over their search_history and Search.results
+    links; the others are deleted, and
+    results_count of the affected searches is recounted. All writes are
+    bulk statements, independent of the number of groups.
+
+    Returns:
+        Number of businesses removed
+    """
+    SearchHistory = Business.search_history.through
+    SearchResults = Search.results.through
+
+    with transaction.atomic():
+        rows = Business.objects.in_bulk([pk for group in groups for pk in group])
+        access = _search_access(business.search_id for business in rows.values())
+        kept = []
+        keep_of = {}
+        for group in groups:
+            members = [rows[pk] for pk in group if pk in rows]
+            if len(members) < 2:
+                continue
+            if sum(bool(business.place_id) for business in members) > 1:
+                logger.warning('Not merging businesses %s: more than one has a place_id', group)
+                continue
+            if len({access[business.search_id] for business in members}) > 1:
+                logger.warning('Not merging businesses %s: their searches are visible to different users', group)
+                continue
+            keep = max(members, key=lambda b: (b.place_id is not None, b.updated_at, -b.pk))
+            for business in members:
+                if business is keep:
+                    continue
+                keep_of[business.pk] = keep.pk
+                for field in FILL_FIELDS:
+                    if getattr(keep, field) in (None, '') and getattr(business, field) not in (None, ''):
+                        setattr(keep, field, getattr(business, field))
+            kept.append(keep)
+        if not keep_of:
+            return 0
+
+        history = SearchHistory.objects.filter(
+            business_id__in=list(keep_of)
+        ).values_list('business_id', 'search_id')
+        SearchHistory.objects.bulk_create(
+            [SearchHistory(business_id=keep_of[b], search_id=s) for b, s in history],
+            ignore_conflicts=True
+        )
+        results = list(SearchResults.objects.filter(
+            business_id__in=list(keep_of)
+        ).values_list('business_id', 'search_id'))
+        SearchResults.objects.bulk_create(
+            [SearchResults(business_id=keep_of[b], search_id=s) for b, s in results],
+            ignore_conflicts=True
+        )
+
+        Business.objects.filter(pk__in=list(keep_of)).delete()
+        for business in kept:
+            business.set_derived_fields()
+        Business.objects.bulk_update(kept, FILL_FIELDS + DERIVED_FIELDS)
+
+        result_counts = SearchResults.objects.filter(
+            search_id=OuterRef('pk')
+        ).order_by().values('search_id').annotate(count=Count('pk')).values('count')
+        Search.objects.filter(
+            pk__in={search_id for _, search_id in results}
+        ).update(results_count=Subquery(result_counts))
+
+    DUPLICATES_MERGED.inc(len(keep_of))
+    logger.info('Merged %d duplicate businesses into %d', len(keep_of), len(kept))
+    return len(keep_of)
+
+
+def deduplicate_businesses(
+    candidates: Optional[Iterable[Business]] = None,
+    threshold: Optional[float] = None
+) -> int:
+    """
+    Find and merge duplicate businesses.
+
+    Args:
+        candidates: Only merge duplicates of these businesses; None runs a
+            full pass over the table
+        threshold: Minimum match score, settings.DEDUP_MATCH_THRESHOLD by default
+
+    Returns:
+        Number of businesses removed
+    """
+    with timed_stage('dedup'):
+        return merge_duplicate_groups(find_duplicate_groups(candidates, threshold))
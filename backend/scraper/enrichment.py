@@ -0,0 +1,221 @@
+"""
+Domain-level cache of the contacts found by crawling business websites.
+
+Chains and franchises list the same website for many places. The crawl of
+a registered domain is stored in DomainEnrichment and reused by every
+business on that domain until it expires, by every process: a short lock
+in a shared cache (the Redis rate_limit cache) makes sure only one worker
+crawls a domain at a time while the others wait for its result. Without
+Redis the lock is per process.
+"""
+import asyncio
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from .crawler import AsyncContactCrawler, ContactCrawler, SiteContacts
+from .matching import registered_domain
+from .metrics import DOMAIN_ENRICHMENT_LOOKUPS
+from .models import DomainEnrichment
+
+# Business fields filled from a site crawl
+ENRICHMENT_FIELDS = ['email', 'phone', 'instagram_link', 'youtube_link', 'twitter_link', 'facebook_link']
+
+# Seconds between checks of a domain another worker is crawling
+LOCK_POLL_INTERVAL = 0.1
+
+
+def contact_fields(contacts: SiteContacts) -> Dict[str, Optional[str]]:
+    """ENRICHMENT_FIELDS of a crawl."""
+    return {
+        'email': contacts.email,
+        'phone': contacts.phone,
+        **{field: contacts.social_links.get(field) for field in ENRICHMENT_FIELDS[2:]},
+    }
+
+
+class DomainEnrichmentCache:
+    """Site crawls keyed by registered domain, with separate TTLs for dead sites."""
+
+    def __init__(
+        self,
+        crawler: Optional[ContactCrawler] = None,
+        ttl: Optional[int] = None,
+        negative_ttl: Optional[int] = None,
+        lock_alias: str = 'rate_limit'
+    ):
+        """
+        Args:
+            crawler: Crawler used on a miss; defaults to a ContactCrawler on
+                the process-wide session and thread pool
+            ttl: Seconds a crawl is reused (settings.DOMAIN_ENRICHMENT_TTL)
+            negative_ttl: Seconds a site that could not be reached or
+                returned an error is left alone
+                (settings.DOMAIN_ENRICHMENT_NEGATIVE_TTL)
+            lock_alias: Cache holding the crawl locks. The default
+                rate_limit alias is Redis whenever RATE_LIMIT_URL or
+                REDIS_URL is set, which shares the locks across workers; a
+                LocMemCache only keeps one process from crawling a domain
+                twice at a time
+        """
+        self.crawler = crawler or ContactCrawler()
+        self.ttl = ttl if ttl is not None else settings.DOMAIN_ENRICHMENT_TTL
+        self.negative_ttl = negative_ttl if negative_ttl is not None else settings.DOMAIN_ENRICHMENT_NEGATIVE_TTL
+        self.lock_alias = lock_alias
+
+    @property
+    def lock_timeout(self) -> int:
+        """Seconds a crawl lock is held at most, should its holder die."""
+        return math.ceil(self.crawler.site_budget + self.crawler.page_timeout)
+
+    def lookup(self, website_url: str) -> Dict[str, Optional[str]]:
+        """
+        Contacts of a website, crawled at most once per TTL for its domain.
+
+        An expired entry for the same homepage is revalidated with a
+        conditional request; an unchanged homepage keeps the stored
+        contacts. Websites without a registered domain of their own (IP
+        addresses, bare social media profiles) are crawled every time.
+
+        Returns:
+            A value (possibly None) for each of ENRICHMENT_FIELDS
+        """
+        domain = registered_domain(website_url)
+        if domain is None:
+            DOMAIN_ENRICHMENT_LOOKUPS.labels('uncached').inc()
+            return contact_fields(self.crawler.crawl(website_url))
+
+        entry = self._entry(domain)
+        if self._fresh(entry):
+            DOMAIN_ENRICHMENT_LOOKUPS.labels('hit' if entry.reachable else 'negative_hit').inc()
+            return self._fields(entry)
+
+        locks = caches[self.lock_alias]
+        lock_key = f'domain-lock:{domain}'
+        if locks.add(lock_key, 1, timeout=self.lock_timeout):
+            try:
+                contacts = self.crawler.crawl(website_url, **self._validators(entry, website_url))
+                if contacts.status == 304 and entry is not None:
+                    DOMAIN_ENRICHMENT_LOOKUPS.labels('not_modified').inc()
+                    return self._fields(self._renew(entry))
+                DOMAIN_ENRICHMENT_LOOKUPS.labels('miss').inc()
+                return self._fields(self._store(domain, website_url, contacts))
+            finally:
+                locks.delete(lock_key)
+
+        # Another worker is crawling the domain: use its result
+        DOMAIN_ENRICHMENT_LOOKUPS.labels('waited').inc()
+        deadline = time.monotonic() + self.lock_timeout
+        while locks.get(lock_key) is not None and time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+        entry = self._entry(domain)
+        return self._fields(entry if self._fresh(entry) else None)
+
+    async def alookup(self, website_url: str, crawler: AsyncContactCrawler) -> Dict[str, Optional[str]]:
+        """
+        lookup() for coroutines, crawling with an AsyncContactCrawler.
+        Database and lock calls run through the async ORM and cache APIs.
+        """
+        domain = registered_domain(website_url)
+        if domain is None:
+            DOMAIN_ENRICHMENT_LOOKUPS.labels('uncached').inc()
+            return contact_fields(await crawler.crawl(website_url))
+
+        entry = await DomainEnrichment.objects.filter(domain=domain).afirst()
+        if self._fresh(entry):
+            DOMAIN_ENRICHMENT_LOOKUPS.labels('hit' if entry.reachable else 'negative_hit').inc()
+            return self._fields(entry)
+
+        locks = caches[self.lock_alias]
+        lock_key = f'domain-lock:{domain}'
+        if await locks.aadd(lock_key, 1, timeout=self.lock_timeout):
+            try:
+                contacts = await crawler.crawl(website_url, **self._validators(entry, website_url))
+                if contacts.status == 304 and entry is not None:
+                    DOMAIN_ENRICHMENT_LOOKUPS.labels('not_modified').inc()
+                    for field, value in self._renewal().items():
+                        setattr(entry, field, value)
+                    await entry.asave(update_fields=['fetched_at', 'expires_at'])
+                    return self._fields(entry)
+                DOMAIN_ENRICHMENT_LOOKUPS.labels('miss').inc()
+                entry, _ = await DomainEnrichment.objects.aupdate_or_create(
+                    domain=domain, defaults=self._values(website_url, contacts)
+                )
+                return self._fields(entry)
+            finally:
+                await locks.adelete(lock_key)
+
+        DOMAIN_ENRICHMENT_LOOKUPS.labels('waited').inc()
+        deadline = time.monotonic() + self.lock_timeout
+        while await locks.aget(lock_key) is not None and time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+        entry = await DomainEnrichment.objects.filter(domain=domain).afirst()
+        return self._fields(entry if self._fresh(entry) else None)
+
+    @staticmethod
+    def _fresh(entry: Optional[DomainEnrichment]) -> bool:
+        return entry is not None and entry.expires_at > timezone.now()
+
+    @staticmethod
+    def _validators(entry: Optional[DomainEnrichment], website_url: str) -> Dict[str, Optional[str]]:
+        """Conditional crawl arguments: only an entry for the same reachable homepage is revalidated."""
+        if entry is not None and entry.reachable and entry.url == website_url:
+            return {'etag': entry.etag, 'last_modified': entry.last_modified}
+        return {}
+
+    def _entry(self, domain: str) -> Optional[DomainEnrichment]:
+        return DomainEnrichment.objects.filter(domain=domain).first()
+
+    def _renewal(self) -> Dict[str, datetime]:
+        now = timezone.now()
+        return {'fetched_at': now, 'expires_at': now + timedelta(seconds=self.ttl)}
+
+    def _renew(self, entry: DomainEnrichment) -> DomainEnrichment:
+        """Keep an entry whose homepage has not changed for another TTL."""
+        for field, value in self._renewal().items():
+            setattr(entry, field, value)
+        entry.save(update_fields=['fetched_at', 'expires_at'])
+        return entry
+
+    def _values(self, website_url: str, contacts: SiteContacts) -> Dict:
+        """Columns of the entry stored for a crawl."""
+        now = timezone.now()
+        reachable = contacts.status is not None and contacts.status < 400
+        ttl = self.ttl if reachable else self.negative_ttl
+        return {
+            **contact_fields(contacts),
+            'url': website_url,
+            'status_code': contacts.status,
+            'etag': contacts.etag,
+            'last_modified': contacts.last_modified,
+            'fetched_at': now,
+            'expires_at': now + timedelta(seconds=ttl),
+        }
+
+    def _store(self, domain: str, website_url: str, contacts: SiteContacts) -> DomainEnrichment:
+        entry, _ = DomainEnrichment.objects.update_or_create(
+            domain=domain, defaults=self._values(website_url, contacts)
+        )
+        return entry
+
+    @staticmethod
+    def _fields(entry: Optional[DomainEnrichment]) -> Dict[str, Optional[str]]:
+        """ENRICHMENT_FIELDS of an entry, all None without one."""
+        return {field: getattr(entry, field, None) for field in ENRICHMENT_FIELDS}
+
+
+_enrichment_cache = None
+_enrichment_cache_lock = threading.Lock()
+
+
+def get_enrichment_cache() -> DomainEnrichmentCache:
+    """Return the process-wide domain enrichment cache."""
+    global _enrichment_cache
+    with _enrichment_cache_lock:
+        if _enrichment_cache is None:
+            _enrichment_cache = DomainEnrichmentCache()
+        return _enrichment_cache
@@ -0,0 +1,130 @@
+"""
+Live progress of search jobs as Server-Sent Events.
+
+Jobs run in Celery workers, which keep their progress counts on the
+SearchJob row and commit results in batches while they fetch them (see
+tasks.run_search_job). A stream polls both from an async view, so an open
+stream holds no thread between polls when the project is served by an ASGI
+server (uvicorn backend.asgi:application). Under WSGI the whole stream is
+buffered until the job ends.
+
+Events:
+    progress: the job's status and counts, whenever they change
+    results: businesses newly linked to the search; the event id is a
+        cursor, so a reconnecting EventSource (Last-Event-ID) resumes
+        after the rows it has seen
+    done: the final progress once the job is done or failed; the stream
+        ends here and the client should close it, then read the search for
+        its complete, ordered results
+"""
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import Business, Search, SearchJob
+from .serializers import BusinessReadSerializer
+
+# SearchJob columns sent in progress events
+PROGRESS_FIELDS = [
+    'status', 'places_found', 'details_fetched', 'emails_found', 'pages_fetched',
+    'tiles_searched', 'results_saved', 'error',
+]
+
+# Businesses sent per results event
+RESULTS_PER_EVENT = 100
+
+# Seconds of silence before a keep-alive comment, so proxies keep the stream open
+KEEPALIVE_INTERVAL = 15
+
+# Milliseconds a disconnected EventSource waits before reconnecting
+RETRY_MS = 2000
+
+FINISHED = (SearchJob.Status.DONE, SearchJob.Status.FAILED)
+
+
+def format_event(event: str, data: Any, event_id: Optional[int] = None) -> bytes:
+    """One Server-Sent Event with a JSON payload."""
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append('data: ' + json.dumps(data, cls=DjangoJSONEncoder))
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+def _new_results(search_id: int, after: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Businesses linked to a search after the link with id `after`.
+
+    Returns:
+        Tuple of (serialized businesses, id of the last link read)
+    """
+    links = list(
+        Search.results.through.objects.filter(
+            search_id=search_id, id__gt=after
+        ).order_by('id').values_list('id', 'business_id')[:RESULTS_PER_EVENT]
+    )
+    if not links:
+        return [], after
+    businesses = Business.objects.prefetch_related('search_history').in_bulk(
+        [business_id for _, business_id in links]
+    )
+    data = BusinessReadSerializer(
+        [businesses[business_id] for _, business_id in links if business_id in businesses],
+        many=True
+    ).data
+    return data, links[-1][0]
+
+
+async def job_events(
+    job_id: int,
+    search_id: int,
+    after: int = 0,
+    poll_interval: Optional[float] = None,
+    timeout: Optional[float] = None
+) -> AsyncIterator[bytes]:
+    """
+    Stream a job's progress and results until it finishes.
+
+    Args:
+        after: Search result link id already seen (Last-Event-ID)
+        poll_interval: Seconds between polls (settings.SEARCH_EVENTS_POLL_INTERVAL)
+        timeout: Seconds after which the stream ends even if the job has not
+            finished (settings.SEARCH_EVENTS_TIMEOUT); EventSource reconnects
+    """
+    poll_interval = poll_interval if poll_interval is not None else settings.SEARCH_EVENTS_POLL_INTERVAL
+    timeout = timeout if timeout is not None else settings.SEARCH_EVENTS_TIMEOUT
+    deadline = time.monotonic() + timeout
+    last_sent = time.monotonic()
+    progress = None
+    yield f'retry: {RETRY_MS}\n\n'.encode()
+
+    while True:
+        # Read progress first: results committed before a job is marked
+        # finished are then always sent before its done event
+        current = await SearchJob.objects.filter(pk=job_id).values(*PROGRESS_FIELDS).afirst()
+        if current is None:
+            return
+        businesses, cursor = await sync_to_async(_new_results)(search_id, after)
+        if businesses:
+            yield format_event('results', {'businesses': businesses}, cursor)
+            after = cursor
+            last_sent = time.monotonic()
+        if current != progress:
+            progress = current
+            yield format_event('progress', progress)
+            last_sent = time.monotonic()
+        if len(businesses) == RESULTS_PER_EVENT:
+            # More rows are waiting; read them before sleeping
+            continue
+        if progress['status'] in FINISHED:
+            yield format_event('done', progress)
+            return
+        if time.monotonic() >= deadline:
+            return
+        if time.monotonic() - last_sent >= KEEPALIVE_INTERVAL:
+            yield b': keep-alive\n\n'
+            last_sent = time.monotonic()
+        await asyncio.sleep(poll_interval)
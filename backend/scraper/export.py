@@ -0,0 +1,216 @@
+import csv
+import re
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+from typing import AsyncIterator, Generator, Iterable, Iterator, List, Sequence, TypeVar
+from xml.sax.saxutils import escape
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+
+# Columns written by every export format, in order
+EXPORT_FIELDS = [
+    'uuid', 'name', 'email', 'website', 'phone', 'address', 'category',
+    'rating', 'reviews_count', 'latitude', 'longitude', 'place_id',
+    'instagram_link', 'youtube_link', 'twitter_link', 'facebook_link',
+    'created_at', 'updated_at',
+]
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Rows rendered between yields; keeps chunks around tens of KB
+ROWS_PER_CHUNK = 500
+
+T = TypeVar('T')
+
+
+def iter_rows(queryset: QuerySet, chunk_size: int) -> Iterator[tuple]:
+    """Yield EXPORT_FIELDS tuples through a server-side cursor."""
+    return queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def _batched(rows: Iterable[tuple]) -> Iterator[List[tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= ROWS_PER_CHUNK:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class _Echo:
+    """File-like object whose write() returns the written value."""
+
+    def write(self, value):
+        return value
+
+
+# Leading characters that make a spreadsheet read a CSV cell as a formula
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+# Signed numbers and international phone numbers: they start with + or -
+# but hold no formula, so they are written as they are
+_SIGNED_NUMBER_RE = re.compile(r'[+-][\d\s().-]*\d[\d\s().-]*')
+
+
+def _csv_value(value):
+    """Quote text a spreadsheet would run as a formula (scraped fields are untrusted)."""
+    if (
+        isinstance(value, str) and value.startswith(_FORMULA_PREFIXES)
+        and not _SIGNED_NUMBER_RE.fullmatch(value)
+    ):
+        return "'" + value
+    return value
+
+
+def stream_csv(rows: Iterable[tuple]) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for batch in _batched(rows):
+        yield ''.join(writer.writerow([_csv_value(value) for value in row]) for row in batch)
+
+
+def stream_ndjson(rows: Iterable[tuple]) -> Iterator[str]:
+    encoder = DjangoJSONEncoder()
+    for batch in _batched(rows):
+        yield ''.join(
+            encoder.encode(dict(zip(EXPORT_FIELDS, row))) + '\n' for row in batch
+        )
+
+
+class _StreamBuffer:
+    """Unseekable sink for zipfile; written bytes are collected until drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+# Characters that are not allowed in XML 1.0 documents
+_INVALID_XML_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f￾￿]')
+# Excel's maximum number of characters in a cell
+_MAX_CELL_LENGTH = 32767
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Businesses" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_cell(value) -> str:
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c t="n"><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    text = _INVALID_XML_RE.sub('', str(value))[:_MAX_CELL_LENGTH]
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def _xlsx_row(values: Sequence) -> str:
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def stream_xlsx(rows: Iterable[tuple]) -> Iterator[bytes]:
+    """
+    Stream a single-sheet workbook.
+
+    The zip is written to an unseekable buffer (sizes go in data
+    descriptors) and cells use inline strings, so there is no shared
+    strings table and memory does not grow with the number of rows.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS.items():
+            archive.writestr(name, content)
+        yield buffer.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetData>' + _xlsx_row(EXPORT_FIELDS)
+            ).encode('utf-8'))
+            for batch in _batched(rows):
+                sheet.write(''.join(_xlsx_row(row) for row in batch).encode('utf-8'))
+                chunk = buffer.drain()
+                if chunk:
+                    yield chunk
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.drain()
+
+
+async def astream(chunks: Generator[T, None, None]) -> AsyncIterator[T]:
+    """
+    Serve a streamer to an ASGI server, which reads a sync iterator into
+    memory before sending it. Each chunk is rendered by sync_to_async on the
+    request's database thread, so the server-side cursor is read there too.
+    """
+    next_chunk = sync_to_async(next)
+    done = object()
+    try:
+        while True:
+            chunk = await next_chunk(chunks, done)
+            if chunk is done:
+                return
+            yield chunk
+    finally:
+        # Closes the cursor of a download cut short
+        await sync_to_async(chunks.close)()
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+    'xlsx': stream_xlsx,
+}
@@ -0,0 +1,292 @@
+"""
+Single-pass extraction of contact details from business web pages.
+
+A page is scanned as it streams in: emails (plain, mailto: and simple
+[at]/[dot] obfuscations), phone numbers (tel: links, then numbers in the
+text), social media profile links and the page's links for the crawler, in
+one pass and without holding the whole page. Reading stops at a byte cap,
+and responses that are not HTML are never scanned.
+"""
+import codecs
+import html
+import re
+from typing import AsyncIterable, Dict, Iterable, List, Optional, Pattern, Tuple
+from urllib.parse import unquote, urlsplit
+
+EMAIL_PATTERN = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+
+# name [at] example [dot] com, name(at)example.com, ...
+OBFUSCATED_EMAIL_PATTERN = re.compile(
+    r'([a-zA-Z0-9._%+-]+)\s*[\[({]\s*at\s*[\])}]\s*'
+    r'([a-zA-Z0-9-]+(?:(?:\s*[\[({]\s*dot\s*[\])}]\s*|\.)[a-zA-Z0-9-]+)+)',
+    re.IGNORECASE
+)
+_OBFUSCATED_DOT = re.compile(r'\s*[\[({]\s*dot\s*[\])}]\s*', re.IGNORECASE)
+_OBFUSCATION_MARKERS = ('[at]', '(at)', '{at}')
+
+# Grouped numbers such as +1 (512) 555-0100, 020 7946 0958 or 512.555.0100
+PHONE_PATTERN = re.compile(
+    r'(?<![\w+])(?:\+\d{1,3}[\s.-]?)?(?:\(\d{1,4}\)[\s.-]?)?\d{2,4}(?:[\s.-]\d{2,4}){1,3}(?!\w)'
+)
+# Digits in a phone number found in text; fewer are usually dates or prices
+PHONE_DIGITS = (9, 15)
+# Longest tel: link kept (Business.phone length)
+MAX_PHONE_LENGTH = 50
+
+# Placeholder addresses found in templates
+EMAIL_FALSE_POSITIVES = ['example.com', 'domain.com']
+
+# Business social link fields and the hosts of their profiles
+SOCIAL_HOSTS = {
+    'instagram_link': ('instagram.com',),
+    'youtube_link': ('youtube.com', 'youtu.be'),
+    'twitter_link': ('twitter.com', 'x.com'),
+    'facebook_link': ('facebook.com',),
+}
+
+# Content types parsed; missing ones are assumed to be HTML
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+# Blocks whose text is not shown to visitors, and comments
+_HIDDEN_BLOCK = re.compile(
+    r'<(script|style|noscript|template)\b.*?</\1\s*>|<!--.*?-->', re.IGNORECASE | re.DOTALL
+)
+_ANCHOR = re.compile(r'<a\b([^>]*)>(.*?)</a\s*>', re.IGNORECASE | re.DOTALL)
+_HREF = re.compile(r'\bhref\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.IGNORECASE)
+_TAG = re.compile(r'<[^>]*>')
+# Elements that must be complete before a piece of the page is scanned
+_BLOCK_START = re.compile(r'<(a|script|style|noscript|template)\b|<!--', re.IGNORECASE)
+_BLOCK_END = {
+    tag: re.compile(rf'</{tag}\s*>', re.IGNORECASE) for tag in ('a', 'script', 'style', 'noscript', 'template')
+}
+_COMMENT_END = re.compile('-->')
+# Pending text scanned anyway when an element never closes
+_MAX_PENDING = 256 * 1024
+
+
+def find_emails(text: str) -> List[str]:
+    """Email addresses in a text, in order, without placeholders."""
+    return [email for email in EMAIL_PATTERN.findall(text) if _is_real_email(email)]
+
+
+def _is_real_email(email: str) -> bool:
+    email = email.lower()
+    return not any(false_positive in email for false_positive in EMAIL_FALSE_POSITIVES)
+
+
+def social_link_field(url: str) -> Optional[str]:
+    """The Business social link field a profile URL belongs in, if any."""
+    try:
+        host = (urlsplit(url).hostname or '').lower()
+    except ValueError:
+        return None
+    for field, hosts in SOCIAL_HOSTS.items():
+        if any(host == social or host.endswith('.' + social) for social in hosts):
+            return field
+    return None
+
+
+def is_html(content_type: Optional[str]) -> bool:
+    """Whether a Content-Type header announces an HTML page."""
+    if not content_type:
+        return True
+    return content_type.split(';')[0].strip().lower() in HTML_CONTENT_TYPES
+
+
+def charset_of(content_type: Optional[str], default: str = 'utf-8') -> str:
+    """The charset of a Content-Type header, if Python knows it."""
+    match = re.search(r'charset=["\']?([\w.:-]+)', content_type or '', re.IGNORECASE)
+    if match:
+        try:
+            return codecs.lookup(match.group(1)).name
+        except LookupError:
+            pass
+    return default
+
+
+class PageExtractor:
+    """
+    Incremental scanner collecting a page's contact details.
+
+    Feed it text with feed() as it arrives and call close() at the end.
+    Each piece of the page is scanned once, with compiled patterns, as soon
+    as the anchors, scripts and comments in it are complete; only an
+    unfinished tail is held back.
+    """
+
+    def __init__(self):
+        # (href, link text) of every anchor
+        self.links: List[Tuple[str, str]] = []
+        # Business social link field -> first profile linked
+        self.social_links: Dict[str, str] = {}
+        self._mailto: List[str] = []
+        self._text_emails: List[str] = []
+        self._obfuscated: List[str] = []
+        self._tel: List[str] = []
+        self._text_phones: List[str] = []
+        self._pending = ''
+        # _pending is searched for elements up to _scanned; an element
+        # starting at _open_at is open until _closing matches
+        self._scanned = 0
+        self._open_at = 0
+        self._closing: Optional[Pattern[str]] = None
+
+    @property
+    def emails(self) -> List[str]:
+        """Emails found, mailto: links first, without duplicates."""
+        return list(dict.fromkeys(self._mailto + self._text_emails + self._obfuscated))
+
+    @property
+    def phones(self) -> List[str]:
+        """Phone numbers found, tel: links first, without duplicates."""
+        return list(dict.fromkeys(self._tel + self._text_phones))
+
+    def feed(self, text: str) -> None:
+        # Only the new text can complete an element: none of the patterns
+        # searched contains a '>' before its end, so no match spans a cut
+        start = len(self._pending)
+        self._pending += text
+        cut = self._pending.rfind('>', start) + 1
+        position = self._scanned
+        while position < cut:
+            if self._closing is None:
+                match = _BLOCK_START.search(self._pending, position, cut)
+                if match is None:
+                    break
+                self._open_at = match.start()
+                self._closing = _BLOCK_END[match.group(1).lower()] if match.group(1) else _COMMENT_END
+            else:
+                match = self._closing.search(self._pending, position, cut)
+                if match is None:
+                    break
+                self._closing = None
+            position = match.end()
+        self._scanned = max(self._scanned, cut)
+
+        # Hold back an element still open at the cut
+        ready = self._scanned if self._closing is None else self._open_at
+        if ready == 0 and len(self._pending) > _MAX_PENDING:
+            ready = len(self._pending)
+            self._closing = None
+        if ready:
+            self._scan(self._pending[:ready])
+            self._pending = self._pending[ready:]
+            self._scanned = max(0, self._scanned - ready)
+            self._open_at -= ready
+
+    def close(self) -> None:
+        self._scan(self._pending)
+        self._pending = ''
+        self._scanned = 0
+        self._closing = None
+
+    def _scan(self, markup: str) -> None:
+        markup = _HIDDEN_BLOCK.sub(' ', markup)
+        for attributes, content in _ANCHOR.findall(markup):
+            href = _HREF.search(attributes)
+            if href:
+                self._link(html.unescape(next(filter(None, href.groups()), '')).strip(), content)
+        self._text(html.unescape(_TAG.sub(' ', markup)))
+
+    def _link(self, href: str, content: str) -> None:
+        lowered = href.lower()
+        if lowered.startswith('mailto:'):
+            for address in unquote(href[7:]).split('?')[0].split(','):
+                address = address.strip()
+                if EMAIL_PATTERN.fullmatch(address) and _is_real_email(address):
+                    self._mailto.append(address)
+        elif lowered.startswith('tel:'):
+            number = unquote(href[4:]).strip()
+            if 0 < len(number) <= MAX_PHONE_LENGTH:
+                self._tel.append(number)
+        elif href:
+            field = social_link_field(href)
+            if field and field not in self.social_links:
+                self.social_links[field] = href
+        if href:
+            text = ' '.join(html.unescape(_TAG.sub(' ', content)).split())
+            self.links.append((href, text))
+
+    def _text(self, text: str) -> None:
+        if '@' in text:
+            self._text_emails.extend(find_emails(text))
+        lowered = text.lower()
+        if any(marker in lowered for marker in _OBFUSCATION_MARKERS):
+            for name, domain in OBFUSCATED_EMAIL_PATTERN.findall(text):
+                email = f"{name}@{_OBFUSCATED_DOT.sub('.', domain)}"
+                if EMAIL_PATTERN.fullmatch(email) and _is_real_email(email):
+                    self._obfuscated.append(email)
+        for number in PHONE_PATTERN.findall(text):
+            digits = sum(char.isdigit() for char in number)
+            if PHONE_DIGITS[0] <= digits <= PHONE_DIGITS[1]:
+                self._text_phones.append(number.strip())
+
+
+class ChunkReader:
+    """Feeds a page arriving as byte chunks to a PageExtractor, up to a byte cap."""
+
+    def __init__(self, encoding: str = 'utf-8', max_bytes: Optional[int] = None):
+        self.extractor = PageExtractor()
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self.max_bytes = max_bytes
+        self.read = 0
+        self.truncated = False
+
+    def feed(self, chunk: bytes) -> bool:
+        """Scan a chunk. Returns False once the cap is reached and reading should stop."""
+        if self.max_bytes is not None and self.read + len(chunk) > self.max_bytes:
+            chunk = chunk[:self.max_bytes - self.read]
+            self.truncated = True
+        self.read += len(chunk)
+        self.extractor.feed(self.decoder.decode(chunk))
+        return not self.truncated
+
+    def close(self) -> Tuple[PageExtractor, int, bool]:
+        """Returns (extractor, bytes read, whether the page was cut at max_bytes)."""
+        self.extractor.feed(self.decoder.decode(b'', final=True))
+        self.extractor.close()
+        return self.extractor, self.read, self.truncated
+
+
+def extract_chunks(
+    chunks: Iterable[bytes],
+    encoding: str = 'utf-8',
+    max_bytes: Optional[int] = None
+) -> Tuple[PageExtractor, int, bool]:
+    """
+    Run a PageExtractor over a page arriving as byte chunks.
+
+    Args:
+        chunks: The page body, e.g. response.iter_content()
+        encoding: Charset of the body; undecodable bytes are replaced
+        max_bytes: Stop reading after this many bytes (None reads it all)
+
+    Returns:
+        (extractor, bytes read, whether the page was cut at max_bytes)
+    """
+    reader = ChunkReader(encoding, max_bytes)
+    for chunk in chunks:
+        if not reader.feed(chunk):
+            break
+    return reader.close()
+
+
+async def aextract_chunks(
+    chunks: AsyncIterable[bytes],
+    encoding: str = 'utf-8',
+    max_bytes: Optional[int] = None
+) -> Tuple[PageExtractor, int, bool]:
+    """extract_chunks() over an async body, e.g. httpx's response.aiter_bytes()."""
+    reader = ChunkReader(encoding, max_bytes)
+    async for chunk in chunks:
+        if not reader.feed(chunk):
+            break
+    return reader.close()
+
+
+def extract_page(page: str) -> PageExtractor:
+    """Run a PageExtractor over a whole page."""
+    extractor = PageExtractor()
+    extractor.feed(page)
+    extractor.close()
+    return extractor
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from rest_framework.filters import SearchFilter
+
+
+class BusinessSearchFilter(SearchFilter):
+    """
+    Ranked full-text search over Business.search_vector.
+
+    Matches the terms against the trigger-maintained tsvector (GIN index)
+    and, for typos and partial words, by trigram similarity on name and
+    address (pg_trgm GIN indexes). Results are ordered by text rank, then
+    similarity, unless ?ordering= is given. On databases other than
+    PostgreSQL it falls back to DRF's icontains search over search_fields.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = ' '.join(self.get_search_terms(request))
+        if not terms:
+            return queryset
+        if connection.vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+
+        query = SearchQuery(
+            terms,
+            config=settings.FULL_TEXT_SEARCH_CONFIG,
+            search_type='websearch'
+        )
+        return queryset.filter(
+            Q(search_vector=query) |
+            Q(name__trigram_similar=terms) |
+            Q(address__trigram_similar=terms)
+        ).annotate(
+            search_rank=SearchRank(F('search_vector'), query),
+            search_similarity=Greatest(
+                TrigramSimilarity('name', terms),
+                TrigramSimilarity('address', terms)
+            )
+        ).order_by('-search_rank', '-search_similarity', '-pk')
@@ -0,0 +1,144 @@
+import math
+from typing import List, NamedTuple, Optional, Tuple
+
+# Mean Earth radius in meters
+EARTH_RADIUS = 6371008.8
+
+
+def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in meters between two points."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+class Bounds(NamedTuple):
+    """Latitude/longitude bounding box (does not cross the antimeridian)."""
+    south: float
+    west: float
+    north: float
+    east: float
+
+    @property
+    def center(self) -> Tuple[float, float]:
+        return ((self.south + self.north) / 2, (self.west + self.east) / 2)
+
+    @property
+    def radius(self) -> float:
+        """Meters from the center to the farthest corner."""
+        lat, lng = self.center
+        return max(
+            haversine(lat, lng, self.south, self.west),
+            haversine(lat, lng, self.north, self.east),
+            haversine(lat, lng, self.south, self.east),
+            haversine(lat, lng, self.north, self.west),
+        )
+
+    def contains(self, lat: float, lng: float) -> bool:
+        return self.south <= lat <= self.north and self.west <= lng <= self.east
+
+    def split(self, n: int) -> List['Bounds']:
+        """Split into an n x n grid of equal tiles."""
+        lat_step = (self.north - self.south) / n
+        lng_step = (self.east - self.west) / n
+        return [
+            Bounds(
+                self.south + row * lat_step,
+                self.west + col * lng_step,
+                self.south + (row + 1) * lat_step,
+                self.west + (col + 1) * lng_step,
+            )
+            for row in range(n)
+            for col in range(n)
+        ]
+
+    @classmethod
+    def around(cls, lat: float, lng: float, radius: float) -> 'Bounds':
+        """Box enclosing the circle of radius meters around a point."""
+        d_lat = math.degrees(radius / EARTH_RADIUS)
+        d_lng = math.degrees(radius / (EARTH_RADIUS * max(math.cos(math.radians(lat)), 1e-6)))
+        return cls(
+            max(-90.0, lat - d_lat),
+            max(-180.0, lng - d_lng),
+            min(90.0, lat + d_lat),
+            min(180.0, lng + d_lng),
+        )
+
+
+_GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Precision stored in Business.geohash (~3.7 cm cells)
+GEOHASH_PRECISION = 12
+
+
+def encode_geohash(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Encode a point as a geohash of the given length."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, value_range = (lng, lng_range) if even else (lat, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            value_range[0] = mid
+        else:
+            bits <<= 1
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """(height, width) in degrees of a geohash cell of the given length."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def covering_geohashes(bounds: Bounds, max_cells: int = 32) -> List[str]:
+    """
+    Geohash prefixes whose cells together cover bounds.
+
+    Uses the longest prefix length that needs at most max_cells cells, so
+    a prefix query reads as few rows outside bounds as possible.
+    """
+    best = None
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = geohash_cell_size(precision)
+        rows = range(int((bounds.south + 90) // height), int((bounds.north + 90) // height) + 1)
+        cols = range(int((bounds.west + 180) // width), int((bounds.east + 180) // width) + 1)
+        if len(rows) * len(cols) > max_cells:
+            break
+        best = (precision, height, width, rows, cols)
+    if best is None:
+        # Even single characters need too many cells: the box spans the globe
+        return list(_GEOHASH_ALPHABET)
+
+    precision, height, width, rows, cols = best
+    return sorted({
+        encode_geohash(
+            min(90.0, -90 + (row + 0.5) * height),
+            min(180.0, -180 + (col + 0.5) * width),
+            precision
+        )
+        for row in rows
+        for col in cols
+    })
+
+
+def business_geohash(latitude, longitude) -> Optional[str]:
+    """Geohash stored for a business, or None when coordinates are missing."""
+    if latitude is None or longitude is None:
+        return None
+    return encode_geohash(float(latitude), float(longitude))
@@ -0,0 +1,52 @@
+import json
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from scraper.benchmark import run_extractor_benchmark, synthetic_corpus
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark contact extraction (emails, phones, social links) over a corpus of '
+        'saved HTML pages, or synthetic pages without --pages, and write a JSON report.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', help='Directory of saved pages (*.html, *.htm, searched recursively)')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per page')
+        parser.add_argument('--max-bytes', type=int, help='Byte cap per page (default: CRAWLER_MAX_PAGE_BYTES)')
+        parser.add_argument('--output', help='Report path (default: benchmark-extractor-<timestamp>.json)')
+
+    def handle(self, *args, **options):
+        if options['pages']:
+            root = Path(options['pages'])
+            if not root.is_dir():
+                raise CommandError(f"{root} is not a directory")
+            paths = sorted(path for path in root.rglob('*') if path.suffix.lower() in ('.html', '.htm'))
+            if not paths:
+                raise CommandError(f'No .html or .htm files under {root}')
+            pages = {str(path.relative_to(root)): path.read_bytes() for path in paths}
+        else:
+            pages = synthetic_corpus()
+
+        report = run_extractor_benchmark(pages, repeat=options['repeat'], max_bytes=options['max_bytes'])
+        for run in report['runs']:
+            self.stdout.write(
+                f"{run['page'][:40]:<40} {run['bytes'] / 1024:>8.0f} KiB  "
+                f"extractor p50 {run['extractor_seconds']['p50'] * 1000:>8.2f} ms  "
+                f"regex p50 {run['regex_seconds']['p50'] * 1000:>8.2f} ms  "
+                f"{len(run['emails'])} emails  {len(run['phones'])} phones  "
+                f"{len(run['social_links'])} social"
+                + ('  (truncated)' if run['truncated'] else '')
+            )
+        totals = report['totals']
+        self.stdout.write(
+            f"extractor {totals['extractor']['mb_per_second']} MB/s, "
+            f"regex {totals['regex']['mb_per_second']} MB/s"
+        )
+        report['created_at'] = timezone.now().isoformat()
+
+        output = options['output'] or f"benchmark-extractor-{timezone.now():%Y%m%d-%H%M%S}.json"
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {output}'))
@@ -0,0 +1,89 @@
+import json
+import subprocess
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from scraper.benchmark import run_benchmark
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the search pipeline offline against a fake Places API and fake '
+        'business websites, and write a JSON report.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--results', type=int_list, default=[20, 60], help='Comma-separated places per search')
+        parser.add_argument('--workers', type=int_list, default=[1, 4, 8], help='Comma-separated max_workers values')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--api-latency', type=float, default=0.05, help='Seconds per fake API request')
+        parser.add_argument('--site-latency', type=float, default=0.1, help='Seconds per fake website page')
+        parser.add_argument('--site-size', type=int, default=20_000, help='Bytes per fake website page')
+        parser.add_argument(
+            '--email-page', choices=['home', 'contact'], default='home',
+            help='Put each fake site\'s email on its homepage or only on its contact page'
+        )
+        parser.add_argument(
+            '--token-delay', type=float,
+            help='Seconds before a next_page_token works (default: GOOGLE_MAPS_PAGE_TOKEN_DELAY)'
+        )
+        parser.add_argument('--unthrottled', action='store_true', help='Disable rate limiting')
+        parser.add_argument(
+            '--async', dest='async_service', action='store_true',
+            help='Benchmark the async service; --workers then sets its concurrency'
+        )
+        parser.add_argument('--output', help='Report path (default: benchmark-search-<timestamp>.json)')
+        parser.add_argument('--baseline', help='Earlier report to compare p50 latencies against')
+
+    def handle(self, *args, **options):
+        baseline = {}
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = {(run['results'], run['workers']): run for run in json.load(f)['runs']}
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f'Cannot read baseline report: {e}')
+
+        def report_run(run):
+            line = (
+                f"{run['results']:>5} results  {run['workers']:>3} workers  "
+                f"p50 {run['total_seconds']['p50']:.3f}s  p95 {run['total_seconds']['p95']:.3f}s  "
+                f"{run['places_per_second']} places/s  {sum(run['api_calls'].values())} API calls  "
+                f"{run['db_queries']} queries"
+            )
+            previous = baseline.get((run['results'], run['workers']))
+            if previous and previous['total_seconds']['p50']:
+                change = run['total_seconds']['p50'] / previous['total_seconds']['p50'] - 1
+                line += f'  ({change:+.1%} vs baseline)'
+            self.stdout.write(line)
+
+        report = run_benchmark(
+            options['results'],
+            options['workers'],
+            repeat=options['repeat'],
+            api_latency=options['api_latency'],
+            site_latency=options['site_latency'],
+            site_size=options['site_size'],
+            email_page=options['email_page'],
+            token_delay=options['token_delay'],
+            throttled=not options['unthrottled'],
+            async_service=options['async_service'],
+            progress=report_run
+        )
+        report['created_at'] = timezone.now().isoformat()
+        try:
+            report['git_commit'] = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            report['git_commit'] = None
+
+        output = options['output'] or f"benchmark-search-{timezone.now():%Y%m%d-%H%M%S}.json"
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {output}'))
@@ -0,0 +1,127 @@
+import random
+import statistics
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+from scraper.models import Search, Business
+from scraper.signals import sync_search_access
+
+User = get_user_model()
+
+BENCH_EMAIL_DOMAIN = 'benchmark.invalid'
+
+
+def legacy_queryset(user):
+    """BusinessViewSet.get_queryset before SearchAccess (OR over shared_with + DISTINCT)."""
+    return Business.objects.filter(
+        search__in=Search.objects.filter(
+            models.Q(user=user) |
+            models.Q(shared_with=user)
+        )
+    ).distinct()
+
+
+def access_queryset(user):
+    """BusinessViewSet.get_queryset with the SearchAccess table."""
+    return Business.objects.filter(search__access_grants__user=user)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a synthetic dataset and compare the business visibility query '
+        'using SearchAccess against the legacy OR/DISTINCT query.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--businesses', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--searches', type=int, default=20_000)
+        parser.add_argument('--shares-per-search', type=int, default=2)
+        parser.add_argument('--sample-users', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse previously seeded data')
+        parser.add_argument('--cleanup', action='store_true', help='Delete seeded data and exit')
+        parser.add_argument('--explain', action='store_true', help='Print query plans (PostgreSQL)')
+
+    def handle(self, *args, **options):
+        bench_users = User.objects.filter(email__endswith='@' + BENCH_EMAIL_DOMAIN)
+        if options['cleanup']:
+            deleted, _ = bench_users.delete()
+            self.stdout.write(f'Deleted {deleted} seeded rows')
+            return
+
+        if not options['skip_seed']:
+            self.seed(options)
+
+        users = list(bench_users.order_by('?')[:options['sample_users']])
+        if not users:
+            self.stderr.write('No seeded users found; run without --skip-seed first')
+            return
+
+        results = {'legacy': [], 'access': []}
+        for user in users:
+            for name, build in (('legacy', legacy_queryset), ('access', access_queryset)):
+                for _ in range(options['repeat']):
+                    results[name].append(self.time_page(build(user)))
+        for name, timings in results.items():
+            self.stdout.write(
+                f'{name:>7}: median {statistics.median(timings):8.1f} ms, '
+                f'max {max(timings):8.1f} ms (count + first page of 50)'
+            )
+
+        if options['explain'] and connection.vendor == 'postgresql':
+            user = users[0]
+            for name, build in (('legacy', legacy_queryset), ('access', access_queryset)):
+                page = build(user).order_by('-created_at')[:50]
+                self.stdout.write(f'\n{name} plan:\n' + page.explain(analyze=True, buffers=True))
+
+    def time_page(self, queryset):
+        """Milliseconds to run the list endpoint's count and first page."""
+        started = time.perf_counter()
+        queryset.count()
+        list(queryset.order_by('-created_at').values_list('id', flat=True)[:50])
+        return (time.perf_counter() - started) * 1000
+
+    def seed(self, options):
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(email=f'bench-{i}@{BENCH_EMAIL_DOMAIN}', name=f'Bench {i}', password='!')
+                for i in range(options['users'])
+            ])
+            searches = Search.objects.bulk_create([
+                Search(user=random.choice(users), query=f'bench query {i}')
+                for i in range(options['searches'])
+            ], batch_size=batch_size)
+
+            SharedWith = Search.shared_with.through
+            SharedWith.objects.bulk_create([
+                SharedWith(search_id=search.id, user_id=user.id)
+                for search in searches
+                for user in random.sample(users, min(options['shares_per_search'], len(users)))
+                if user.id != search.user_id
+            ], batch_size=batch_size, ignore_conflicts=True)
+            # bulk_create skips the signals that maintain SearchAccess
+            search_ids = [search.id for search in searches]
+            for offset in range(0, len(search_ids), batch_size):
+                sync_search_access(search_ids[offset:offset + batch_size])
+        self.stdout.write(f'Seeded {len(users)} users and {len(searches)} searches')
+
+        created = 0
+        while created < options['businesses']:
+            count = min(batch_size, options['businesses'] - created)
+            Business.objects.bulk_create([
+                Business(
+                    search=random.choice(searches),
+                    name=f'Bench business {created + i}',
+                    place_id=f'bench-{users[0].id}-{created + i}',
+                    category='bench',
+                )
+                for i in range(count)
+            ])
+            created += count
+            self.stdout.write(f'Seeded {created} businesses', ending='\r')
+        self.stdout.write(f'\nSeeding took {time.perf_counter() - started:.1f}s')
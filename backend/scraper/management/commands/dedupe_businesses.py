@@ -0,0 +1,45 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from scraper.dedup import find_duplicate_groups, merge_duplicate_groups
+from scraper.models import Business
+
+
+class Command(BaseCommand):
+    help = (
+        'Merge businesses that are the same place: rows sharing a phone number, '
+        'website domain or geohash cell whose match score reaches the threshold.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since-hours', type=float,
+            help='Only check businesses created in the last N hours (default: whole table)'
+        )
+        parser.add_argument(
+            '--threshold', type=float,
+            help='Minimum match score (default: settings.DEDUP_MATCH_THRESHOLD)'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='List duplicate groups without merging')
+
+    def handle(self, *args, **options):
+        candidates = None
+        if options['since_hours'] is not None:
+            since = timezone.now() - timedelta(hours=options['since_hours'])
+            candidates = Business.objects.filter(created_at__gte=since).only('id')
+
+        groups = find_duplicate_groups(candidates, options['threshold'])
+        self.stdout.write(
+            f'Found {len(groups)} duplicate groups ({sum(len(g) - 1 for g in groups)} extra rows)'
+        )
+        if options['dry_run']:
+            names = dict(
+                Business.objects.filter(pk__in=[pk for group in groups for pk in group])
+                .values_list('pk', 'name')
+            )
+            for group in groups:
+                self.stdout.write('  ' + ' | '.join(f'{pk}: {names.get(pk)}' for pk in group))
+            return
+
+        removed = merge_duplicate_groups(groups)
+        self.stdout.write(self.style.SUCCESS(f'Merged away {removed} duplicate businesses'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from scraper.refresh import due_businesses, refresh_businesses
+from scraper.services import GoogleMapsService
+
+
+class Command(BaseCommand):
+    help = (
+        'Refresh the stalest businesses: refetch expired details from Google Maps and '
+        'expired contacts from their websites (conditionally), writing back changed fields only.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Businesses checked at most (default: BUSINESS_REFRESH_LIMIT)')
+        parser.add_argument('--batch-size', type=int, help='Businesses per batch (default: BUSINESS_REFRESH_BATCH_SIZE)')
+        parser.add_argument('--workers', type=int, help='Businesses fetched concurrently (default: GOOGLE_MAPS_MAX_WORKERS)')
+        parser.add_argument('--dry-run', action='store_true', help='Count the businesses due without refreshing them')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(f'{due_businesses().count()} businesses due for a refresh')
+            return
+
+        report = refresh_businesses(
+            limit=options['limit'],
+            batch_size=options['batch_size'],
+            service=GoogleMapsService(max_workers=options['workers'])
+        )
+        self.stdout.write(
+            f"Checked {report['checked']}: {report['changed']} changed, "
+            f"{report['unchanged']} unchanged, {report['skipped']} skipped"
+        )
+        for field, count in sorted(report['fields_changed'].items()):
+            self.stdout.write(f'  {field}: {count}')
+        self.stdout.write(self.style.SUCCESS(f"API calls: {report['api_calls']}"))
@@ -0,0 +1,111 @@
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Optional
+from urllib.parse import urlsplit
+from .geo import haversine
+
+# Second-level labels under two-letter country codes (example.co.uk)
+_COUNTRY_SLDS = {'ac', 'co', 'com', 'edu', 'gov', 'go', 'ne', 'net', 'or', 'org'}
+
+# Sites that host many businesses under one registered domain. For these the
+# full host (joes-pizza.business.site) identifies the business, and a bare
+# profile URL (facebook.com/joespizza) does not identify it at all.
+SHARED_DOMAINS = {
+    'blogspot.com', 'business.site', 'facebook.com', 'godaddysites.com',
+    'google.com', 'instagram.com', 'linktr.ee', 'square.site',
+    'squarespace.com', 'weebly.com', 'wixsite.com', 'wordpress.com', 'yelp.com',
+}
+
+# Words that do not distinguish one business name from another
+_NAME_STOPWORDS = {'and', 'co', 'corp', 'inc', 'llc', 'ltd', 'the'}
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """
+    Comparable form of a phone number: its last 10 digits.
+
+    Dropping the leading digits makes international (+44 20 ...) and
+    national (020 ...) formats of the same number match.
+    """
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) < 7:
+        return None
+    return digits[-10:]
+
+
+def registered_domain(url: Optional[str]) -> Optional[str]:
+    """
+    Registered domain of a website URL (shop.example.co.uk -> example.co.uk).
+
+    Hosts on SHARED_DOMAINS are kept whole, and None is returned when the
+    URL is just a profile on one of them.
+    """
+    if not url:
+        return None
+    if '://' not in url:
+        url = f'http://{url}'
+    try:
+        host = (urlsplit(url).hostname or '').rstrip('.')
+    except ValueError:
+        return None
+    if host.startswith('www.'):
+        host = host[4:]
+    labels = host.split('.')
+    if len(labels) < 2 or labels[-1].isdigit():
+        return None
+
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in _COUNTRY_SLDS:
+        domain = '.'.join(labels[-3:])
+    else:
+        domain = '.'.join(labels[-2:])
+    if domain in SHARED_DOMAINS:
+        return None if host == domain else host
+    return domain
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """Casefolded, accent- and punctuation-free name without legal suffixes."""
+    text = unicodedata.normalize('NFKD', name or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    words = re.sub(r"[^\w\s]", '', text.casefold().replace('&', ' and ')).split()
+    return ' '.join(word for word in words if word not in _NAME_STOPWORDS)
+
+
+def _similarity(a: str, b: str) -> float:
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def match_score(a, b) -> float:
+    """
+    Likelihood in [0, 1] that two businesses are the same place.
+
+    Name similarity carries most of the weight; a shared phone number,
+    website domain and address add to it. Distance decides between branches
+    of a chain, which share a name and domain (often a phone too): nearby
+    rows score higher and rows more than 2 km apart are penalized.
+
+    Args:
+        a, b: Business instances with normalized_phone, website_domain and
+            coordinates populated
+    """
+    score = 0.4 * _similarity(normalize_name(a.name), normalize_name(b.name))
+    if a.normalized_phone and a.normalized_phone == b.normalized_phone:
+        score += 0.35
+    if a.website_domain and a.website_domain == b.website_domain:
+        score += 0.15
+    score += 0.1 * _similarity(normalize_name(a.address), normalize_name(b.address))
+
+    if None not in (a.latitude, a.longitude, b.latitude, b.longitude):
+        distance = haversine(
+            float(a.latitude), float(a.longitude), float(b.latitude), float(b.longitude)
+        )
+        if distance <= 100:
+            score += 0.2
+        elif distance <= 500:
+            score += 0.1
+        elif distance > 2000:
+            score -= 0.4
+    return max(0.0, min(score, 1.0))
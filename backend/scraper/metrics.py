@@ -0,0 +1,161 @@
+"""
+Prometheus metrics of the search pipeline, and per-request stage timings.
+
+Metrics live in the default prometheus_client registry of each process. Set
+PROMETHEUS_MULTIPROC_DIR to aggregate several processes (gunicorn or
+prefork Celery workers) on one host; the /metrics view and the worker's
+metrics server then read every process's values from that directory.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Dict, Optional
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, REGISTRY, multiprocess, start_http_server
+)
+
+# Pipeline stages run from seconds-long scrapes down to millisecond queries
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+STAGE_SECONDS = Histogram(
+    'scraper_stage_seconds',
+    'Time spent in each stage of the search pipeline',
+    ['stage'],
+    buckets=STAGE_BUCKETS
+)
+API_CALLS = Counter(
+    'scraper_api_calls_total',
+    'Google Maps API calls',
+    ['call', 'status']
+)
+WEBSITE_SCRAPES = Counter(
+    'scraper_website_scrapes_total',
+    'Business website fetches by outcome (success, truncated, not_modified, not_html, http_error, timeout, error)',
+    ['outcome']
+)
+BYTES_DOWNLOADED = Counter(
+    'scraper_bytes_downloaded_total',
+    'Bytes of website content downloaded'
+)
+ROWS_WRITTEN = Counter(
+    'scraper_rows_written_total',
+    'Rows upserted or inserted by the search pipeline',
+    ['table']
+)
+DETAILS_CACHE_LOOKUPS = Counter(
+    'scraper_details_cache_lookups_total',
+    'Place details cache lookups',
+    ['result']
+)
+DOMAIN_ENRICHMENT_LOOKUPS = Counter(
+    'scraper_domain_enrichment_lookups_total',
+    'Domain enrichment cache lookups (hit, negative_hit, miss, not_modified, waited, uncached)',
+    ['result']
+)
+DUPLICATES_MERGED = Counter(
+    'scraper_duplicates_merged_total',
+    'Businesses merged into a duplicate'
+)
+SEARCH_JOBS = Counter(
+    'scraper_search_jobs_total',
+    'Finished search jobs',
+    ['kind', 'status']
+)
+
+# Stage durations (ms) of the request being handled, for Server-Timing
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar('request_timings', default=None)
+# Stages of one request may be timed on several pool threads at once
+_request_timings_lock = threading.Lock()
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration in the histogram and the current request's timings."""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        with _request_timings_lock:
+            timings[stage] = timings.get(stage, 0.0) + seconds * 1000
+
+
+@contextmanager
+def timed_stage(stage: str):
+    """Time the enclosed block as a pipeline stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+@contextmanager
+def collect_request_timings():
+    """
+    Collect the stage timings recorded while handling this request: on its
+    thread or task, in sync_to_async calls and on ContextThreadPool workers.
+    """
+    timings: Dict[str, float] = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+_request_queries: ContextVar[Optional[Dict[str, float]]] = ContextVar('request_queries', default=None)
+
+
+def time_request_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting queries towards the current request
+    (see collect_request_queries). Installed on every connection by
+    scraper.signals, since a request's queries may run on other threads.
+    """
+    queries = _request_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        with _request_timings_lock:
+            queries['count'] += 1
+            queries['seconds'] += time.perf_counter() - started
+
+
+@contextmanager
+def collect_request_queries():
+    """Count the queries run while handling this request and their total time."""
+    queries = {'count': 0, 'seconds': 0.0}
+    token = _request_queries.set(queries)
+    try:
+        yield queries
+    finally:
+        _request_queries.reset(token)
+
+
+class ContextThreadPool(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor running each task in a copy of the submitter's
+    context, so stages timed on its threads count towards the request's
+    Server-Timing (see collect_request_timings).
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(copy_context().run, fn, *args, **kwargs)
+
+
+def get_registry() -> CollectorRegistry:
+    """Registry to expose: all processes in multiprocess mode, else this one."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def start_metrics_server(port: int) -> None:
+    """Serve /metrics over HTTP from a background thread (Celery workers)."""
+    start_http_server(port, registry=get_registry())
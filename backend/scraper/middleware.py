@@ -0,0 +1,53 @@
+import time
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from .metrics import collect_request_queries, collect_request_timings
+
+
+class ServerTimingMiddleware:
+    """
+    Add a Server-Timing header to every response: total time, database
+    time and query count, and the pipeline stages timed while handling the
+    request (see metrics.timed_stage).
+
+    Runs natively under both WSGI and ASGI, so async views are not moved to
+    a thread. Stages and queries of sync_to_async calls and ContextThreadPool
+    workers are counted; the body of a streaming response is not.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with self._timed() as finish:
+            response = self.get_response(request)
+        return finish(response)
+
+    async def __acall__(self, request):
+        with self._timed() as finish:
+            response = await self.get_response(request)
+        return finish(response)
+
+    @contextmanager
+    def _timed(self):
+        """Time the enclosed request; yields a function adding the header."""
+        started = time.perf_counter()
+        with collect_request_timings() as timings, collect_request_queries() as queries:
+
+            def finish(response):
+                total = time.perf_counter() - started
+                entries = [
+                    f'total;dur={total * 1000:.1f}',
+                    f'db;dur={queries["seconds"] * 1000:.1f};desc="{queries["count"]} queries"',
+                ]
+                entries.extend(f'{stage};dur={ms:.1f}' for stage, ms in timings.items())
+                response['Server-Timing'] = ', '.join(entries)
+                return response
+
+            yield finish
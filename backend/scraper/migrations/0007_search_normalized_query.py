@@ -0,0 +1,84 @@
+# Generated by Django 4.2.17 on 2026-10-18 12:29
+
+import re
+from urllib.parse import urlparse, parse_qs, unquote_plus
+
+from django.db import migrations, models
+
+# Copy of scraper.queries.normalize_query as of this migration, so later
+# changes to the live helper don't change what the backfill computes
+_VIEWPORT_RE = re.compile(r'@(-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?)(?:,(\d+(?:\.\d+)?)z)?')
+_TOKEN_RE = re.compile(r'[^\w]+', re.UNICODE)
+
+
+def parse_maps_url(url):
+    parsed = urlparse(url if '://' in url else 'https://' + url)
+    segments = [segment for segment in parsed.path.split('/') if segment]
+
+    text = None
+    for marker in ('search', 'place'):
+        if marker in segments:
+            index = segments.index(marker) + 1
+            if index < len(segments) and not segments[index].startswith('@'):
+                text = unquote_plus(segments[index])
+                break
+    if text is None:
+        params = parse_qs(parsed.query)
+        values = params.get('q') or params.get('query')
+        if values:
+            text = values[0]
+    if not text:
+        return None
+
+    result = {'query': text.strip()}
+    match = _VIEWPORT_RE.search(parsed.path)
+    if match:
+        result['latitude'] = float(match.group(1))
+        result['longitude'] = float(match.group(2))
+    return result
+
+
+def normalize_query(query):
+    location = ''
+    if 'google.com/maps' in query or 'maps.google.' in query:
+        parsed = parse_maps_url(query)
+        if parsed:
+            query = parsed['query']
+            if 'latitude' in parsed:
+                location = f" @{parsed['latitude']:.2f},{parsed['longitude']:.2f}"
+
+    tokens = [token for token in _TOKEN_RE.split(query.casefold()) if token]
+    return (' '.join(sorted(tokens)) + location)[:255]
+
+
+def backfill_normalized_query(apps, schema_editor):
+    Search = apps.get_model('scraper', 'Search')
+    searches = list(Search.objects.only('id', 'query'))
+    for search in searches:
+        search.normalized_query = normalize_query(search.query)
+    Search.objects.bulk_update(searches, ['normalized_query'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0006_searchjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='search',
+            name='normalized_query',
+            field=models.CharField(blank=True, default='', help_text='Cache key of the query (see scraper.queries.normalize_query)', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='searchjob',
+            name='cache_status',
+            field=models.CharField(choices=[('miss', 'Miss'), ('fresh', 'Fresh'), ('stale', 'Stale')], default='miss', help_text='Whether results were served from an earlier equivalent search', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='search',
+            index=models.Index(fields=['normalized_query'], name='scraper_sea_normali_e4103d_idx'),
+        ),
+        migrations.RunPython(backfill_normalized_query, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0007_search_normalized_query'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchjob',
+            name='pages_fetched',
+            field=models.IntegerField(default=0, help_text='Text search result pages fetched'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.17 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0008_searchjob_pages_fetched'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchjob',
+            name='details_calls_saved',
+            field=models.IntegerField(default=0, help_text='Duplicate places skipped before fetching details'),
+        ),
+        migrations.AddField(
+            model_name='searchjob',
+            name='kind',
+            field=models.CharField(choices=[('search', 'Text search'), ('sweep', 'Area sweep')], default='search', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='searchjob',
+            name='params',
+            field=models.JSONField(blank=True, default=dict, help_text='Extra job arguments, e.g. keyword and bounds of an area sweep'),
+        ),
+        migrations.AddField(
+            model_name='searchjob',
+            name='tiles_searched',
+            field=models.IntegerField(default=0, help_text='Area sweep tiles searched'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+from collections import defaultdict
+from django.db import migrations
+from django.db.models import Count
+
+
+def merge_duplicate_place_ids(apps, schema_editor):
+    """
+    Merge the Businesses sharing a place_id so place_id can be made unique.
+
+    Businesses are listed to the owner and shared users of the search that
+    saved them, so only rows whose searches are visible to the same users
+    are merged: the oldest of them is kept and takes over the search links
+    of the others. The oldest row of the place keeps the place_id; the kept
+    rows of searches visible to other users lose it instead of being
+    deleted. Empty place_ids become NULL, which the unique constraint allows
+    any number of.
+    """
+    Business = apps.get_model('scraper', 'Business')
+    Search = apps.get_model('scraper', 'Search')
+    SearchHistory = Business.search_history.through
+    SearchResults = Search.results.through
+    SharedWith = Search.shared_with.through
+
+    Business.objects.filter(place_id='').update(place_id=None)
+
+    duplicates = (
+        Business.objects.exclude(place_id=None)
+        .values('place_id')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        rows = list(
+            Business.objects.filter(place_id=duplicate['place_id'])
+            .order_by('id')
+            .values_list('id', 'search_id', 'search__user_id')
+        )
+        shared = defaultdict(set)
+        for search_id, user_id in SharedWith.objects.filter(
+            search_id__in={search_id for _, search_id, _ in rows}
+        ).values_list('search_id', 'user_id'):
+            shared[search_id].add(user_id)
+
+        # Rows by the users who may see them, oldest first
+        by_access = defaultdict(list)
+        for business_id, search_id, owner_id in rows:
+            by_access[frozenset({owner_id, *shared[search_id]})].append(business_id)
+
+        for keep_id, *drop_ids in by_access.values():
+            if keep_id != rows[0][0]:
+                Business.objects.filter(id=keep_id).update(place_id=None)
+            if not drop_ids:
+                continue
+            history_search_ids = SearchHistory.objects.filter(
+                business_id__in=drop_ids
+            ).values_list('search_id', flat=True).distinct()
+            SearchHistory.objects.bulk_create(
+                [SearchHistory(business_id=keep_id, search_id=search_id) for search_id in history_search_ids],
+                ignore_conflicts=True
+            )
+            result_search_ids = SearchResults.objects.filter(
+                business_id__in=drop_ids
+            ).values_list('search_id', flat=True).distinct()
+            SearchResults.objects.bulk_create(
+                [SearchResults(business_id=keep_id, search_id=search_id) for search_id in result_search_ids],
+                ignore_conflicts=True
+            )
+            Business.objects.filter(id__in=drop_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0009_searchjob_sweep'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_place_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0010_merge_duplicate_place_ids'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='business',
+            name='place_id',
+            field=models.CharField(blank=True, help_text='Google Maps Place ID', max_length=255, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.17 on 2026-10-18 12:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_search_access(apps, schema_editor):
+    Search = apps.get_model('scraper', 'Search')
+    SearchAccess = apps.get_model('scraper', 'SearchAccess')
+    SharedWith = Search.shared_with.through
+    grants = Search.objects.order_by().values_list('user_id', 'id').union(
+        SharedWith.objects.order_by().values_list('user_id', 'search_id')
+    )
+    batch = []
+    for user_id, search_id in grants.iterator():
+        batch.append(SearchAccess(user_id=user_id, search_id=search_id))
+        if len(batch) >= 5000:
+            SearchAccess.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    SearchAccess.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('scraper', '0011_business_place_id_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('search', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access_grants', to='scraper.search')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_access', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'search access',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='searchaccess',
+            constraint=models.UniqueConstraint(fields=('user', 'search'), name='unique_search_access'),
+        ),
+        migrations.RunPython(backfill_search_access, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Weighted document: name > category > address > email/phone. Must match
+# FULL_TEXT_SEARCH_CONFIG in settings.
+SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('english', coalesce({row}name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce({row}category, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce({row}address, '')), 'C') ||
+    setweight(to_tsvector('english', coalesce({row}email, '') || ' ' || coalesce({row}phone, '')), 'D')
+"""
+
+FORWARD_SQL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    """
+    CREATE OR REPLACE FUNCTION scraper_business_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {vector};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """.format(vector=SEARCH_VECTOR_SQL.format(row='NEW.')),
+    """
+    CREATE TRIGGER scraper_business_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, category, address, email, phone ON scraper_business
+    FOR EACH ROW EXECUTE FUNCTION scraper_business_search_vector_update()
+    """,
+    'UPDATE scraper_business SET search_vector = {vector}'.format(vector=SEARCH_VECTOR_SQL.format(row='')),
+    'CREATE INDEX scraper_business_search_vector_idx ON scraper_business USING gin (search_vector)',
+    'CREATE INDEX scraper_business_name_trgm_idx ON scraper_business USING gin (name gin_trgm_ops)',
+    'CREATE INDEX scraper_business_address_trgm_idx ON scraper_business USING gin (address gin_trgm_ops)',
+]
+
+REVERSE_SQL = [
+    'DROP INDEX IF EXISTS scraper_business_address_trgm_idx',
+    'DROP INDEX IF EXISTS scraper_business_name_trgm_idx',
+    'DROP INDEX IF EXISTS scraper_business_search_vector_idx',
+    'DROP TRIGGER IF EXISTS scraper_business_search_vector_trigger ON scraper_business',
+    'DROP FUNCTION IF EXISTS scraper_business_search_vector_update()',
+]
+
+
+def run_postgres_sql(statements):
+    """Return a RunPython function executing statements on PostgreSQL only."""
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0012_searchaccess'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='business',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, help_text='Full-text document maintained by a database trigger (PostgreSQL only)', null=True),
+        ),
+        migrations.RunPython(run_postgres_sql(FORWARD_SQL), run_postgres_sql(REVERSE_SQL)),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.17 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+# Copy of scraper.geo.business_geohash as of this migration, so later
+# changes to the live helper don't change what the backfill computes
+_GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def business_geohash(latitude, longitude, precision=12):
+    lat, lng = float(latitude), float(longitude)
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, value_range = (lng, lng_range) if even else (lat, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            value_range[0] = mid
+        else:
+            bits <<= 1
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def backfill_geohash(apps, schema_editor):
+    Business = apps.get_model('scraper', 'Business')
+    located = Business.objects.filter(
+        latitude__isnull=False, longitude__isnull=False
+    ).only('id', 'latitude', 'longitude')
+    batch = []
+    for business in located.iterator(chunk_size=2000):
+        business.geohash = business_geohash(business.latitude, business.longitude)
+        batch.append(business)
+        if len(batch) >= 2000:
+            Business.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        Business.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0013_business_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='business',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Geohash of the coordinates, used for spatial prefix lookups', max_length=12, null=True),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 4.2.17 on 2026-10-18 14:20
+
+import re
+from urllib.parse import urlsplit
+
+from django.db import migrations, models
+from django.db.models import Q
+
+# Copies of scraper.matching.normalize_phone and registered_domain as of
+# this migration, so later changes to the live helpers don't change what
+# the backfill computes
+_COUNTRY_SLDS = {'ac', 'co', 'com', 'edu', 'gov', 'go', 'ne', 'net', 'or', 'org'}
+SHARED_DOMAINS = {
+    'blogspot.com', 'business.site', 'facebook.com', 'godaddysites.com',
+    'google.com', 'instagram.com', 'linktr.ee', 'square.site',
+    'squarespace.com', 'weebly.com', 'wixsite.com', 'wordpress.com', 'yelp.com',
+}
+
+
+def normalize_phone(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) < 7:
+        return None
+    return digits[-10:]
+
+
+def registered_domain(url):
+    if not url:
+        return None
+    if '://' not in url:
+        url = f'http://{url}'
+    try:
+        host = (urlsplit(url).hostname or '').rstrip('.')
+    except ValueError:
+        return None
+    if host.startswith('www.'):
+        host = host[4:]
+    labels = host.split('.')
+    if len(labels) < 2 or labels[-1].isdigit():
+        return None
+
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in _COUNTRY_SLDS:
+        domain = '.'.join(labels[-3:])
+    else:
+        domain = '.'.join(labels[-2:])
+    if domain in SHARED_DOMAINS:
+        return None if host == domain else host
+    return domain
+
+
+def backfill_dedup_keys(apps, schema_editor):
+    Business = apps.get_model('scraper', 'Business')
+    businesses = Business.objects.filter(
+        Q(phone__isnull=False) | Q(website__isnull=False)
+    ).only('id', 'phone', 'website')
+    batch = []
+    for business in businesses.iterator(chunk_size=2000):
+        business.normalized_phone = normalize_phone(business.phone)
+        business.website_domain = registered_domain(business.website)
+        batch.append(business)
+        if len(batch) >= 2000:
+            Business.objects.bulk_update(batch, ['normalized_phone', 'website_domain'])
+            batch = []
+    if batch:
+        Business.objects.bulk_update(batch, ['normalized_phone', 'website_domain'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0014_business_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='business',
+            name='normalized_phone',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Last 10 digits of the phone number, used to find duplicates', max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='business',
+            name='website_domain',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Registered domain of the website, used to find duplicates', max_length=255, null=True),
+        ),
+        migrations.RunPython(backfill_dedup_keys, migrations.RunPython.noop),
+    ]
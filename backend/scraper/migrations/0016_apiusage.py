@@ -0,0 +1,34 @@
+# Generated by Django 4.2.17 on 2026-10-18 15:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('scraper', '0015_business_dedup_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('call', models.CharField(choices=[('places', 'Text search'), ('places_nearby', 'Nearby search'), ('place', 'Place details')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='api_usage', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'API usage',
+                'ordering': ['-date', 'call'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='apiusage',
+            constraint=models.UniqueConstraint(fields=('user', 'date', 'call'), name='unique_api_usage'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.17 on 2026-10-18 13:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0016_apiusage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DomainEnrichment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=255, unique=True)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, help_text='HTTP status of the homepage; empty when the site could not be reached', null=True)),
+                ('email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('instagram_link', models.URLField(blank=True, max_length=500, null=True)),
+                ('youtube_link', models.URLField(blank=True, max_length=500, null=True)),
+                ('twitter_link', models.URLField(blank=True, max_length=500, null=True)),
+                ('facebook_link', models.URLField(blank=True, max_length=500, null=True)),
+                ('fetched_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'ordering': ['domain'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0017_domainenrichment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='domainenrichment',
+            name='phone',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.17 on 2026-10-18 13:09
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_fetched_at(apps, schema_editor):
+    # Rows were last fetched by the search that last upserted them
+    Business = apps.get_model('scraper', 'Business')
+    Business.objects.update(details_fetched_at=F('updated_at'), contacts_fetched_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0018_domainenrichment_phone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='business',
+            name='contacts_fetched_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='When email and social links were last taken from the website', null=True),
+        ),
+        migrations.AddField(
+            model_name='business',
+            name='details_fetched_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='When phone and website were last fetched from Google Maps', null=True),
+        ),
+        migrations.AddField(
+            model_name='domainenrichment',
+            name='etag',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='domainenrichment',
+            name='last_modified',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='domainenrichment',
+            name='url',
+            field=models.URLField(blank=True, help_text='Homepage crawled', max_length=500, null=True),
+        ),
+        migrations.RunPython(backfill_fetched_at, migrations.RunPython.noop),
+    ]
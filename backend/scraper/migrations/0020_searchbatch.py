@@ -0,0 +1,52 @@
+# Generated by Django 4.2.17 on 2026-10-18 13:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('scraper', '0019_refresh_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('queries_total', models.IntegerField(default=0)),
+                ('queries_searched', models.IntegerField(default=0, help_text='Queries whose places have been listed (or served from the query cache)')),
+                ('places_found', models.IntegerField(default=0, help_text='Distinct places found by all queries')),
+                ('details_fetched', models.IntegerField(default=0, help_text='Places whose details and website have been fetched')),
+                ('pages_fetched', models.IntegerField(default=0, help_text='Text search result pages fetched')),
+                ('details_calls_saved', models.IntegerField(default=0, help_text='Places found by more than one query, fetched once')),
+                ('results_saved', models.IntegerField(default=0, help_text='Results linked to the searches of all queries')),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_batches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'search batches',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='searchjob',
+            name='batch',
+            field=models.ForeignKey(blank=True, help_text='Batch the job was run in, if any', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='scraper.searchbatch'),
+        ),
+        migrations.AddIndex(
+            model_name='searchbatch',
+            index=models.Index(fields=['-created_at'], name='scraper_sea_created_7a643c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='searchbatch',
+            index=models.Index(fields=['user'], name='scraper_sea_user_id_184c34_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0020_searchbatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchjob',
+            name='emails_found',
+            field=models.IntegerField(default=0, help_text='Fetched places with an email address'),
+        ),
+    ]
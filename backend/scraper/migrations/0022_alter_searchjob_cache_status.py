@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraper', '0021_searchjob_emails_found'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='searchjob',
+            name='cache_status',
+            field=models.CharField(choices=[('miss', 'Miss'), ('fresh', 'Fresh'), ('stale', 'Stale'), ('refreshing', 'Stale, refresh already running')], default='miss', help_text='Whether results were served from an earlier equivalent search', max_length=10),
+        ),
+    ]
@@ -1,7 +1,11 @@
 from django.db import models
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 import uuid
 
+from .geo import business_geohash
+from .matching import normalize_phone, registered_domain
+
 class Search(models.Model):
     """Model to track search queries and their results."""
     user = models.ForeignKey(
@@ -16,6 +20,12 @@ class Search(models.Model):
         help_text='Users who have access to this search'
     )
     query = models.CharField(max_length=255)
+    normalized_query = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        help_text='Cache key of the query (see scraper.queries.normalize_query)'
+    )
     timestamp = models.DateTimeField(auto_now_add=True)
     results_count = models.IntegerField(default=0)
     last_updated = models.DateTimeField(auto_now=True)
@@ -27,12 +37,41 @@ class Search(models.Model):
         indexes = [
             models.Index(fields=['-timestamp']),
             models.Index(fields=['user']),
+            models.Index(fields=['normalized_query']),
         ]
 
     def __str__(self):
         return f"{self.user.email} - {self.query}"
 
 
+class SearchAccess(models.Model):
+    """
+    Precomputed visibility of searches: one row per user who may see a
+    search (its owner and everyone it is shared with).
+
+    Kept in sync with Search.user and Search.shared_with by scraper.signals.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='search_access'
+    )
+    search = models.ForeignKey(
+        Search,
+        on_delete=models.CASCADE,
+        related_name='access_grants'
+    )
+
+    class Meta:
+        verbose_name_plural = 'search access'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'search'], name='unique_search_access'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.search_id}"
+
+
 class Business(models.Model):
     """Model to store business information from Google Maps."""
     uuid = models.UUIDField(
@@ -77,6 +116,7 @@ class Business(models.Model):
         max_length=255,
         null=True,
         blank=True,
+        unique=True,
         help_text='Google Maps Place ID'
     )
     created_at = models.DateTimeField(auto_now_add=True)
@@ -85,6 +125,47 @@ class Business(models.Model):
     youtube_link = models.URLField(max_length=500, blank=True, null=True)
     twitter_link = models.URLField(max_length=500, blank=True, null=True)
     facebook_link = models.URLField(max_length=500, blank=True, null=True)
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        help_text='Full-text document maintained by a database trigger (PostgreSQL only)'
+    )
+    geohash = models.CharField(
+        max_length=12,
+        null=True,
+        blank=True,
+        db_index=True,
+        editable=False,
+        help_text='Geohash of the coordinates, used for spatial prefix lookups'
+    )
+    normalized_phone = models.CharField(
+        max_length=10,
+        null=True,
+        blank=True,
+        db_index=True,
+        editable=False,
+        help_text='Last 10 digits of the phone number, used to find duplicates'
+    )
+    website_domain = models.CharField(
+        max_length=255,
+        null=True,
+        blank=True,
+        db_index=True,
+        editable=False,
+        help_text='Registered domain of the website, used to find duplicates'
+    )
+    details_fetched_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text='When phone and website were last fetched from Google Maps'
+    )
+    contacts_fetched_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text='When email and social links were last taken from the website'
+    )
 
     class Meta:
         ordering = ['-created_at']
@@ -97,3 +178,238 @@ class Business(models.Model):
 
     def __str__(self):
         return self.name
+
+    def set_derived_fields(self):
+        """Recompute the lookup columns (DERIVED_FIELDS) from the source fields."""
+        self.geohash = business_geohash(self.latitude, self.longitude)
+        self.normalized_phone = normalize_phone(self.phone)
+        self.website_domain = registered_domain(self.website)
+
+    def save(self, *args, **kwargs):
+        self.set_derived_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and DERIVED_SOURCES & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, *DERIVED_FIELDS}
+        super().save(*args, **kwargs)
+
+
+# Business columns computed by Business.set_derived_fields, and their inputs
+DERIVED_FIELDS = ['geohash', 'normalized_phone', 'website_domain']
+DERIVED_SOURCES = {'latitude', 'longitude', 'phone', 'website'}
+
+
+class SearchJob(models.Model):
+    """Background job that fetches a search's results from Google Maps."""
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
+    class Kind(models.TextChoices):
+        SEARCH = 'search', 'Text search'
+        SWEEP = 'sweep', 'Area sweep'
+
+    class CacheStatus(models.TextChoices):
+        MISS = 'miss', 'Miss'
+        FRESH = 'fresh', 'Fresh'
+        STALE = 'stale', 'Stale'
+        REFRESHING = 'refreshing', 'Stale, refresh already running'
+
+    search = models.ForeignKey(
+        Search,
+        on_delete=models.CASCADE,
+        related_name='jobs'
+    )
+    batch = models.ForeignKey(
+        'SearchBatch',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='jobs',
+        help_text='Batch the job was run in, if any'
+    )
+    kind = models.CharField(
+        max_length=20,
+        choices=Kind.choices,
+        default=Kind.SEARCH
+    )
+    params = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Extra job arguments, e.g. keyword and bounds of an area sweep'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=Status.choices,
+        default=Status.QUEUED
+    )
+    cache_status = models.CharField(
+        max_length=10,
+        choices=CacheStatus.choices,
+        default=CacheStatus.MISS,
+        help_text='Whether results were served from an earlier equivalent search'
+    )
+    places_found = models.IntegerField(
+        default=0,
+        help_text='Places returned by the text search'
+    )
+    details_fetched = models.IntegerField(
+        default=0,
+        help_text='Places whose details and website have been fetched'
+    )
+    emails_found = models.IntegerField(
+        default=0,
+        help_text='Fetched places with an email address'
+    )
+    pages_fetched = models.IntegerField(
+        default=0,
+        help_text='Text search result pages fetched'
+    )
+    tiles_searched = models.IntegerField(
+        default=0,
+        help_text='Area sweep tiles searched'
+    )
+    details_calls_saved = models.IntegerField(
+        default=0,
+        help_text='Duplicate places skipped before fetching details'
+    )
+    results_saved = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at']),
+            models.Index(fields=['search']),
+        ]
+
+    def __str__(self):
+        return f"{self.search.query} ({self.status})"
+
+
+class SearchBatch(models.Model):
+    """
+    Many text searches run as one background job.
+
+    Each query has its own Search and SearchJob (the per-query results and
+    progress); places found by several queries are fetched once.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='search_batches'
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=SearchJob.Status.choices,
+        default=SearchJob.Status.QUEUED
+    )
+    queries_total = models.IntegerField(default=0)
+    queries_searched = models.IntegerField(
+        default=0,
+        help_text='Queries whose places have been listed (or served from the query cache)'
+    )
+    places_found = models.IntegerField(
+        default=0,
+        help_text='Distinct places found by all queries'
+    )
+    details_fetched = models.IntegerField(
+        default=0,
+        help_text='Places whose details and website have been fetched'
+    )
+    pages_fetched = models.IntegerField(
+        default=0,
+        help_text='Text search result pages fetched'
+    )
+    details_calls_saved = models.IntegerField(
+        default=0,
+        help_text='Places found by more than one query, fetched once'
+    )
+    results_saved = models.IntegerField(
+        default=0,
+        help_text='Results linked to the searches of all queries'
+    )
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = 'search batches'
+        indexes = [
+            models.Index(fields=['-created_at']),
+            models.Index(fields=['user']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.queries_total} queries ({self.status})"
+
+
+class ApiUsage(models.Model):
+    """Google Maps API calls made for a user, per call type and day."""
+
+    class Call(models.TextChoices):
+        PLACES = 'places', 'Text search'
+        PLACES_NEARBY = 'places_nearby', 'Nearby search'
+        PLACE = 'place', 'Place details'
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='api_usage'
+    )
+    date = models.DateField()
+    call = models.CharField(max_length=20, choices=Call.choices)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date', 'call']
+        verbose_name_plural = 'API usage'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date', 'call'], name='unique_api_usage'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.date} {self.call}: {self.count}"
+
+
+class DomainEnrichment(models.Model):
+    """
+    Contacts found by crawling a website, shared by every business whose
+    website is on the same registered domain.
+    """
+    domain = models.CharField(max_length=255, unique=True)
+    url = models.URLField(max_length=500, null=True, blank=True, help_text='Homepage crawled')
+    status_code = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        help_text='HTTP status of the homepage; empty when the site could not be reached'
+    )
+    email = models.EmailField(null=True, blank=True)
+    phone = models.CharField(max_length=50, null=True, blank=True)
+    instagram_link = models.URLField(max_length=500, blank=True, null=True)
+    youtube_link = models.URLField(max_length=500, blank=True, null=True)
+    twitter_link = models.URLField(max_length=500, blank=True, null=True)
+    facebook_link = models.URLField(max_length=500, blank=True, null=True)
+    # Homepage validators for conditional requests
+    etag = models.CharField(max_length=255, null=True, blank=True)
+    last_modified = models.CharField(max_length=64, null=True, blank=True)
+    fetched_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['domain']
+
+    def __str__(self):
+        return self.domain
+
+    @property
+    def reachable(self) -> bool:
+        """Whether the crawl got the homepage (negative entries did not)."""
+        return self.status_code is not None and self.status_code < 400
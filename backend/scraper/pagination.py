@@ -0,0 +1,157 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination on (field, id).
+
+    The field is the first field of the requested ?ordering=, or of the
+    model's Meta.ordering, with id as a tie-breaker in the same direction.
+    Each page is a range scan starting after the last row of the previous
+    page, so deep pages cost the same as the first and no COUNT(*) is run.
+    NULLs sort last in both directions. Pages only link forward.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, request, queryset, view):
+        """Return (field, descending) for the keyset."""
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        if not ordering:
+            ordering = queryset.model._meta.ordering or ['-pk']
+        field = ordering[0]
+        if field.startswith('-'):
+            return field[1:], True
+        return field, False
+
+    def encode_cursor(self, value, pk):
+        if isinstance(value, (datetime, date)):
+            # Full precision; DjangoJSONEncoder would truncate microseconds
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        payload = json.dumps([value, pk], separators=(',', ':')).encode()
+        return urlsafe_b64encode(payload).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            value, pk = json.loads(urlsafe_b64decode(padded.encode()))
+            return value, int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def seek_filter(self, field, descending, value, pk):
+        """Rows strictly after (value, pk) in the keyset order."""
+        after = '__lt' if descending else '__gt'
+        if value is None:
+            return Q(**{f'{field}__isnull': True, f'pk{after}': pk})
+        return (
+            Q(**{f'{field}{after}': value}) |
+            Q(**{field: value, f'pk{after}': pk}) |
+            Q(**{f'{field}__isnull': True})
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        self.field, descending = self.get_ordering(request, queryset, view)
+
+        if descending:
+            order = [F(self.field).desc(nulls_last=True), F('pk').desc()]
+        else:
+            order = [F(self.field).asc(nulls_last=True), F('pk').asc()]
+        queryset = queryset.order_by(*order)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            try:
+                queryset = queryset.filter(self.seek_filter(self.field, descending, *cursor))
+            except (TypeError, ValueError, ValidationError):
+                # Well-formed cursor with a value the field cannot hold
+                raise NotFound(self.invalid_cursor_message)
+
+        # Fetch one extra row to know whether there is a next page
+        rows = list(queryset[:self.page_size_value + 1])
+        self.has_next = len(rows) > self.page_size_value
+        self.page = rows[:self.page_size_value]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        cursor = self.encode_cursor(getattr(last, self.field), last.pk)
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class CustomPagination(PageNumberPagination):
+    """
+    Page number pagination that switches to KeysetPagination per request.
+
+    Pass ?pagination=cursor (or a ?cursor= from a previous keyset page) to
+    page by keyset instead of OFFSET/LIMIT with a COUNT(*).
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    mode_query_param = 'pagination'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (request.query_params.get(self.mode_query_param) == 'cursor' or
+                KeysetPagination.cursor_query_param in request.query_params):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
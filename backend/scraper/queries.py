@@ -0,0 +1,99 @@
+import math
+import re
+from typing import Dict, Any, Optional
+from urllib.parse import urlparse, parse_qs, unquote_plus
+from .geo import Bounds
+
+# "@30.2672,-97.7431,12z" viewport segment of a Maps URL
+_VIEWPORT_RE = re.compile(r'@(-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?)(?:,(\d+(?:\.\d+)?)z)?')
+_TOKEN_RE = re.compile(r'[^\w]+', re.UNICODE)
+
+# Text search location bias is capped at 50 km by the Places API
+MAX_BIAS_RADIUS = 50000
+
+
+def is_maps_url(query: str) -> bool:
+    """Return True if the query looks like a Google Maps URL."""
+    return 'google.com/maps' in query or 'maps.google.' in query
+
+
+def parse_maps_url(url: str) -> Optional[Dict[str, Any]]:
+    """
+    Extract the search text and viewport from a Google Maps URL.
+
+    Understands /maps/search/<text>/@lat,lng,zoomz, /maps/place/<name>/...
+    and ?q=<text> style URLs.
+
+    Returns:
+        Dict with 'query' and, when the URL has a viewport, 'latitude',
+        'longitude' and 'zoom'; None if no search text could be found
+    """
+    parsed = urlparse(url if '://' in url else 'https://' + url)
+    segments = [segment for segment in parsed.path.split('/') if segment]
+
+    text = None
+    for marker in ('search', 'place'):
+        if marker in segments:
+            index = segments.index(marker) + 1
+            if index < len(segments) and not segments[index].startswith('@'):
+                text = unquote_plus(segments[index])
+                break
+    if text is None:
+        params = parse_qs(parsed.query)
+        values = params.get('q') or params.get('query')
+        if values:
+            text = values[0]
+    if not text:
+        return None
+
+    result: Dict[str, Any] = {'query': text.strip()}
+    match = _VIEWPORT_RE.search(parsed.path)
+    if match:
+        result['latitude'] = float(match.group(1))
+        result['longitude'] = float(match.group(2))
+        result['zoom'] = float(match.group(3)) if match.group(3) else None
+    return result
+
+
+def viewport_radius(latitude: float, zoom: Optional[float]) -> int:
+    """Approximate radius in meters of a Maps viewport at the given zoom."""
+    if zoom is None:
+        return MAX_BIAS_RADIUS
+    # Web Mercator ground resolution (m/px) times half of a ~1024px wide map
+    meters_per_pixel = 156543.03392 * math.cos(math.radians(latitude)) / (2 ** zoom)
+    return max(1, min(MAX_BIAS_RADIUS, int(meters_per_pixel * 512)))
+
+
+def viewport_bounds(parsed: Dict[str, Any]) -> Optional[Bounds]:
+    """Bounding box of the viewport of a parsed Maps URL, if it has one."""
+    if 'latitude' not in parsed:
+        return None
+    radius = viewport_radius(parsed['latitude'], parsed['zoom'])
+    return Bounds.around(parsed['latitude'], parsed['longitude'], radius)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Build the cache key for a search query.
+
+    Case, punctuation, whitespace and token order are ignored, so
+    "Dentists in Austin, TX" and "austin tx  dentists in" share a key. Maps
+    URLs are reduced to their search text plus the viewport center rounded
+    to ~1 km, since the location biases which places are returned.
+    """
+    location = ''
+    if is_maps_url(query):
+        parsed = parse_maps_url(query)
+        if parsed:
+            query = parsed['query']
+            if 'latitude' in parsed:
+                location = f" @{parsed['latitude']:.2f},{parsed['longitude']:.2f}"
+
+    tokens = [token for token in _TOKEN_RE.split(query.casefold()) if token]
+    return (' '.join(sorted(tokens)) + location)[:255]
+
+
+def normalize_sweep(keyword: str, bounds: Bounds) -> str:
+    """Build the cache key for an area sweep (keyword plus bounds to ~100 m)."""
+    box = ','.join(f'{value:.3f}' for value in bounds)
+    return f'{normalize_query(keyword)} [{box}]'[:255]
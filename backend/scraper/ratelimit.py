@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+# Refills the bucket for the time elapsed since the last call, then takes
+# the requested tokens if there are enough. Returns the seconds to wait
+# before retrying (0 when the tokens were taken). The Redis clock is used so
+# every worker sees the same time.
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second up to `burst` tokens.
+
+    When the `alias` cache (`rate_limit` by default) is a RedisCache the
+    bucket state lives in Redis and is shared by every process and worker;
+    otherwise, or with alias=None, it is kept in memory and limits this
+    process only.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, alias: Optional[str] = 'rate_limit'):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.alias = alias
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._script = None
+
+    def _take_shared(self, cache: RedisCache, tokens: int) -> float:
+        if self._script is None:
+            self._script = cache._cache.get_client(write=True).register_script(_TAKE_SCRIPT)
+        key = cache.make_and_validate_key(f'bucket:{self.name}')
+        return float(self._script(keys=[key], args=[self.rate, self.burst, tokens]))
+
+    async def _atake_shared(self, cache: RedisCache, tokens: int) -> float:
+        # Through the cache's own client, so its OPTIONS, connection pool and
+        # server selection apply; off the event loop, and not queued behind
+        # the thread of sync_to_async's database calls
+        return await sync_to_async(self._take_shared, thread_sensitive=False)(cache, tokens)
+
+    def _take_local(self, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def try_acquire(self, tokens: int = 1) -> float:
+        """
+        Take tokens if available.
+
+        Returns:
+            0 if the tokens were taken, else the seconds until they will be
+        """
+        cache = caches[self.alias] if self.alias else None
+        if isinstance(cache, RedisCache):
+            return self._take_shared(cache, tokens)
+        return self._take_local(tokens)
+
+    async def atry_acquire(self, tokens: int = 1) -> float:
+        """try_acquire() for coroutines: the Redis script runs in a worker thread."""
+        cache = caches[self.alias] if self.alias else None
+        if isinstance(cache, RedisCache):
+            return await self._atake_shared(cache, tokens)
+        return self._take_local(tokens)
+
+    def acquire(self, tokens: int = 1) -> float:
+        """
+        Block until tokens are taken.
+
+        Returns:
+            Seconds spent waiting
+        """
+        started = time.monotonic()
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return time.monotonic() - started
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int = 1) -> float:
+        """
+        acquire() for coroutines: neither taking tokens nor the wait
+        blocks the event loop.
+
+        Returns:
+            Seconds spent waiting
+        """
+        started = time.monotonic()
+        while True:
+            wait = await self.atry_acquire(tokens)
+            if wait <= 0:
+                return time.monotonic() - started
+            await asyncio.sleep(wait)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(name: str) -> TokenBucket:
+    """Return the process-wide bucket configured in settings.GOOGLE_MAPS_RATE_LIMITS."""
+    with _buckets_lock:
+        bucket = _buckets.get(name)
+        if bucket is None:
+            limits = settings.GOOGLE_MAPS_RATE_LIMITS[name]
+            bucket = _buckets[name] = TokenBucket(name, limits['rate'], limits['burst'])
+        return bucket
@@ -0,0 +1,211 @@
+"""
+Incremental refresh of stored businesses.
+
+Each business remembers when its Google Maps details (phone, website) and
+its website contacts (email, social links) were last fetched. A sweep takes
+the stalest businesses in batches and refetches only the expired group:
+details with one Place Details call, contacts through the domain
+enrichment cache, whose expired entries are revalidated with conditional
+requests. Only fields whose value changed are written back, and only the
+groups actually fetched are marked fresh: a failed fetch is retried by the
+next sweep.
+"""
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce, Least
+from django.utils import timezone
+from .metrics import timed_stage
+from .models import Business, DERIVED_FIELDS, DERIVED_SOURCES
+from .services import DatabaseThreadPool, GoogleMapsService
+
+logger = logging.getLogger(__name__)
+
+# Fields refreshed by a Place Details call, and from the website
+DETAILS_REFRESH_FIELDS = ['phone', 'website']
+CONTACT_REFRESH_FIELDS = ['email', 'instagram_link', 'youtube_link', 'twitter_link', 'facebook_link']
+
+# Columns read to refresh a business
+REFRESH_READ_FIELDS = [
+    'id', 'place_id', 'details_fetched_at', 'contacts_fetched_at', 'created_at',
+    'latitude', 'longitude', *DETAILS_REFRESH_FIELDS, *CONTACT_REFRESH_FIELDS,
+]
+
+
+def refresh_ttl(fields: List[str]) -> timedelta:
+    """How long a group of fields stays fresh: its shortest PLACE_DETAILS_CACHE_TTLS entry."""
+    return timedelta(seconds=min(settings.PLACE_DETAILS_CACHE_TTLS[field] for field in fields))
+
+
+class RefreshOutcome(NamedTuple):
+    """Outcome of refreshing one business."""
+    # Fields whose value changed (possibly none), None if nothing could be
+    # fetched
+    changes: Optional[Dict[str, Any]]
+    # Whether the details and contacts were fetched, renewing their timestamps
+    details_fetched: bool = False
+    contacts_fetched: bool = False
+
+
+def due_businesses(now: Optional[datetime] = None):
+    """
+    Businesses with expired details (and a place ID to fetch them with) or
+    expired contacts (and a website to crawl), stalest first.
+    """
+    now = now or timezone.now()
+    details_cutoff = now - refresh_ttl(DETAILS_REFRESH_FIELDS)
+    contacts_cutoff = now - refresh_ttl(CONTACT_REFRESH_FIELDS)
+    return Business.objects.filter(
+        (
+            (Q(details_fetched_at__lt=details_cutoff) | Q(details_fetched_at__isnull=True)) &
+            Q(place_id__gt='')
+        ) | (
+            (Q(contacts_fetched_at__lt=contacts_cutoff) | Q(contacts_fetched_at__isnull=True)) &
+            Q(website__gt='')
+        )
+    ).annotate(
+        stalest=Least(
+            Coalesce('details_fetched_at', 'created_at'),
+            Coalesce('contacts_fetched_at', 'created_at')
+        )
+    ).order_by('stalest', 'id')
+
+
+def _refresh_one(
+    service: GoogleMapsService,
+    business: Business,
+    details_due: bool,
+    contacts_due: bool
+) -> RefreshOutcome:
+    """Refetch the expired fields of a business."""
+    fetched: Dict[str, Any] = {}
+    details_fetched = contacts_fetched = False
+    if details_due and business.place_id:
+        try:
+            details = service.fetch_place_details(business.place_id)
+        except Exception as e:
+            logger.warning('Refreshing details of %s failed: %s', business.place_id, e)
+            return RefreshOutcome(None)
+        details_fetched = True
+        # A field missing from the response is kept rather than erased
+        if details.get('formatted_phone_number'):
+            fetched['phone'] = details['formatted_phone_number']
+        if details.get('website'):
+            fetched['website'] = details['website']
+
+    website = fetched.get('website', business.website)
+    if website and (contacts_due or website != business.website):
+        contacts = service.enrich_website(website)
+        contacts_fetched = True
+        fetched.update(
+            (field, value) for field, value in contacts.items()
+            if field in CONTACT_REFRESH_FIELDS and value
+        )
+        if not business.phone and not fetched.get('phone') and contacts.get('phone'):
+            fetched['phone'] = contacts['phone']
+    if not (details_fetched or contacts_fetched):
+        return RefreshOutcome(None)
+
+    changes = {
+        field: value for field, value in fetched.items()
+        if (getattr(business, field) or None) != (value or None)
+    }
+    return RefreshOutcome(changes, details_fetched, contacts_fetched)
+
+
+def _write_changes(changed: List[Tuple[Business, Dict[str, Any]]], now: datetime) -> None:
+    """Bulk update each set of businesses sharing the same changed fields."""
+    by_fields = defaultdict(list)
+    for business, changes in changed:
+        for field, value in changes.items():
+            setattr(business, field, value)
+        business.set_derived_fields()
+        business.updated_at = now
+        by_fields[frozenset(changes)].append(business)
+    for fields, businesses in by_fields.items():
+        update_fields = [*fields, 'updated_at']
+        if DERIVED_SOURCES & fields:
+            update_fields += DERIVED_FIELDS
+        Business.objects.bulk_update(businesses, update_fields)
+
+
+def refresh_businesses(
+    limit: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    service: Optional[GoogleMapsService] = None
+) -> Dict[str, Any]:
+    """
+    Refresh the stalest businesses.
+
+    Args:
+        limit: Businesses checked at most (settings.BUSINESS_REFRESH_LIMIT)
+        batch_size: Businesses read and written per batch
+            (settings.BUSINESS_REFRESH_BATCH_SIZE); a batch is fetched
+            concurrently on the service's worker threads
+        service: Service making the API calls and website crawls
+
+    Returns:
+        Report: businesses checked, changed, unchanged and skipped (nothing
+        could be fetched), changes per field and API calls made
+    """
+    limit = limit or settings.BUSINESS_REFRESH_LIMIT
+    batch_size = batch_size or settings.BUSINESS_REFRESH_BATCH_SIZE
+    service = service or GoogleMapsService()
+    report = {'checked': 0, 'changed': 0, 'unchanged': 0, 'skipped': 0}
+    fields_changed: Counter = Counter()
+
+    # Position of the last business checked: rows that could not be fetched
+    # stay due, and the sweep moves on past them
+    after: Optional[Q] = None
+    with timed_stage('refresh'), DatabaseThreadPool(max_workers=service.max_workers) as executor:
+        while report['checked'] < limit:
+            now = timezone.now()
+            due_now = due_businesses(now)
+            if after is not None:
+                due_now = due_now.filter(after)
+            batch = list(due_now.only(*REFRESH_READ_FIELDS)[:min(batch_size, limit - report['checked'])])
+            if not batch:
+                break
+            last = batch[-1]
+            after = Q(stalest__gt=last.stalest) | Q(stalest=last.stalest, id__gt=last.id)
+            details_cutoff = now - refresh_ttl(DETAILS_REFRESH_FIELDS)
+            contacts_cutoff = now - refresh_ttl(CONTACT_REFRESH_FIELDS)
+            due = [
+                (
+                    business,
+                    business.details_fetched_at is None or business.details_fetched_at < details_cutoff,
+                    business.contacts_fetched_at is None or business.contacts_fetched_at < contacts_cutoff,
+                )
+                for business in batch
+            ]
+            outcomes = list(executor.map(lambda item: _refresh_one(service, *item), due))
+
+            changed = []
+            for business, (changes, _, _) in zip(batch, outcomes):
+                if changes is None:
+                    report['skipped'] += 1
+                elif changes:
+                    report['changed'] += 1
+                    fields_changed.update(changes.keys())
+                    changed.append((business, changes))
+                else:
+                    report['unchanged'] += 1
+            report['checked'] += len(batch)
+
+            with transaction.atomic():
+                _write_changes(changed, now)
+                Business.objects.filter(
+                    pk__in=[business.pk for business, outcome in zip(batch, outcomes) if outcome.details_fetched]
+                ).update(details_fetched_at=now)
+                Business.objects.filter(
+                    pk__in=[business.pk for business, outcome in zip(batch, outcomes) if outcome.contacts_fetched]
+                ).update(contacts_fetched_at=now)
+
+    report['fields_changed'] = dict(fields_changed)
+    report['api_calls'] = dict(service.api_calls)
+    logger.info('Refreshed businesses: %s', report)
+    return report
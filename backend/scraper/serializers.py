@@ -1,5 +1,10 @@
+import csv
+import io
+from django.conf import settings
 from rest_framework import serializers
-from .models import Search, Business
+from .models import Search, Business, SearchJob, SearchBatch, ApiUsage
+from .geo import Bounds
+from .queries import is_maps_url, normalize_query, parse_maps_url, viewport_bounds
 
 class SearchBasicSerializer(serializers.ModelSerializer):
     """Basic serializer for Search model without businesses field to avoid circular reference"""
@@ -29,8 +34,60 @@ class BusinessSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'uuid', 'created_at', 'updated_at']
 
+class BusinessReadSerializer(BusinessSerializer):
+    """
+    Read-only fast path of BusinessSerializer for list and detail responses.
+
+    Output is identical, but each row is built from a precomputed list of
+    converters instead of DRF's per-field attribute lookup machinery.
+    Expects search_history to be prefetched.
+    """
+    def _get_converters(self):
+        converters = getattr(self, '_converters', None)
+        if converters is None:
+            converters = []
+            for name, field in self.fields.items():
+                if type(field) in (serializers.CharField, serializers.EmailField,
+                                   serializers.URLField, serializers.IntegerField):
+                    # Model values are already str/int; skip to_representation
+                    converters.append((name, None))
+                else:
+                    converters.append((name, field.to_representation))
+            self._converters = converters
+        return converters
+
+    def to_representation(self, instance):
+        data = {}
+        for name, convert in self._get_converters():
+            value = getattr(instance, name)
+            if value is None or convert is None:
+                data[name] = value
+            else:
+                data[name] = convert(value)
+        return data
+
+
+class SearchListSerializer(serializers.ModelSerializer):
+    """Search without its results, for list responses"""
+    class Meta:
+        model = Search
+        fields = [
+            'id', 'query', 'timestamp', 'results_count',
+            'last_updated'
+        ]
+        read_only_fields = fields
+
+
+class ApiUsageSerializer(serializers.ModelSerializer):
+    """Google Maps API calls made for the user on one day"""
+    class Meta:
+        model = ApiUsage
+        fields = ['date', 'call', 'count']
+        read_only_fields = fields
+
+
 class SearchSerializer(serializers.ModelSerializer):
-    results = BusinessSerializer(many=True, read_only=True)
+    results = BusinessReadSerializer(many=True, read_only=True)
     
     class Meta:
         model = Search
@@ -38,4 +95,163 @@ class SearchSerializer(serializers.ModelSerializer):
             'id', 'query', 'timestamp', 'results_count', 
             'last_updated', 'results'
         ]
-        read_only_fields = ['id', 'timestamp', 'last_updated', 'results_count'] 
\ No newline at end of file
+        read_only_fields = ['id', 'timestamp', 'last_updated', 'results_count'] 
+
+class SearchJobSerializer(serializers.ModelSerializer):
+    """Status and progress of a background search job"""
+    class Meta:
+        model = SearchJob
+        fields = [
+            'id', 'search', 'kind', 'params', 'status', 'cache_status',
+            'places_found', 'details_fetched', 'emails_found', 'pages_fetched', 'tiles_searched',
+            'details_calls_saved', 'results_saved', 'error', 'created_at',
+            'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+
+class BatchJobSerializer(SearchJobSerializer):
+    """Job of one query of a batch"""
+    query = serializers.CharField(source='search.query', read_only=True)
+
+    class Meta(SearchJobSerializer.Meta):
+        fields = [
+            'id', 'search', 'query', 'status', 'cache_status', 'places_found',
+            'pages_fetched', 'results_saved', 'error', 'finished_at'
+        ]
+        read_only_fields = fields
+
+
+class SearchBatchSerializer(serializers.ModelSerializer):
+    """Status and progress of a batch of searches"""
+    class Meta:
+        model = SearchBatch
+        fields = [
+            'id', 'status', 'queries_total', 'queries_searched', 'places_found',
+            'details_fetched', 'pages_fetched', 'details_calls_saved', 'results_saved',
+            'error', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+
+class SearchBatchDetailSerializer(SearchBatchSerializer):
+    """Batch with the job of each of its queries; expects jobs__search to be prefetched"""
+    jobs = BatchJobSerializer(many=True, read_only=True)
+
+    class Meta(SearchBatchSerializer.Meta):
+        fields = SearchBatchSerializer.Meta.fields + ['jobs']
+        read_only_fields = fields
+
+
+class SearchBatchCreateSerializer(serializers.Serializer):
+    """
+    Input of a batch: a list of queries, or a CSV file with one query per row
+    (the "query" column if the file has a header with one, else the first)
+    """
+    queries = serializers.ListField(
+        child=serializers.CharField(max_length=255, allow_blank=True),
+        required=False
+    )
+    file = serializers.FileField(required=False)
+
+    def validate(self, attrs):
+        if attrs.get('file') is not None:
+            queries = self._read_csv(attrs['file'])
+        elif attrs.get('queries') is not None:
+            queries = attrs['queries']
+        else:
+            raise serializers.ValidationError('Provide queries or a CSV file.')
+
+        # Equivalent queries would only fetch the same results again
+        unique = {}
+        for query in queries:
+            query = query.strip()
+            if query:
+                unique.setdefault(normalize_query(query), query)
+        if not unique:
+            raise serializers.ValidationError('No queries given.')
+        if len(unique) > settings.SEARCH_BATCH_MAX_QUERIES:
+            raise serializers.ValidationError(
+                f'At most {settings.SEARCH_BATCH_MAX_QUERIES} queries per batch.'
+            )
+        attrs['queries'] = list(unique.values())
+        return attrs
+
+    @staticmethod
+    def _read_csv(file):
+        try:
+            text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+            rows = [row for row in csv.reader(text) if row]
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise serializers.ValidationError({'file': f'Not a UTF-8 CSV file: {e}'})
+        column = 0
+        if rows:
+            header = [cell.strip().lower() for cell in rows[0]]
+            if 'query' in header:
+                column = header.index('query')
+                rows = rows[1:]
+        queries = [row[column] if column < len(row) else '' for row in rows]
+        too_long = next((query for query in queries if len(query.strip()) > 255), None)
+        if too_long is not None:
+            raise serializers.ValidationError({'file': f'Query longer than 255 characters: {too_long[:50]}...'})
+        return queries
+
+
+class SweepSerializer(serializers.Serializer):
+    """Input for an area sweep: a keyword plus bounds or a Maps URL viewport"""
+    keyword = serializers.CharField(max_length=200, required=False)
+    url = serializers.CharField(required=False)
+    south = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    west = serializers.FloatField(required=False, min_value=-180, max_value=180)
+    north = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    east = serializers.FloatField(required=False, min_value=-180, max_value=180)
+
+    def validate(self, attrs):
+        corners = [attrs.get(name) for name in ('south', 'west', 'north', 'east')]
+        if all(value is not None for value in corners):
+            bounds = Bounds(*corners)
+        elif attrs.get('url') and is_maps_url(attrs['url']):
+            parsed = parse_maps_url(attrs['url'])
+            bounds = viewport_bounds(parsed) if parsed else None
+            if bounds is None:
+                raise serializers.ValidationError({
+                    'url': 'Maps URL has no viewport (@lat,lng,zoom).'
+                })
+            attrs.setdefault('keyword', parsed['query'])
+        else:
+            raise serializers.ValidationError(
+                'Provide south, west, north and east, or a Google Maps URL.'
+            )
+        if bounds.south >= bounds.north or bounds.west >= bounds.east:
+            raise serializers.ValidationError('Bounds must have south < north and west < east.')
+        if not attrs.get('keyword'):
+            raise serializers.ValidationError({'keyword': 'This field is required.'})
+        attrs['bounds'] = bounds
+        return attrs
+
+
+class WithinSerializer(serializers.Serializer):
+    """Query parameters of a bounding box lookup"""
+    south = serializers.FloatField(min_value=-90, max_value=90)
+    west = serializers.FloatField(min_value=-180, max_value=180)
+    north = serializers.FloatField(min_value=-90, max_value=90)
+    east = serializers.FloatField(min_value=-180, max_value=180)
+    limit = serializers.IntegerField(default=100, min_value=1, max_value=1000)
+
+    def validate(self, attrs):
+        bounds = Bounds(attrs['south'], attrs['west'], attrs['north'], attrs['east'])
+        if bounds.south >= bounds.north or bounds.west >= bounds.east:
+            raise serializers.ValidationError('Bounds must have south < north and west < east.')
+        attrs['bounds'] = bounds
+        return attrs
+
+
+class NearbySerializer(serializers.Serializer):
+    """Query parameters of a radius lookup"""
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+    radius = serializers.FloatField(
+        default=1000, min_value=1, max_value=50000,
+        help_text='Search radius in meters'
+    )
+    limit = serializers.IntegerField(default=100, min_value=1, max_value=1000)
@@ -1,108 +1,894 @@
 import os
-import re
+import time
+import logging
+import threading
 import requests
 import googlemaps
-from typing import List, Dict, Any, Optional
+from collections import Counter
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, NamedTuple, Optional, Callable, Tuple
 from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from .models import Search, Business, ApiUsage
+from .cache import DETAILS_FIELDS, PlaceDetailsCache, fetch_stamps, get_details_cache
+from .queries import is_maps_url, parse_maps_url, viewport_radius
+from .geo import Bounds
+from .ratelimit import TokenBucket, get_bucket
+from .metrics import API_CALLS, ROWS_WRITTEN, ContextThreadPool, observe_stage, timed_stage
+from .crawler import ContactCrawler
+from .extract import social_link_field
+from .enrichment import ENRICHMENT_FIELDS, DomainEnrichmentCache, get_enrichment_cache
+
+logger = logging.getLogger(__name__)
+
+# Attempts at fetching a page whose next_page_token is not active yet
+PAGE_TOKEN_RETRIES = 3
+
+# Business fields refreshed when a fetched place already exists. The origin
+# search, uuid and created_at of an existing row are kept.
+UPSERT_FIELDS = [
+    'name', 'website', 'address', 'category', 'rating', 'reviews_count',
+    'latitude', 'longitude', 'geohash', 'website_domain', 'updated_at',
+]
+
+# When a business's details and contacts were fetched. Served from the
+# details cache they keep the age of the cached fields, and a failed crawl
+# has none, so they only move an existing row's stamps forward.
+FETCH_STAMP_FIELDS = ['details_fetched_at', 'contacts_fetched_at']
+
+# Contacts a search can miss on a place it found before (crawl timeout,
+# empty page). They only overwrite stored contacts when found, so a failed
+# crawl never erases an email or social link.
+CONTACT_FIELDS = ['email', 'phone', 'instagram_link', 'youtube_link', 'twitter_link', 'facebook_link']
+
+# Rate limit bucket (settings.GOOGLE_MAPS_RATE_LIMITS) of each API call
+API_BUCKETS = {
+    'places': 'text_search',
+    'places_nearby': 'text_search',
+    'place': 'details',
+}
+
+
+class BatchQueryResult(NamedTuple):
+    """Outcome of one query of GoogleMapsService.search_batch()."""
+    # Business details, in the order Google Maps ranked them
+    businesses: List[Dict[str, Any]]
+    pages: int
+    # Set when the query's search or one of its places failed
+    error: Optional[str] = None
+
+
+class DatabaseThreadPool(ContextThreadPool):
+    """
+    Thread pool closing its threads' database connections once, on
+    shutdown. Django only closes the main thread's connections, and opening
+    one per query on the workers would cost a connection setup per place.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self._thread_connections: List = []
+        super().__init__(max_workers=max_workers, initializer=self._track_connections)
+
+    def _track_connections(self):
+        # The worker thread's own connection wrappers; nothing is opened yet
+        self._thread_connections.extend(connections.all())
+
+    def shutdown(self, wait: bool = True, **kwargs):
+        super().shutdown(wait, **kwargs)
+        if not wait:
+            return
+        # Every worker has exited, so its connections are closed from here
+        for connection in self._thread_connections:
+            connection.inc_thread_sharing()
+            try:
+                connection.close()
+            finally:
+                connection.dec_thread_sharing()
+        self._thread_connections.clear()
+
+
+_maps_client = None
+_maps_client_lock = threading.Lock()
+
+
+def build_maps_client(key: Optional[str] = None, base_url: Optional[str] = None) -> googlemaps.Client:
+    """
+    Create a Google Maps client.
+
+    Its session keeps a connection pool sized for the worker threads. The
+    client's own per-process throttle is set above the combined bucket
+    rates, so the shared token buckets in scraper.ratelimit decide the pace.
+
+    Args:
+        key: API key, GOOGLE_MAPS_API_KEY by default
+        base_url: API root, e.g. a local stand-in (see scraper.benchmark)
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.GOOGLE_MAPS_MAX_WORKERS * 2)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    options = {'base_url': base_url} if base_url else {}
+    return googlemaps.Client(
+        key=key or os.getenv('GOOGLE_MAPS_API_KEY'),
+        requests_session=session,
+        queries_per_second=int(sum(
+            limits['rate'] for limits in settings.GOOGLE_MAPS_RATE_LIMITS.values()
+        )) + 1,
+        retry_over_query_limit=True,
+        **options
+    )
+
+
+def get_maps_client() -> googlemaps.Client:
+    """Return the process-wide Google Maps client."""
+    global _maps_client
+    with _maps_client_lock:
+        if _maps_client is None:
+            _maps_client = build_maps_client()
+        return _maps_client
+
 
 class GoogleMapsService:
     """Service class for interacting with Google Maps API."""
     
-    def __init__(self):
-        """Initialize the Google Maps client."""
-        self.client = googlemaps.Client(key=os.getenv('GOOGLE_MAPS_API_KEY'))
-    
-    def extract_email_from_website(self, website_url: str) -> Optional[str]:
-        """Extract email from website content."""
-        if not website_url:
-            return None
-            
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        details_cache: Optional[PlaceDetailsCache] = None,
+        client: Optional[googlemaps.Client] = None,
+        buckets: Optional[Dict[str, TokenBucket]] = None,
+        crawler: Optional[ContactCrawler] = None,
+        enrichment: Optional[DomainEnrichmentCache] = None
+    ):
+        """
+        Initialize the Google Maps service.
+
+        Args:
+            max_workers: Number of places fetched concurrently (details call
+                plus website scrape). Defaults to settings.GOOGLE_MAPS_MAX_WORKERS;
+                1 fetches places serially.
+            details_cache: Cache consulted before each details call. Defaults
+                to the process-wide cache from get_details_cache().
+            client: Google Maps client. Defaults to the process-wide client
+                from get_maps_client().
+            buckets: Rate limit buckets by name (see API_BUCKETS). Defaults
+                to the shared buckets from ratelimit.get_bucket().
+            crawler: Website crawler used to find emails. Defaults to a
+                ContactCrawler on the process-wide session and thread pool.
+            enrichment: Domain cache consulted before crawling a website.
+                Defaults to the process-wide cache from
+                get_enrichment_cache(), or one around `crawler` if given.
+        """
+        self.client = client or get_maps_client()
+        self.buckets = buckets
+        if enrichment is None:
+            enrichment = DomainEnrichmentCache(crawler) if crawler else get_enrichment_cache()
+        self.enrichment = enrichment
+        self.crawler = enrichment.crawler
+        self.max_workers = max_workers or settings.GOOGLE_MAPS_MAX_WORKERS
+        self.details_cache = details_cache or get_details_cache()
+        self.pages_fetched = 0
+        self.tiles_searched = 0
+        self.details_calls_saved = 0
+        # API calls made, per call type, and seconds spent waiting for tokens
+        self.api_calls: Counter = Counter()
+        self.rate_limit_wait = 0.0
+        # Latency of every outbound call made by this service instance
+        self.call_timings: List[Dict[str, Any]] = []
+        self._timings_lock = threading.Lock()
+
+    def _timed(self, call: str, target: str, func: Callable, *args, **kwargs):
+        """Run func and record how long the call took in call_timings."""
+        started = time.perf_counter()
         try:
-            # Add http:// if not present
-            if not website_url.startswith(('http://', 'https://')):
-                website_url = 'https://' + website_url
-                
-            response = requests.get(website_url, timeout=10)
-            if response.status_code != 200:
-                return None
-                
-            # Find email using regex
-            email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-            emails = re.findall(email_pattern, response.text)
-            
-            # Filter out common false positives
-            filtered_emails = [
-                email for email in emails 
-                if not any(false_positive in email.lower() 
-                          for false_positive in ['example.com', 'domain.com'])
-            ]
-            
-            return filtered_emails[0] if filtered_emails else None
-            
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            observe_stage(call, elapsed)
+            with self._timings_lock:
+                self.call_timings.append({
+                    'call': call,
+                    'target': target,
+                    'seconds': round(elapsed, 4),
+                })
+            logger.debug('%s %s took %.3fs', call, target, elapsed)
+
+    def _api_call(self, call: str, target: str, func: Callable, *args, **kwargs):
+        """Wait for a rate limit token, then make a timed, counted API call."""
+        name = API_BUCKETS[call]
+        bucket = self.buckets[name] if self.buckets is not None else get_bucket(name)
+        waited = bucket.acquire()
+        observe_stage('rate_limit_wait', waited)
+        with self._timings_lock:
+            self.api_calls[call] += 1
+            self.rate_limit_wait += waited
+        try:
+            result = self._timed(call, target, func, *args, **kwargs)
         except Exception:
-            return None
+            API_CALLS.labels(call, 'error').inc()
+            raise
+        API_CALLS.labels(call, 'ok').inc()
+        return result
+
+    def latency_summary(self) -> Dict[str, Dict[str, float]]:
+        """Aggregate call_timings per call type (count, total, max, avg seconds)."""
+        with self._timings_lock:
+            return summarize_timings(list(self.call_timings))
     
-    def search_places(self, query: str) -> List[Dict[str, Any]]:
+    def enrich_website(self, website_url: str) -> Dict[str, Optional[str]]:
+        """
+        Email and social links found on a website, through the domain cache.
+
+        Returns:
+            A value (possibly None) for each of enrichment.ENRICHMENT_FIELDS
+        """
+        if not website_url:
+            return dict.fromkeys(ENRICHMENT_FIELDS)
+        return self._timed('scrape', website_url, self.enrichment.lookup, website_url)
+
+    def extract_email_from_website(self, website_url: str) -> Optional[str]:
+        """Find a contact email on a website: its homepage, then likely contact pages."""
+        return self.enrich_website(website_url)['email']
+
+    def search_places(
+        self,
+        query: str,
+        max_workers: Optional[int] = None,
+        progress: Optional[Callable[[int, int, int], None]] = None,
+        max_pages: Optional[int] = None,
+        on_results: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+    ) -> List[Dict[str, Any]]:
         """
         Search for places using the provided query.
         
+        Follows next_page_token up to max_pages. Details lookups and website
+        scrapes run on a bounded thread pool, so a page's details are fetched
+        while the token for the next page activates. Results are returned in
+        the order Google Maps ranked them; pages_fetched is set afterwards.
+
         Args:
             query: Search query string or Google Maps URL
+            max_workers: Override the instance worker count for this search
+            progress: Called as progress(fetched, total, pages) from the
+                calling thread after each page and each fetched place
+            max_pages: Override settings.GOOGLE_MAPS_MAX_PAGES
+            on_results: Called with the businesses just fetched, in
+                completion order, from the calling thread before progress
         
         Returns:
             List of business details
         """
-        # Extract query from Google Maps URL if provided
-        if 'google.com/maps' in query:
-            # TODO: Implement URL parsing logic
-            pass
-        
-        # Perform the search
-        places_result = self.client.places(query)
-        businesses = []
-        
-        for place in places_result.get('results', []):
-            # Get detailed information for each place
-            place_details = self.client.place(place['place_id'])['result']
-            
-            website = place_details.get('website', '')
-            email = self.extract_email_from_website(website)
-            
-            # Extract social media links if available in the place details
-            social_links = {
-                'instagram_link': None,
-                'youtube_link': None,
-                'twitter_link': None,
-                'facebook_link': None
-            }
-            
-            # Check for social media in website or other URLs
-            if website:
-                website_lower = website.lower()
-                if 'instagram.com' in website_lower:
-                    social_links['instagram_link'] = website
-                elif 'youtube.com' in website_lower or 'youtu.be' in website_lower:
-                    social_links['youtube_link'] = website
-                elif 'twitter.com' in website_lower or 'x.com' in website_lower:
-                    social_links['twitter_link'] = website
-                elif 'facebook.com' in website_lower:
-                    social_links['facebook_link'] = website
-            
-            business = {
-                'name': place.get('name', ''),
-                'place_id': place['place_id'],
-                'address': place.get('formatted_address', ''),
-                'phone': place_details.get('formatted_phone_number', ''),
-                'website': website,
-                'email': email,
-                'rating': place.get('rating'),
-                'reviews_count': place.get('user_ratings_total', 0),
-                'latitude': place['geometry']['location']['lat'],
-                'longitude': place['geometry']['location']['lng'],
-                'category': place.get('types', [])[0] if place.get('types') else None,
-                **social_links  # Include social media links
+        query, search_kwargs = self._text_search_args(query)
+        workers = max(1, max_workers or self.max_workers)
+        max_pages = max_pages or settings.GOOGLE_MAPS_MAX_PAGES
+        self.pages_fetched = 0
+        seen_place_ids = set()
+        futures = []
+        pending = set()
+        fetched = 0
+
+        def report():
+            if progress:
+                progress(fetched, len(futures), self.pages_fetched)
+
+        def drain(timeout: Optional[float] = None):
+            """Wait for pending places, reporting progress, for up to timeout seconds."""
+            nonlocal pending, fetched
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                fetched += len(done)
+                if on_results:
+                    on_results(_completed(done))
+                report()
+            if deadline is not None:
+                time.sleep(max(0.0, deadline - time.monotonic()))
+
+        with DatabaseThreadPool(max_workers=workers) as executor:
+            # Perform the search
+            places_result = self._api_call('places', query, self.client.places, query, **search_kwargs)
+            while True:
+                self.pages_fetched += 1
+                for place in places_result.get('results', []):
+                    if place['place_id'] in seen_place_ids:
+                        continue
+                    seen_place_ids.add(place['place_id'])
+                    future = executor.submit(self._fetch_business, place)
+                    futures.append(future)
+                    pending.add(future)
+                report()
+
+                page_token = places_result.get('next_page_token')
+                if not page_token or self.pages_fetched >= max_pages:
+                    break
+                # The token only becomes valid after a short delay; fetch this
+                # page's details in the meantime instead of sleeping
+                drain(timeout=settings.GOOGLE_MAPS_PAGE_TOKEN_DELAY)
+                places_result = self._next_page(
+                    'places', self.client.places, f'{query} (page {self.pages_fetched + 1})',
+                    page_token, query=query
+                )
+
+            drain()
+            # Collect in submission order; re-raises the first failure
+            businesses = [future.result() for future in futures]
+
+        logger.info(
+            'search_places(%r): %d results from %d pages with %d workers, latency %s, details cache %s',
+            query, len(businesses), self.pages_fetched, workers, self.latency_summary(),
+            self.details_cache.stats()
+        )
+        return businesses
+
+    @staticmethod
+    def _text_search_args(query: str) -> Tuple[str, Dict[str, Any]]:
+        """Text search query and location bias, taken from a Google Maps URL if given one."""
+        search_kwargs = {}
+        if is_maps_url(query):
+            parsed = parse_maps_url(query)
+            if parsed:
+                query = parsed['query']
+                if 'latitude' in parsed:
+                    # Bias results towards the area the URL was showing
+                    search_kwargs['location'] = (parsed['latitude'], parsed['longitude'])
+                    search_kwargs['radius'] = viewport_radius(parsed['latitude'], parsed['zoom'])
+        return query, search_kwargs
+
+    def _list_places(self, query: str, max_pages: int) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Read up to max_pages text search result pages of a query.
+
+        Returns:
+            Tuple of (places without duplicates, in rank order, pages fetched)
+        """
+        query, search_kwargs = self._text_search_args(query)
+        result = self._api_call('places', query, self.client.places, query, **search_kwargs)
+        places = {}
+        pages = 1
+        while True:
+            for place in result.get('results', []):
+                places.setdefault(place['place_id'], place)
+            page_token = result.get('next_page_token')
+            if not page_token or pages >= max_pages:
+                break
+            time.sleep(settings.GOOGLE_MAPS_PAGE_TOKEN_DELAY)
+            result = self._next_page(
+                'places', self.client.places, f'{query} (page {pages + 1})', page_token, query=query
+            )
+            pages += 1
+        return list(places.values()), pages
+
+    def search_batch(
+        self,
+        queries: List[str],
+        max_workers: Optional[int] = None,
+        progress: Optional[Callable[[int, int, int, int], None]] = None,
+        listed: Optional[Callable[[int, int, int], None]] = None,
+        max_pages: Optional[int] = None
+    ) -> List[BatchQueryResult]:
+        """
+        Run many text searches as one job.
+
+        Queries are searched concurrently, all their pages each. Places are
+        deduplicated by place_id across every query as listings come in, so
+        a place found by several queries costs one details call and one
+        website crawl; details_calls_saved counts the calls skipped. A
+        failing query (or a failed place in it) fails that query only.
+        pages_fetched and details_calls_saved are set afterwards.
+
+        Args:
+            queries: Search query strings or Google Maps URLs
+            max_workers: Override the instance worker count for this batch
+            progress: Called as progress(searched, fetched, total, pages)
+                from the calling thread after each query is listed and each
+                place is fetched
+            listed: Called as listed(index, places, pages) from the calling
+                thread once the query at index has been listed
+            max_pages: Override settings.GOOGLE_MAPS_MAX_PAGES
+
+        Returns:
+            A BatchQueryResult per query, in the order of queries
+        """
+        workers = max(1, max_workers or self.max_workers)
+        max_pages = max_pages or settings.GOOGLE_MAPS_MAX_PAGES
+        self.pages_fetched = 0
+        self.details_calls_saved = 0
+        listings: List[Optional[List[str]]] = [None] * len(queries)
+        pages: List[int] = [0] * len(queries)
+        errors: List[Optional[str]] = [None] * len(queries)
+        details_futures: Dict[str, Future] = {}
+        pending = set()
+        searched = 0
+        fetched = 0
+
+        with ContextThreadPool(max_workers=workers) as search_executor, \
+                DatabaseThreadPool(max_workers=workers) as details_executor:
+            search_futures = {
+                search_executor.submit(self._list_places, query, max_pages): index
+                for index, query in enumerate(queries)
             }
-            
-            businesses.append(business)
-        
-        return businesses 
\ No newline at end of file
+            while search_futures or pending:
+                done, _ = wait(set(search_futures) | pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future not in search_futures:
+                        pending.discard(future)
+                        fetched += 1
+                        continue
+
+                    index = search_futures.pop(future)
+                    searched += 1
+                    try:
+                        places, pages[index] = future.result()
+                    except Exception as e:
+                        logger.warning('Batch query %r failed: %s', queries[index], e)
+                        errors[index] = str(e) or e.__class__.__name__
+                        continue
+                    self.pages_fetched += pages[index]
+                    for place in places:
+                        if place['place_id'] in details_futures:
+                            self.details_calls_saved += 1
+                            continue
+                        details_future = details_executor.submit(self._fetch_business, place)
+                        details_futures[place['place_id']] = details_future
+                        pending.add(details_future)
+                    listings[index] = [place['place_id'] for place in places]
+                    if listed:
+                        listed(index, len(places), pages[index])
+
+                if progress:
+                    progress(searched, fetched, len(details_futures), self.pages_fetched)
+
+        results = []
+        for index, place_ids in enumerate(listings):
+            if place_ids is None:
+                results.append(BatchQueryResult([], pages[index], errors[index]))
+                continue
+            try:
+                businesses = [details_futures[place_id].result() for place_id in place_ids]
+            except Exception as e:
+                logger.warning('Fetching a place of batch query %r failed: %s', queries[index], e)
+                results.append(BatchQueryResult([], pages[index], str(e) or e.__class__.__name__))
+                continue
+            results.append(BatchQueryResult(businesses, pages[index]))
+
+        logger.info(
+            'search_batch(%d queries): %d places from %d pages, %d details calls saved, '
+            '%d queries failed, latency %s, details cache %s',
+            len(queries), len(details_futures), self.pages_fetched, self.details_calls_saved,
+            sum(result.error is not None for result in results), self.latency_summary(),
+            self.details_cache.stats()
+        )
+        return results
+
+    def _next_page(
+        self, call: str, search_func: Callable, target: str, page_token: str, **kwargs
+    ) -> Dict[str, Any]:
+        """Fetch the next page of a search, retrying while the token activates."""
+        for attempt in range(PAGE_TOKEN_RETRIES):
+            try:
+                return self._api_call(call, target, search_func, page_token=page_token, **kwargs)
+            except googlemaps.exceptions.ApiError as e:
+                if e.status != 'INVALID_REQUEST' or attempt == PAGE_TOKEN_RETRIES - 1:
+                    raise
+                time.sleep(settings.GOOGLE_MAPS_PAGE_TOKEN_DELAY / 2)
+
+    def search_area(
+        self,
+        keyword: str,
+        bounds: Bounds,
+        max_workers: Optional[int] = None,
+        progress: Optional[Callable[[int, int, int], None]] = None,
+        on_results: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Sweep a bounding box for places matching a keyword.
+
+        The box is split into a GOOGLE_MAPS_SWEEP_GRID x GOOGLE_MAPS_SWEEP_GRID
+        grid of tiles searched in parallel with a nearby search. Tiles that
+        fill a whole result page are split into quarters, down to
+        GOOGLE_MAPS_SWEEP_MAX_DEPTH, where all their pages are read instead.
+        Places are deduplicated by place_id as tiles come in, before any
+        details call; tiles_searched, pages_fetched and details_calls_saved
+        are set afterwards.
+
+        Args:
+            keyword: Term to search for, e.g. "dentist"
+            bounds: Area to cover
+            max_workers: Override the instance worker count for this sweep
+            progress: Called as progress(fetched, total, pages) from the
+                calling thread after each tile and each fetched place
+            on_results: Called with the businesses just fetched, as in
+                search_places()
+
+        Returns:
+            List of business details for places inside bounds
+        """
+        workers = max(1, max_workers or self.max_workers)
+        max_depth = settings.GOOGLE_MAPS_SWEEP_MAX_DEPTH
+        self.pages_fetched = 0
+        self.tiles_searched = 0
+        self.details_calls_saved = 0
+        seen_place_ids = set()
+        futures = []
+        pending = set()
+        fetched = 0
+
+        with ContextThreadPool(max_workers=workers) as tile_executor, \
+                DatabaseThreadPool(max_workers=workers) as details_executor:
+            tile_futures = {}
+
+            def search_tile(tile: Bounds, depth: int):
+                future = tile_executor.submit(self._search_tile, keyword, tile, depth >= max_depth)
+                tile_futures[future] = (tile, depth)
+
+            for tile in bounds.split(settings.GOOGLE_MAPS_SWEEP_GRID):
+                search_tile(tile, 0)
+
+            while tile_futures or pending:
+                done, _ = wait(set(tile_futures) | pending, return_when=FIRST_COMPLETED)
+                if on_results:
+                    on_results(_completed(done & pending))
+                for future in done:
+                    if future not in tile_futures:
+                        pending.discard(future)
+                        fetched += 1
+                        continue
+
+                    tile, depth = tile_futures.pop(future)
+                    places, pages, dense = future.result()
+                    self.tiles_searched += 1
+                    self.pages_fetched += pages
+                    if dense and depth < max_depth:
+                        for sub_tile in tile.split(2):
+                            search_tile(sub_tile, depth + 1)
+
+                    for place in places:
+                        location = place['geometry']['location']
+                        if not bounds.contains(location['lat'], location['lng']):
+                            continue
+                        if place['place_id'] in seen_place_ids:
+                            self.details_calls_saved += 1
+                            continue
+                        seen_place_ids.add(place['place_id'])
+                        details_future = details_executor.submit(self._fetch_business, place)
+                        futures.append(details_future)
+                        pending.add(details_future)
+
+                if progress:
+                    progress(fetched, len(futures), self.pages_fetched)
+
+            # Collect in discovery order; re-raises the first failure
+            businesses = [future.result() for future in futures]
+
+        logger.info(
+            'search_area(%r, %s): %d results from %d tiles (%d pages), %d details calls saved, '
+            'latency %s, details cache %s',
+            keyword, tuple(bounds), len(businesses), self.tiles_searched, self.pages_fetched,
+            self.details_calls_saved, self.latency_summary(), self.details_cache.stats()
+        )
+        return businesses
+
+    def _search_tile(self, keyword: str, tile: Bounds, follow_pages: bool):
+        """
+        Run a nearby search covering one tile.
+
+        Returns:
+            Tuple of (places, pages fetched, whether the tile had more results)
+        """
+        lat, lng = tile.center
+        kwargs = {'location': (lat, lng), 'radius': int(min(tile.radius, 50000)), 'keyword': keyword}
+        target = f'{keyword} @{lat:.4f},{lng:.4f}'
+        result = self._api_call('places_nearby', target, self.client.places_nearby, **kwargs)
+        places = list(result.get('results', []))
+        pages = 1
+
+        if follow_pages:
+            # Smallest tile size reached: read the remaining pages instead of splitting
+            while result.get('next_page_token') and pages < settings.GOOGLE_MAPS_MAX_PAGES:
+                time.sleep(settings.GOOGLE_MAPS_PAGE_TOKEN_DELAY)
+                result = self._next_page(
+                    'places_nearby', self.client.places_nearby, f'{target} (page {pages + 1})',
+                    result['next_page_token']
+                )
+                places.extend(result.get('results', []))
+                pages += 1
+
+        return places, pages, bool(result.get('next_page_token'))
+
+    def _fetch_business(self, place: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Fetch details and scrape the website for a single search result.
+
+        Only the fields expired from the details cache are fetched again:
+        the details call is skipped while phone and website are fresh, the
+        website scrape while the email and social links are. The business
+        gets the fetch times of its fields (cache.fetch_stamps).
+        """
+        business = place_fields(place)
+        cached = self.details_cache.get(place['place_id'])
+        business.update(cached.fields)
+        if not cached.expired:
+            business.update(fetch_stamps(cached.fetched_at))
+            return business
+
+        if cached.needs_details_call:
+            place_details = self.fetch_place_details(place['place_id'])
+        else:
+            place_details = cached.place_details()
+        if cached.needs_crawl:
+            contacts = self.enrich_website(place_details.get('website', ''))
+        else:
+            contacts = cached.contacts()
+        fetched = contact_fields_of(place_details, contacts)
+        refreshed = {field: fetched.get(field) for field in cached.expired}
+        refreshed_at = cached.refetch_times(place_details.get('website', ''), contacts)
+        business.update(refreshed)
+        business.update(fetch_stamps({**cached.fetched_at, **refreshed_at}))
+        self.details_cache.set(place['place_id'], refreshed, refreshed_at)
+        return business
+
+    def fetch_place_details(self, place_id: str) -> Dict[str, Any]:
+        """Place Details result for a place, limited to the fields we store."""
+        return self._api_call(
+            'place', place_id, self.client.place, place_id, fields=DETAILS_FIELDS
+        )['result']
+
+
+def summarize_timings(timings: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Aggregate call timings per call type (count, total, max, avg seconds)."""
+    summary: Dict[str, Dict[str, float]] = {}
+    for timing in timings:
+        stats = summary.setdefault(timing['call'], {'count': 0, 'total': 0.0, 'max': 0.0})
+        stats['count'] += 1
+        stats['total'] += timing['seconds']
+        stats['max'] = max(stats['max'], timing['seconds'])
+    for stats in summary.values():
+        stats['avg'] = round(stats['total'] / stats['count'], 4)
+        stats['total'] = round(stats['total'], 4)
+    return summary
+
+
+def place_fields(place: Dict[str, Any]) -> Dict[str, Any]:
+    """Business fields that come with a search result."""
+    return {
+        'name': place.get('name', ''),
+        'place_id': place['place_id'],
+        # Nearby search results only carry the short 'vicinity' address
+        'address': place.get('formatted_address') or place.get('vicinity', ''),
+        'rating': place.get('rating'),
+        'reviews_count': place.get('user_ratings_total', 0),
+        'latitude': place['geometry']['location']['lat'],
+        'longitude': place['geometry']['location']['lng'],
+        'category': place.get('types', [])[0] if place.get('types') else None,
+    }
+
+
+def contact_fields_of(place_details: Dict[str, Any], contacts: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    """
+    Details-only business fields, from a Place Details result and the
+    contacts found on the place's website (DomainEnrichmentCache.lookup()).
+    """
+    website = place_details.get('website', '')
+    contacts = dict(contacts)
+
+    # A website that is itself a social media profile wins over the
+    # profiles linked from the site
+    field = social_link_field(website) if website else None
+    if field:
+        contacts[field] = website
+
+    # The listing's phone number wins over one found on the website
+    phone = contacts.pop('phone')
+    return {
+        'phone': place_details.get('formatted_phone_number') or phone or '',
+        'website': website,
+        **contacts
+    }
+
+
+def _completed(futures) -> List[Dict[str, Any]]:
+    """Results of the futures that succeeded; failures are raised when results are collected."""
+    return [future.result() for future in futures if future.exception() is None]
+
+
+def link_search_results(search: Search, businesses: List[Business]) -> None:
+    """
+    Make businesses the results of search with one bulk statement per relation.
+
+    Adds the search to each business's search_history, replaces the search's
+    results with businesses and updates results_count. Existing link rows
+    are left alone (conflict-ignore), so this is safe to call again.
+    """
+    link_results([(search, businesses)])
+
+
+def link_results(results: List[Tuple[Search, List[Business]]], replace: bool = True) -> None:
+    """
+    link_search_results() for several searches, still with one bulk
+    statement per relation whatever the number of searches.
+
+    Args:
+        replace: Replace the searches' results and results_count; otherwise
+            the businesses are added to the results the searches already have
+    """
+    pairs = [(search.id, business.id) for search, businesses in results for business in businesses]
+    searches = [search for search, _ in results]
+    search_ids = [search.id for search in searches]
+
+    with timed_stage('db_link'):
+        SearchHistory = Business.search_history.through
+        SearchHistory.objects.bulk_create(
+            [SearchHistory(business_id=business_id, search_id=search_id) for search_id, business_id in pairs],
+            ignore_conflicts=True
+        )
+
+        SearchResults = Search.results.through
+        if replace and len(results) == 1:
+            SearchResults.objects.filter(search_id=search_ids[0]).exclude(
+                business_id__in=[business_id for _, business_id in pairs]
+            ).delete()
+        elif replace:
+            SearchResults.objects.filter(search_id__in=search_ids).delete()
+        SearchResults.objects.bulk_create(
+            [SearchResults(search_id=search_id, business_id=business_id) for search_id, business_id in pairs],
+            ignore_conflicts=True
+        )
+
+        if replace:
+            now = timezone.now()
+            for search, businesses in results:
+                search.results_count = len(businesses)
+                search.last_updated = now
+            Search.objects.bulk_update(searches, ['results_count', 'last_updated'])
+    ROWS_WRITTEN.labels('search_history').inc(len(pairs))
+    ROWS_WRITTEN.labels('search_results').inc(len(pairs))
+
+
+def build_business(search: Search, data: Dict[str, Any]) -> Business:
+    """Unsaved Business for just fetched data, with its derived fields set."""
+    business = Business(search=search, **data)
+    business.set_derived_fields()
+    return business
+
+
+def save_search_results(search: Search, businesses_data: List[Dict[str, Any]]) -> List[Business]:
+    """
+    Upsert fetched businesses on place_id and link them to the search.
+
+    New businesses are created with this search as their origin; businesses
+    already known by place_id get their fetched fields (UPSERT_FIELDS)
+    refreshed, their CONTACT_FIELDS where the search found a value and
+    their FETCH_STAMP_FIELDS where the search's data is newer.
+    Writes are one INSERT ... ON CONFLICT DO UPDATE per batch of
+    settings.BUSINESS_UPSERT_BATCH_SIZE rows, so the number of queries does
+    not depend on the number of businesses. Must be called inside a
+    transaction.
+
+    Returns:
+        All businesses linked to the search, in result order
+    """
+    return save_batch_results([(search, businesses_data)])[0]
+
+
+def save_batch_results(results: List[Tuple[Search, List[Dict[str, Any]]]]) -> List[List[Business]]:
+    """
+    save_search_results() for several searches at once.
+
+    A business found by several searches is written once, with the first
+    of them as its origin, and the number of queries depends on neither the
+    number of businesses nor the number of searches. Must be called inside
+    a transaction.
+
+    Returns:
+        The businesses linked to each search, in result order
+    """
+    return _upsert_and_link(results, replace=True)
+
+
+def append_search_results(search: Search, businesses_data: List[Dict[str, Any]]) -> List[Business]:
+    """
+    Upsert part of a running search's businesses and add them to its
+    results, leaving its other results alone, so they can be shown before
+    the search finishes. save_search_results() still writes the complete
+    results at the end. Must be called inside a transaction.
+
+    Returns:
+        The businesses added
+    """
+    return _upsert_and_link([(search, businesses_data)], replace=False)[0]
+
+
+def _upsert_and_link(
+    results: List[Tuple[Search, List[Dict[str, Any]]]],
+    replace: bool
+) -> List[List[Business]]:
+    # Later duplicates of a place_id win, like they would row by row
+    rows: Dict[str, Tuple[Search, Dict[str, Any]]] = {}
+    for search, businesses_data in results:
+        for data in businesses_data:
+            origin = rows[data['place_id']][0] if data['place_id'] in rows else search
+            rows[data['place_id']] = (origin, data)
+    with timed_stage('db_upsert'):
+        if rows:
+            Business.objects.bulk_create(
+                [build_business(search, data) for search, data in rows.values()],
+                batch_size=settings.BUSINESS_UPSERT_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['place_id'],
+                update_fields=UPSERT_FIELDS
+            )
+
+        # Primary keys are not returned for upserted rows, so read them back
+        business_map = {
+            b.place_id: b for b in Business.objects.filter(place_id__in=list(rows))
+        }
+        _update_found_fields(business_map, rows)
+    ROWS_WRITTEN.labels('business').inc(len(rows))
+    linked = [
+        (search, [business_map[place_id] for place_id in dict.fromkeys(data['place_id'] for data in businesses_data)])
+        for search, businesses_data in results
+    ]
+    link_results(linked, replace=replace)
+    return [businesses for _, businesses in linked]
+
+
+def _update_found_fields(
+    business_map: Dict[str, Business],
+    rows: Dict[str, Tuple[Search, Dict[str, Any]]]
+) -> None:
+    """Write the contacts found and newer fetch times for businesses that existed before the upsert."""
+    changed = []
+    for place_id, (_, data) in rows.items():
+        business = business_map[place_id]
+        found = {
+            field: data[field] for field in CONTACT_FIELDS
+            if data.get(field) and data[field] != getattr(business, field)
+        }
+        found.update({
+            field: data[field] for field in FETCH_STAMP_FIELDS
+            if data.get(field) and (getattr(business, field) is None or data[field] > getattr(business, field))
+        })
+        if found:
+            for field, value in found.items():
+                setattr(business, field, value)
+            business.set_derived_fields()
+            changed.append(business)
+    if changed:
+        Business.objects.bulk_update(
+            changed, [*CONTACT_FIELDS, 'normalized_phone', *FETCH_STAMP_FIELDS], batch_size=settings.BUSINESS_UPSERT_BATCH_SIZE
+        )
+
+
+def link_cached_results(search: Search, source: Search) -> List[Business]:
+    """
+    Serve a search from the stored results of an earlier equivalent search.
+
+    Returns:
+        The businesses now linked to the search
+    """
+    businesses = list(source.results.all())
+    link_search_results(search, businesses)
+    return businesses
+
+
+def record_api_usage(user_id: int, api_calls: Dict[str, int]) -> None:
+    """Add API calls made on behalf of a user to today's ApiUsage counters."""
+    today = timezone.localdate()
+    for call, count in api_calls.items():
+        if not count:
+            continue
+        usage = ApiUsage.objects.filter(user_id=user_id, date=today, call=call)
+        if usage.update(count=F('count') + count):
+            continue
+        try:
+            with transaction.atomic():
+                ApiUsage.objects.create(user_id=user_id, date=today, call=call, count=count)
+        except IntegrityError:
+            # Created concurrently by another worker
+            usage.update(count=F('count') + count)
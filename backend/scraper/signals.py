@@ -0,0 +1,78 @@
+from typing import Iterable
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_init, post_save
+from django.dispatch import receiver
+from .metrics import time_request_query
+from .models import Search, SearchAccess
+
+
+def sync_search_access(search_ids: Iterable[int]) -> None:
+    """Rebuild the SearchAccess rows of the given searches."""
+    search_ids = list(search_ids)
+    if not search_ids:
+        return
+    SharedWith = Search.shared_with.through
+    grants = {
+        (user_id, search_id)
+        for search_id, user_id in Search.objects.filter(id__in=search_ids).values_list('id', 'user_id')
+    }
+    grants.update(
+        (user_id, search_id)
+        for search_id, user_id in SharedWith.objects.filter(
+            search_id__in=search_ids
+        ).values_list('search_id', 'user_id')
+    )
+    SearchAccess.objects.filter(search_id__in=search_ids).delete()
+    SearchAccess.objects.bulk_create(
+        [SearchAccess(user_id=user_id, search_id=search_id) for user_id, search_id in grants],
+        ignore_conflicts=True
+    )
+
+
+@receiver(post_init, sender=Search)
+def remember_owner(sender, instance, **kwargs):
+    """Remember the owner a search was loaded with (None when deferred)."""
+    # Read from __dict__, so a deferred user does not cost a query
+    instance._saved_user_id = instance.__dict__.get('user_id')
+
+
+@receiver(post_save, sender=Search)
+def grant_owner_access(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Give the owner of a search access to it, again when the owner changes."""
+    if raw:
+        return
+    if created:
+        SearchAccess.objects.bulk_create(
+            [SearchAccess(user_id=instance.user_id, search=instance)],
+            ignore_conflicts=True
+        )
+    elif (update_fields is None or 'user' in update_fields) and (
+        instance._saved_user_id is None or instance.user_id != instance._saved_user_id
+    ):
+        sync_search_access([instance.pk])
+    instance._saved_user_id = instance.user_id
+
+
+@receiver(m2m_changed, sender=Search.shared_with.through)
+def sync_shared_access(sender, instance, action, reverse, pk_set, **kwargs):
+    """Mirror every change of Search.shared_with into SearchAccess."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        sync_search_access([instance.pk])
+    elif action == 'post_clear':
+        # user.shared_searches.clear(): pk_set is not provided
+        sync_search_access(
+            SearchAccess.objects.filter(user=instance).values_list('search_id', flat=True)
+        )
+    else:
+        sync_search_access(pk_set)
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    """Count every connection's queries towards the request running them (Server-Timing)."""
+    if time_request_query not in connection.execute_wrappers:
+        # First, so wrappers pushed by connection.execute_wrapper() blocks
+        # still pop their own
+        connection.execute_wrappers.insert(0, time_request_query)
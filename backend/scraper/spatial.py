@@ -0,0 +1,54 @@
+from typing import List, Optional, Tuple
+from django.db.models import Q, QuerySet
+from .geo import Bounds, covering_geohashes, haversine
+
+
+def filter_bounds(queryset: QuerySet, bounds: Bounds) -> QuerySet:
+    """
+    Restrict businesses to those located inside bounds.
+
+    The geohash prefixes covering the box select candidates through the
+    B-tree index on Business.geohash; the coordinate ranges then drop the
+    parts of the covering cells that lie outside the box.
+    """
+    cells = Q()
+    for prefix in covering_geohashes(bounds):
+        cells |= Q(geohash__startswith=prefix)
+    return queryset.filter(
+        cells,
+        latitude__range=(bounds.south, bounds.north),
+        longitude__range=(bounds.west, bounds.east)
+    )
+
+
+def rank_by_distance(
+    queryset: QuerySet,
+    lat: float,
+    lng: float,
+    radius: Optional[float] = None,
+    limit: Optional[int] = None
+) -> Tuple[int, List[Tuple[int, float]]]:
+    """
+    Order businesses by haversine distance from a point.
+
+    Only primary keys and coordinates are read, so callers can load the
+    full rows for the nearest `limit` businesses alone.
+
+    Args:
+        queryset: Businesses to rank, usually narrowed with filter_bounds
+        lat: Latitude of the point
+        lng: Longitude of the point
+        radius: Drop businesses farther than this many meters
+        limit: Maximum number of businesses returned
+
+    Returns:
+        Number of businesses within radius, and (pk, distance in meters)
+        pairs for the nearest of them
+    """
+    ranked = []
+    for pk, latitude, longitude in queryset.order_by().values_list('pk', 'latitude', 'longitude'):
+        distance = haversine(lat, lng, float(latitude), float(longitude))
+        if radius is None or distance <= radius:
+            ranked.append((pk, distance))
+    ranked.sort(key=lambda item: item[1])
+    return len(ranked), ranked[:limit]
@@ -0,0 +1,425 @@
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+from celery import shared_task
+from .aio import run_async
+from .async_services import AsyncGoogleMapsService
+from .dedup import deduplicate_businesses
+from .geo import Bounds
+from .metrics import SEARCH_JOBS, observe_stage
+from .models import Search, SearchBatch, SearchJob
+from .refresh import refresh_businesses
+from .services import (
+    GoogleMapsService, append_search_results, save_batch_results, save_search_results,
+    link_cached_results, record_api_usage
+)
+
+logger = logging.getLogger(__name__)
+
+
+def cached_sources(searches: Iterable[Search]) -> Dict[str, SearchJob]:
+    """
+    The last job that fetched each of the searches' normalized queries from
+    the API, other than the searches' own jobs.
+
+    Only searches visible to the searches' user count, since businesses are
+    listed through the access grants of the search that saved them. All of
+    the searches must belong to the same user.
+    """
+    searches = list(searches)
+    if not searches:
+        return {}
+    # Only jobs that actually hit the API count as a source, so serving
+    # cached results never extends their freshness
+    jobs = SearchJob.objects.filter(
+        search__normalized_query__in={search.normalized_query for search in searches},
+        search__access_grants__user=searches[0].user_id,
+        status=SearchJob.Status.DONE,
+        cache_status__in=[SearchJob.CacheStatus.MISS, SearchJob.CacheStatus.STALE],
+    ).exclude(
+        search__in=[search.pk for search in searches]
+    ).select_related('search').order_by('-finished_at')
+
+    sources: Dict[str, SearchJob] = {}
+    for job in jobs:
+        sources.setdefault(job.search.normalized_query, job)
+    return sources
+
+
+def _abandoned_before() -> datetime:
+    """Start time before which a running job has lost its worker (settings.SEARCH_JOB_TIMEOUT)."""
+    return timezone.now() - timedelta(seconds=settings.SEARCH_JOB_TIMEOUT)
+
+
+def refreshing_queries(normalized_queries: Iterable[str]) -> Set[str]:
+    """
+    The normalized queries that already have a search job queued or running.
+    A job running longer than settings.SEARCH_JOB_TIMEOUT lost its worker
+    and does not count, so its query is refreshed again.
+
+    On PostgreSQL each query is locked until the transaction ends, so
+    concurrent callers for the same query see each other's new jobs instead
+    of both queuing one.
+    """
+    normalized_queries = sorted(set(normalized_queries))
+    if not normalized_queries:
+        return set()
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for normalized_query in normalized_queries:
+                cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [f'query:{normalized_query}'])
+    return set(SearchJob.objects.filter(
+        Q(status=SearchJob.Status.QUEUED) |
+        Q(status=SearchJob.Status.RUNNING, started_at__gte=_abandoned_before()),
+        search__normalized_query__in=normalized_queries,
+    ).values_list('search__normalized_query', flat=True))
+
+
+def _is_stale(source_job: Optional[SearchJob]) -> bool:
+    return source_job is not None and (
+        timezone.now() - source_job.finished_at > timedelta(seconds=settings.QUERY_CACHE_FRESHNESS)
+    )
+
+
+def _new_job(
+    search: Search,
+    source_job: Optional[SearchJob],
+    kind: str = SearchJob.Kind.SEARCH,
+    params: Optional[Dict[str, Any]] = None,
+    batch: Optional[SearchBatch] = None,
+    refreshing: bool = False
+) -> SearchJob:
+    """
+    Unsaved job for a new search, linking the results of source_job's
+    search if there is one (see start_search_job). refreshing tells that
+    stale results are already being refetched by another job.
+    """
+    job = SearchJob(search=search, kind=kind, params=params or {}, batch=batch)
+    if source_job is None:
+        return job
+    businesses = link_cached_results(search, source_job.search)
+    if not _is_stale(source_job) or refreshing:
+        now = timezone.now()
+        job.status = SearchJob.Status.DONE
+        job.cache_status = (
+            SearchJob.CacheStatus.REFRESHING if refreshing else SearchJob.CacheStatus.FRESH
+        )
+        job.places_found = job.details_fetched = job.results_saved = len(businesses)
+        job.started_at = job.finished_at = now
+    else:
+        job.cache_status = SearchJob.CacheStatus.STALE
+    return job
+
+
+def start_search_job(
+    search: Search,
+    kind: str = SearchJob.Kind.SEARCH,
+    params: Optional[Dict[str, Any]] = None
+) -> SearchJob:
+    """
+    Create the job that fills in a new search's results.
+
+    If an equivalent query (same normalized_query) was fetched within
+    settings.QUERY_CACHE_FRESHNESS seconds, its results are linked and the
+    job is done immediately. Older results are linked too, but a refresh is
+    queued (stale-while-revalidate), unless a job for the same query is
+    already queued or running. Otherwise the job is queued as usual.
+    Must be called inside a transaction; the task is sent on commit.
+    """
+    source_job = cached_sources([search]).get(search.normalized_query)
+    refreshing = _is_stale(source_job) and bool(refreshing_queries([search.normalized_query]))
+    job = _new_job(search, source_job, kind, params, refreshing=refreshing)
+    job.save()
+    if job.status == SearchJob.Status.QUEUED:
+        # Enqueue only once the search and job rows are visible to the worker
+        transaction.on_commit(lambda: run_search_job.delay(job.pk))
+    return job
+
+
+def start_search_batch(batch: SearchBatch, searches: List[Search]) -> List[SearchJob]:
+    """
+    Create the jobs of a new batch, one per search, and queue the batch.
+
+    Queries are served from the query cache like start_search_job does;
+    the rest are left for run_search_batch. Must be called inside a
+    transaction; the task is sent on commit.
+
+    Returns:
+        The jobs, in the order of searches
+    """
+    sources = cached_sources(searches)
+    refreshing = refreshing_queries(
+        query for query, source_job in sources.items() if _is_stale(source_job)
+    )
+    jobs = SearchJob.objects.bulk_create([
+        _new_job(
+            search, sources.get(search.normalized_query), batch=batch,
+            refreshing=search.normalized_query in refreshing
+        )
+        for search in searches
+    ])
+    batch.queries_total = len(jobs)
+    batch.queries_searched = sum(job.status == SearchJob.Status.DONE for job in jobs)
+    batch.save(update_fields=['queries_total', 'queries_searched'])
+    transaction.on_commit(lambda: run_search_batch.delay(batch.pk))
+    return jobs
+
+
+@shared_task
+def run_search_job(job_id: int) -> None:
+    """
+    Fetch results for a queued search job and store them.
+
+    A job left running by a worker that died is run again when Celery
+    redelivers its task, once settings.SEARCH_JOB_TIMEOUT has passed.
+
+    Businesses are written as they are fetched, at most every
+    settings.SEARCH_RESULTS_FLUSH_INTERVAL seconds, so clients following
+    the job (scraper.events) see the first rows early; the complete results
+    are written when the search is done.
+    """
+    # A job still running after SEARCH_JOB_TIMEOUT lost its worker, and
+    # this is the task redelivered for it (acks_late): take it over
+    claimed = SearchJob.objects.filter(
+        Q(status=SearchJob.Status.QUEUED) |
+        Q(status=SearchJob.Status.RUNNING, started_at__lt=_abandoned_before()),
+        pk=job_id
+    ).update(status=SearchJob.Status.RUNNING, started_at=timezone.now())
+    if not claimed:
+        # Already picked up by another worker (acks_late redelivery)
+        return
+    job = SearchJob.objects.select_related('search').get(pk=job_id)
+
+    unwritten: List[Dict[str, Any]] = []
+    written = {'rows': 0, 'emails': 0, 'at': 0.0}
+
+    def write_partial(businesses_data: List[Dict[str, Any]]) -> None:
+        unwritten.extend(businesses_data)
+        written['emails'] += sum(1 for data in businesses_data if data.get('email'))
+        if not unwritten or time.monotonic() - written['at'] < settings.SEARCH_RESULTS_FLUSH_INTERVAL:
+            return
+        with transaction.atomic():
+            append_search_results(job.search, unwritten)
+        written['rows'] += len(unwritten)
+        written['at'] = time.monotonic()
+        unwritten.clear()
+
+    def report_progress(fetched: int, total: int, pages: int) -> None:
+        SearchJob.objects.filter(pk=job.pk).update(
+            places_found=total,
+            details_fetched=fetched,
+            emails_found=written['emails'],
+            pages_fetched=pages,
+            results_saved=written['rows']
+        )
+
+    maps_service = None
+    try:
+        if job.kind == SearchJob.Kind.SWEEP:
+            maps_service = GoogleMapsService()
+            businesses_data = maps_service.search_area(
+                job.params['keyword'],
+                Bounds(**job.params['bounds']),
+                progress=report_progress,
+                on_results=write_partial
+            )
+        elif settings.GOOGLE_MAPS_ASYNC:
+            # Runs on the worker process's event loop, whose HTTP client and
+            # connections every job of the process shares
+            maps_service = AsyncGoogleMapsService()
+            businesses_data = run_async(maps_service.search_places(
+                job.search.query,
+                progress=sync_to_async(report_progress),
+                on_results=sync_to_async(write_partial)
+            ))
+        else:
+            maps_service = GoogleMapsService()
+            businesses_data = maps_service.search_places(
+                job.search.query, progress=report_progress, on_results=write_partial
+            )
+        with transaction.atomic():
+            businesses = save_search_results(job.search, businesses_data)
+            if settings.DEDUP_AFTER_SEARCH:
+                # Rows fetched before were checked when they were inserted
+                deduplicate_businesses(
+                    [b for b in businesses if b.created_at >= job.started_at]
+                )
+    except Exception as e:
+        logger.exception('Search job %s failed', job.pk)
+        finished_at = timezone.now()
+        SearchJob.objects.filter(pk=job.pk).update(
+            status=SearchJob.Status.FAILED,
+            error=str(e),
+            finished_at=finished_at
+        )
+        SEARCH_JOBS.labels(job.kind, SearchJob.Status.FAILED).inc()
+        observe_stage('search_job', (finished_at - job.started_at).total_seconds())
+        return
+    finally:
+        if maps_service is not None:
+            # Calls are billed whether or not the job succeeded
+            record_api_usage(job.search.user_id, maps_service.api_calls)
+
+    finished_at = timezone.now()
+    SearchJob.objects.filter(pk=job.pk).update(
+        status=SearchJob.Status.DONE,
+        results_saved=len(businesses),
+        emails_found=sum(1 for business in businesses if business.email),
+        pages_fetched=maps_service.pages_fetched,
+        tiles_searched=maps_service.tiles_searched,
+        details_calls_saved=maps_service.details_calls_saved,
+        finished_at=finished_at
+    )
+    SEARCH_JOBS.labels(job.kind, SearchJob.Status.DONE).inc()
+    observe_stage('search_job', (finished_at - job.started_at).total_seconds())
+
+
+@shared_task
+def run_search_batch(batch_id: int) -> None:
+    """
+    Fetch the results of a batch's queued jobs as one job.
+
+    All queries share one service (client, pools, rate limits), each place
+    is fetched once however many queries found it, and all results are
+    written in one transaction. A query that fails fails its own job only.
+    """
+    claimed = SearchBatch.objects.filter(
+        pk=batch_id, status=SearchJob.Status.QUEUED
+    ).update(status=SearchJob.Status.RUNNING, started_at=timezone.now())
+    if not claimed:
+        # Already picked up by another worker (acks_late redelivery)
+        return
+    batch = SearchBatch.objects.get(pk=batch_id)
+    jobs = list(
+        batch.jobs.filter(status=SearchJob.Status.QUEUED).select_related('search').order_by('pk')
+    )
+    batch.jobs.filter(pk__in=[job.pk for job in jobs]).update(
+        status=SearchJob.Status.RUNNING, started_at=batch.started_at
+    )
+    served_from_cache = batch.queries_searched
+
+    def report_progress(searched: int, fetched: int, total: int, pages: int) -> None:
+        SearchBatch.objects.filter(pk=batch.pk).update(
+            queries_searched=served_from_cache + searched,
+            places_found=total,
+            details_fetched=fetched,
+            pages_fetched=pages
+        )
+
+    def report_listed(index: int, places: int, pages: int) -> None:
+        SearchJob.objects.filter(pk=jobs[index].pk).update(places_found=places, pages_fetched=pages)
+
+    maps_service = None
+    try:
+        results = []
+        if jobs:
+            maps_service = GoogleMapsService()
+            results = maps_service.search_batch(
+                [job.search.query for job in jobs], progress=report_progress, listed=report_listed
+            )
+        succeeded = [(job, result) for job, result in zip(jobs, results) if result.error is None]
+        with transaction.atomic():
+            saved = save_batch_results([(job.search, result.businesses) for job, result in succeeded])
+            if settings.DEDUP_AFTER_SEARCH:
+                # Rows fetched before were checked when they were inserted
+                deduplicate_businesses(list({
+                    b.pk: b for businesses in saved for b in businesses
+                    if b.created_at >= batch.started_at
+                }.values()))
+    except Exception as e:
+        logger.exception('Search batch %s failed', batch.pk)
+        finished_at = timezone.now()
+        batch.jobs.filter(status=SearchJob.Status.RUNNING).update(
+            status=SearchJob.Status.FAILED,
+            error=str(e),
+            finished_at=finished_at
+        )
+        SearchBatch.objects.filter(pk=batch.pk).update(
+            status=SearchJob.Status.FAILED,
+            error=str(e),
+            finished_at=finished_at
+        )
+        SEARCH_JOBS.labels('batch', SearchJob.Status.FAILED).inc()
+        observe_stage('search_batch', (finished_at - batch.started_at).total_seconds())
+        return
+    finally:
+        if maps_service is not None:
+            # Calls are billed whether or not the batch succeeded
+            record_api_usage(batch.user_id, maps_service.api_calls)
+
+    finished_at = timezone.now()
+    for job, result in zip(jobs, results):
+        job.status = SearchJob.Status.FAILED if result.error else SearchJob.Status.DONE
+        job.error = result.error or ''
+        job.places_found = job.details_fetched = job.results_saved = len(result.businesses)
+        job.emails_found = sum(1 for data in result.businesses if data.get('email'))
+        job.pages_fetched = result.pages
+        job.finished_at = finished_at
+    SearchJob.objects.bulk_update(
+        jobs,
+        [
+            'status', 'error', 'places_found', 'details_fetched', 'emails_found',
+            'results_saved', 'pages_fetched', 'finished_at'
+        ]
+    )
+    failed = sum(result.error is not None for result in results)
+    SearchBatch.objects.filter(pk=batch.pk).update(
+        status=SearchJob.Status.DONE,
+        queries_searched=batch.queries_total,
+        pages_fetched=maps_service.pages_fetched if maps_service else 0,
+        details_calls_saved=maps_service.details_calls_saved if maps_service else 0,
+        results_saved=batch.jobs.aggregate(total=Sum('results_saved'))['total'] or 0,
+        error=f'{failed} of {len(jobs)} queries failed' if failed else '',
+        finished_at=finished_at
+    )
+    SEARCH_JOBS.labels('batch', SearchJob.Status.DONE).inc()
+    observe_stage('search_batch', (finished_at - batch.started_at).total_seconds())
+
+
+@contextmanager
+def sweep_lock(name: str) -> Iterator[bool]:
+    """
+    Try to take a lock held across every worker, yielding whether it was taken.
+
+    On PostgreSQL it is a session advisory lock, which the database also
+    releases when a dead worker's connection drops. Other databases fall
+    back to a cache lock, shared only through a shared cache such as Redis.
+    """
+    if connection.vendor != 'postgresql':
+        locks = caches['place_details']
+        acquired = locks.add(name, 1, timeout=settings.BUSINESS_REFRESH_INTERVAL or 3600)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                locks.delete(name)
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(hashtext(%s))', [name])
+        acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(hashtext(%s))', [name])
+
+
+@shared_task
+def refresh_stale_businesses() -> None:
+    """Refresh the stalest businesses (scheduled by CELERY_BEAT_SCHEDULE)."""
+    with sweep_lock('refresh-sweep') as acquired:
+        # Skip the run if the previous sweep is still going
+        if not acquired:
+            logger.info('Refresh sweep already running')
+            return
+        refresh_businesses()
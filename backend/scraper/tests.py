@@ -1,3 +1,1507 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from unittest import mock, skipUnless
+from xml.etree import ElementTree
+import googlemaps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.contrib.auth import get_user_model
+from django.db import connection, connections, transaction
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from .geo import Bounds, covering_geohashes, encode_geohash, haversine
+from .benchmark import FakeWebsites, run_benchmark
+from .cache import PlaceDetailsCache
+from .crawler import (
+    AsyncContactCrawler, AsyncDomainLimiter, ContactCrawler, DomainLimiter, SiteContacts, contact_links
+)
+from .dedup import deduplicate_businesses, merge_duplicate_groups
+from .enrichment import DomainEnrichmentCache
+from .export import CONTENT_TYPES, EXPORT_FIELDS
+from .extract import extract_chunks
+from .matching import match_score, normalize_phone, registered_domain
+from .metrics import ContextThreadPool, observe_stage
+from .middleware import ServerTimingMiddleware
+from .models import Search, SearchAccess, Business, ApiUsage, DomainEnrichment, SearchBatch, SearchJob
+from .pagination import KeysetPagination
+from .queries import normalize_query
+from .ratelimit import TokenBucket
+from .serializers import BusinessSerializer, BusinessReadSerializer
+from .refresh import _write_changes, due_businesses, refresh_businesses
+from .services import (
+    DatabaseThreadPool, GoogleMapsService, append_search_results, save_search_results, record_api_usage
+)
+from .tasks import refresh_stale_businesses, run_search_batch, run_search_job, sweep_lock
 
-# Create your tests here.
+User = get_user_model()
+
+
+def make_business_data(count, offset=0):
+    """Build search_places-style dicts for count places."""
+    now = timezone.now()
+    return [
+        {
+            'name': f'Business {i}',
+            'place_id': f'place-{i}',
+            'address': f'{i} Main St',
+            'phone': '',
+            'website': '',
+            'email': None,
+            'rating': 4.5,
+            'reviews_count': i,
+            'latitude': 30.0,
+            'longitude': -97.0,
+            'category': 'dentist',
+            'instagram_link': None,
+            'youtube_link': None,
+            'twitter_link': None,
+            'facebook_link': None,
+            'details_fetched_at': now,
+            'contacts_fetched_at': now,
+        }
+        for i in range(offset, offset + count)
+    ]
+
+
+class SaveSearchResultsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+
+    def save(self, businesses_data):
+        search = Search.objects.create(user=self.user, query='dentists')
+        with transaction.atomic():
+            businesses = save_search_results(search, businesses_data)
+        return search, businesses
+
+    def test_links_new_and_existing_businesses(self):
+        first_search, _ = self.save(make_business_data(3))
+        search, businesses = self.save(make_business_data(4, offset=1))
+
+        self.assertEqual([b.place_id for b in businesses], [f'place-{i}' for i in range(1, 5)])
+        self.assertEqual(Business.objects.count(), 5)
+        self.assertEqual(search.results_count, 4)
+        self.assertEqual(search.results.count(), 4)
+        self.assertEqual(search.historical_results.count(), 4)
+        # Existing businesses keep the search they were first found by
+        self.assertEqual(Business.objects.get(place_id='place-1').search, first_search)
+
+    def test_refreshes_existing_businesses(self):
+        self.save(make_business_data(2))
+        original = Business.objects.get(place_id='place-1')
+        data = make_business_data(2)
+        data[1].update(phone='+1 512 555 0100', rating=3.9, reviews_count=250)
+
+        self.save(data)
+
+        business = Business.objects.get(place_id='place-1')
+        self.assertEqual(business.phone, '+1 512 555 0100')
+        self.assertEqual(float(business.rating), 3.9)
+        self.assertEqual(business.reviews_count, 250)
+        self.assertEqual(business.uuid, original.uuid)
+        self.assertEqual(Business.objects.count(), 2)
+
+    def test_missing_contacts_do_not_erase_stored_ones(self):
+        data = make_business_data(2)
+        data[0].update(email='hi@zero.test', phone='(512) 555-0100', facebook_link='https://facebook.com/zero')
+        self.save(data)
+
+        # The crawl failed this time: nothing found
+        data = make_business_data(2)
+        data[0]['name'] = 'Zero Renamed'
+        data[1]['email'] = 'new@one.test'
+        self.save(data)
+
+        zero = Business.objects.get(place_id='place-0')
+        self.assertEqual(zero.name, 'Zero Renamed')
+        self.assertEqual(
+            (zero.email, zero.phone, zero.normalized_phone, zero.facebook_link),
+            ('hi@zero.test', '(512) 555-0100', '5125550100', 'https://facebook.com/zero')
+        )
+        self.assertEqual(Business.objects.get(place_id='place-1').email, 'new@one.test')
+
+    def test_fetch_times_only_move_forward(self):
+        self.save(make_business_data(3))
+        stored = Business.objects.get(place_id='place-0').details_fetched_at
+        data = make_business_data(3)
+        # Served from an older cache entry, a failed crawl, a new fetch
+        data[0]['details_fetched_at'] = stored - timedelta(days=20)
+        data[1]['contacts_fetched_at'] = None
+        self.save(data)
+
+        businesses = {b.place_id: b for b in Business.objects.all()}
+        self.assertEqual(businesses['place-0'].details_fetched_at, stored)
+        self.assertEqual(businesses['place-1'].contacts_fetched_at, stored)
+        self.assertEqual(businesses['place-1'].details_fetched_at, data[1]['details_fetched_at'])
+        self.assertEqual(businesses['place-2'].contacts_fetched_at, data[2]['contacts_fetched_at'])
+        self.assertGreater(data[2]['contacts_fetched_at'], stored)
+
+    @skipUnless(connection.vendor == 'postgresql', 'other databases split the upsert by their parameter limit')
+    def test_query_count_does_not_depend_on_result_size(self):
+        # Half of each result set already exists, half is new
+        for size in (2, 40):
+            self.save(make_business_data(size // 2, offset=1000 * size))
+            search = Search.objects.create(user=self.user, query='dentists')
+            data = make_business_data(size, offset=1000 * size)
+            # upsert businesses, read back their ids, move the fetch times
+            # of the existing ones forward, insert search_history links,
+            # prune and insert results links, update the search
+            with self.assertNumQueries(7):
+                save_search_results(search, data)
+            self.assertEqual(search.results.count(), size)
+
+
+class ListQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        self.other = User.objects.create_user('other@example.com', 'password', name='Other')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_searches(self, count, results_per_search):
+        for i in range(count):
+            search = Search.objects.create(user=self.user, query=f'query {i}')
+            data = make_business_data(results_per_search, offset=i * results_per_search // 2)
+            with transaction.atomic():
+                save_search_results(search, data)
+        shared = Search.objects.create(user=self.other, query='shared')
+        shared.shared_with.add(self.user)
+
+    def test_business_list_query_count(self):
+        for searches in (1, 8):
+            Search.objects.all().delete()
+            self.create_searches(searches, 10)
+            # count, page, prefetched search_history
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/scraper/businesses/')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.data['results'])
+
+    def test_search_list_query_count(self):
+        for searches in (1, 8):
+            Search.objects.all().delete()
+            self.create_searches(searches, 10)
+            # count, page
+            with self.assertNumQueries(2):
+                response = self.client.get('/api/scraper/searches/')
+            self.assertEqual(response.data['count'], searches + 1)
+            self.assertNotIn('results', response.data['results'][0])
+
+    def test_search_detail_query_count(self):
+        self.create_searches(2, 20)
+        search = Search.objects.filter(user=self.user).first()
+        # search, prefetched results, prefetched results' search_history
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/scraper/searches/{search.id}/')
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_read_serializer_matches_business_serializer(self):
+        self.create_searches(2, 5)
+        businesses = Business.objects.prefetch_related('search_history')
+        self.assertEqual(
+            BusinessReadSerializer(businesses, many=True).data,
+            BusinessSerializer(businesses, many=True).data
+        )
+
+
+class SearchAccessTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        self.shared = User.objects.create_user('shared@example.com', 'password', name='Shared')
+        self.stranger = User.objects.create_user('stranger@example.com', 'password', name='Stranger')
+        self.search = Search.objects.create(user=self.owner, query='dentists')
+        with transaction.atomic():
+            save_search_results(self.search, make_business_data(3))
+
+    def visible(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/scraper/businesses/')
+        return sorted(row['place_id'] for row in response.data['results'])
+
+    def test_share_grants_access(self):
+        self.assertEqual(self.visible(self.owner), ['place-0', 'place-1', 'place-2'])
+        self.assertEqual(self.visible(self.shared), [])
+
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        response = client.post(
+            f'/api/scraper/searches/{self.search.pk}/share/', {'user_emails': ['shared@example.com']}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(SearchAccess.objects.values_list('user_id', 'search_id')),
+            {(self.owner.pk, self.search.pk), (self.shared.pk, self.search.pk)}
+        )
+        self.assertEqual(self.visible(self.shared), ['place-0', 'place-1', 'place-2'])
+        self.assertEqual(self.visible(self.stranger), [])
+
+        # Unsharing from either side revokes access
+        self.search.shared_with.remove(self.shared)
+        self.assertEqual(self.visible(self.shared), [])
+        self.shared.shared_searches.add(self.search)
+        self.assertEqual(self.visible(self.shared), ['place-0', 'place-1', 'place-2'])
+        self.shared.shared_searches.clear()
+        self.assertEqual(self.visible(self.shared), [])
+
+    def test_owner_change_moves_access(self):
+        # Saves that keep the owner leave the grants alone
+        with self.assertNumQueries(1):
+            self.search.save()
+        self.search.user = self.shared
+        self.search.save()
+        self.assertEqual(self.visible(self.shared), ['place-0', 'place-1', 'place-2'])
+        self.assertEqual(self.visible(self.owner), [])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        search = Search.objects.create(user=self.user, query='dentists')
+        data = make_business_data(5)
+        data[0]['name'] = 'Smith, "Jones" & Søn\x0b'
+        data[1]['name'] = '=HYPERLINK("http://evil.example","Open")'
+        data[2]['phone'] = '+1 512-555-0102'
+        data[3]['phone'] = '-1+cmd|"/c calc"!A0'
+        with transaction.atomic():
+            save_search_results(search, data)
+
+    def export(self, export_format, **data):
+        # Several chunks per export
+        with mock.patch('scraper.export.ROWS_PER_CHUNK', 2):
+            response = self.client.post(
+                '/api/scraper/businesses/export/', {'format': export_format, **data}, format='json'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], CONTENT_TYPES[export_format])
+            return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(self.export('csv').decode())))
+        self.assertEqual(rows[0], EXPORT_FIELDS)
+        self.assertEqual(len(rows), 6)
+        names = {row[EXPORT_FIELDS.index('name')] for row in rows[1:]}
+        self.assertIn('Smith, "Jones" & Søn\x0b', names)
+        # Text starting like a formula is not run by spreadsheets
+        self.assertIn('\'=HYPERLINK("http://evil.example","Open")', names)
+        phones = {row[EXPORT_FIELDS.index('phone')] for row in rows[1:]}
+        self.assertIn("'-1+cmd|\"/c calc\"!A0", phones)
+        # Numbers and phone numbers are left as they are
+        self.assertIn('+1 512-555-0102', phones)
+        longitudes = {row[EXPORT_FIELDS.index('longitude')] for row in rows[1:]}
+        self.assertEqual(longitudes, {'-97.000000'})
+
+    def test_ndjson_of_selected_businesses(self):
+        selected = [str(uuid) for uuid in Business.objects.filter(
+            place_id__in=['place-1', 'place-3']
+        ).values_list('uuid', flat=True)]
+        rows = [json.loads(line) for line in self.export('ndjson', business_ids=selected).splitlines()]
+        self.assertEqual(sorted(row['place_id'] for row in rows), ['place-1', 'place-3'])
+        self.assertEqual(set(rows[0]), set(EXPORT_FIELDS))
+
+    def test_xlsx_opens(self):
+        with zipfile.ZipFile(io.BytesIO(self.export('xlsx'))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertIn('xl/workbook.xml', archive.namelist())
+            sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = sheet.findall('s:sheetData/s:row', namespace)
+        self.assertEqual(len(rows), 6)
+        header = [cell.findtext('s:is/s:t', namespaces=namespace) for cell in rows[0]]
+        self.assertEqual(header, EXPORT_FIELDS)
+        texts = {cell.findtext('s:is/s:t', namespaces=namespace) for row in rows[1:] for cell in row}
+        # Characters XML cannot hold are dropped
+        self.assertIn('Smith, "Jones" & Søn', texts)
+
+    def test_unknown_format(self):
+        response = self.client.post('/api/scraper/businesses/export/', {'format': 'pdf'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_streams_under_asgi(self):
+        with mock.patch('scraper.export.ROWS_PER_CHUNK', 2):
+            response = await self.async_client.post(
+                '/api/scraper/businesses/export/', {'format': 'csv'}, content_type='application/json',
+                headers={'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+            )
+            self.assertEqual(response.status_code, 200)
+            # Served chunk by chunk rather than read into memory first
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(len(list(csv.reader(io.StringIO(b''.join(chunks).decode())))), 6)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        search = Search.objects.create(user=self.user, query='dentists')
+        data = make_business_data(23)
+        for i, row in enumerate(data):
+            # Ties and NULLs in the ordering field
+            row['rating'] = None if i % 5 == 0 else 3 + i % 3
+        with transaction.atomic():
+            save_search_results(search, data)
+
+    def collect(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_cursor_pages_match_offset_ordering(self):
+        for ordering in ('-created_at', 'rating', '-rating', 'name'):
+            ids = self.collect(
+                f'/api/scraper/businesses/?pagination=cursor&page_size=5&ordering={ordering}'
+            )
+            self.assertEqual(len(ids), 23)
+            self.assertEqual(len(set(ids)), 23)
+            field = ordering.lstrip('-')
+            values = dict(Business.objects.values_list('id', field))
+            keys = [values[i] for i in ids]
+            present = [key for key in keys if key is not None]
+            self.assertEqual(present, sorted(present, reverse=ordering.startswith('-')))
+            # NULLs come last
+            self.assertEqual(keys[len(present):], [None] * (len(keys) - len(present)))
+
+    def test_cursor_works_with_filters(self):
+        ids = self.collect('/api/scraper/businesses/?pagination=cursor&page_size=4&rating=4.0')
+        self.assertEqual(set(ids), set(Business.objects.filter(rating=4).values_list('id', flat=True)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/scraper/businesses/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+        # Decodes, but its value does not fit the ordering field
+        cursor = KeysetPagination().encode_cursor('garbage', 1)
+        for ordering in ('created_at', 'rating'):
+            response = self.client.get(
+                f'/api/scraper/businesses/?pagination=cursor&ordering={ordering}&cursor={cursor}'
+            )
+            self.assertEqual(response.status_code, 404)
+
+    def test_ties_broken_by_id(self):
+        Business.objects.update(rating=4)
+        for ordering in ('rating', '-rating'):
+            ids = self.collect(f'/api/scraper/businesses/?pagination=cursor&page_size=3&ordering={ordering}')
+            self.assertEqual(ids, sorted(ids, reverse=ordering.startswith('-')))
+            self.assertEqual(len(ids), 23)
+
+    def test_cursor_stable_when_rows_inserted(self):
+        before = set(Business.objects.values_list('id', flat=True))
+        for ordering in ('-created_at', 'name'):
+            response = self.client.get(
+                f'/api/scraper/businesses/?pagination=cursor&page_size=5&ordering={ordering}'
+            )
+            ids = [row['id'] for row in response.data['results']]
+            # New rows land both before and after the cursor
+            search = Search.objects.create(user=self.user, query=f'more {ordering}')
+            data = make_business_data(2, offset=100 + len(before))
+            data[0]['name'], data[1]['name'] = 'AAA first', 'ZZZ last'
+            with transaction.atomic():
+                save_search_results(search, data)
+            ids.extend(self.collect(response.data['next']))
+
+            self.assertEqual(len(ids), len(set(ids)))
+            self.assertTrue(before <= set(ids))
+            added = set(ids) - before
+            if ordering == 'name':
+                self.assertEqual(
+                    set(Business.objects.filter(id__in=added).values_list('name', flat=True)), {'ZZZ last'}
+                )
+            else:
+                # Newer than every row already read
+                self.assertFalse(added)
+            before = set(Business.objects.values_list('id', flat=True))
+
+
+class BusinessSearchFilterTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        search = Search.objects.create(user=user, query='austin')
+        data = make_business_data(3)
+        for row, (name, category) in zip(data, [
+            ('Bright Smile Dental', 'dentist'),
+            ('Austin Pizza House', 'restaurant'),
+            ('Smile Pizza Bar', 'bar'),
+        ]):
+            row.update(name=name, category=category)
+        with transaction.atomic():
+            save_search_results(search, data)
+
+    def names(self, term):
+        response = self.client.get('/api/scraper/businesses/', {'search': term})
+        return [row['name'] for row in response.data['results']]
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search needs PostgreSQL')
+    def test_ranked_by_name_and_category(self):
+        # Both words match first; a fuzzy match on one word may follow
+        names = self.names('bright smile')
+        self.assertEqual(names[0], 'Bright Smile Dental')
+        self.assertNotIn('Austin Pizza House', names)
+        self.assertEqual(sorted(self.names('pizza')), ['Austin Pizza House', 'Smile Pizza Bar'])
+        self.assertEqual(self.names('restaurants'), ['Austin Pizza House'])
+        self.assertEqual(self.names('dentist'), ['Bright Smile Dental'])
+
+    def test_icontains_fallback_without_postgresql(self):
+        with mock.patch('scraper.filters.connection') as sqlite_connection:
+            sqlite_connection.vendor = 'sqlite'
+            self.assertEqual(sorted(self.names('pizza')), ['Austin Pizza House', 'Smile Pizza Bar'])
+            self.assertEqual(self.names('restaurant'), ['Austin Pizza House'])
+
+
+class SpatialQueryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        search = Search.objects.create(user=self.user, query='cafes')
+        # A 9 x 9 grid of places roughly 1.1 km apart around (30.25, -97.75)
+        data = make_business_data(81)
+        for i, item in enumerate(data):
+            item['latitude'] = round(30.21 + (i // 9) * 0.01, 6)
+            item['longitude'] = round(-97.79 + (i % 9) * 0.01, 6)
+        with transaction.atomic():
+            save_search_results(search, data)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_geohash_cover_contains_points(self):
+        bounds = Bounds(30.2, -97.8, 30.3, -97.7)
+        prefixes = covering_geohashes(bounds)
+        self.assertLessEqual(len(prefixes), 32)
+        for business in Business.objects.all():
+            self.assertEqual(business.geohash, encode_geohash(float(business.latitude), float(business.longitude)))
+            self.assertTrue(any(business.geohash.startswith(p) for p in prefixes))
+
+    def test_nearby_sorted_by_distance(self):
+        response = self.client.get(
+            '/api/scraper/businesses/nearby/', {'lat': 30.25, 'lng': -97.75, 'radius': 2000, 'limit': 5}
+        )
+        self.assertEqual(response.status_code, 200)
+        expected = sorted(
+            (haversine(30.25, -97.75, float(b.latitude), float(b.longitude)), b.place_id)
+            for b in Business.objects.all()
+        )
+        within = [item for item in expected if item[0] <= 2000]
+        self.assertEqual(response.data['count'], len(within))
+        distances = [item['distance'] for item in response.data['results']]
+        self.assertEqual(distances, sorted(distances))
+        self.assertEqual(response.data['results'][0]['place_id'], within[0][1])
+        self.assertEqual(len(distances), 5)
+
+    def test_within_bounds(self):
+        response = self.client.get(
+            '/api/scraper/businesses/within/',
+            {'south': 30.215, 'west': -97.785, 'north': 30.235, 'east': -97.765}
+        )
+        self.assertEqual(response.status_code, 200)
+        # Rows 1-2 and columns 1-2 of the grid
+        self.assertEqual(response.data['count'], 4)
+
+        response = self.client.get(
+            '/api/scraper/businesses/within/', {'south': 30.3, 'west': -97.8, 'north': 30.2, 'east': -97.7}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class DeduplicationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+
+    def save(self, query, businesses_data):
+        search = Search.objects.create(user=self.user, query=query)
+        with transaction.atomic():
+            businesses = save_search_results(search, businesses_data)
+        return search, businesses
+
+    def place(self, place_id, name, phone=None, website=None, lat=30.2672, lng=-97.7431, **extra):
+        return {
+            **make_business_data(1)[0],
+            'place_id': place_id, 'name': name, 'phone': phone, 'website': website,
+            'address': '600 Congress Ave, Austin', 'latitude': lat, 'longitude': lng,
+            **extra
+        }
+
+    def test_normalization(self):
+        self.assertEqual(normalize_phone('+44 20 7946 0958'), normalize_phone('020 7946 0958'))
+        self.assertIsNone(normalize_phone('n/a'))
+        self.assertEqual(registered_domain('https://shop.example.co.uk/contact'), 'example.co.uk')
+        self.assertEqual(registered_domain('joes-pizza.business.site'), 'joes-pizza.business.site')
+        self.assertIsNone(registered_domain('https://www.facebook.com/joespizza'))
+
+    def test_chain_branches_are_not_duplicates(self):
+        _, (a, b, c) = self.save('coffee', [
+            self.place('p1', "Joe's Coffee", '(512) 555-0100', 'https://joescoffee.com'),
+            self.place('p2', 'Joes Coffee LLC', '512-555-0100', 'http://www.joescoffee.com/austin',
+                       lat=30.2673, lng=-97.7432),
+            self.place('p3', "Joe's Coffee", '(512) 555-0100', 'https://joescoffee.com',
+                       lat=30.40, lng=-97.70, address='12800 N Lamar Blvd, Austin'),
+        ])
+        self.assertGreaterEqual(match_score(a, b), 0.9)
+        self.assertLess(match_score(a, c), settings.DEDUP_MATCH_THRESHOLD)
+
+    def unplaced(self, query, name, phone=None, user=None, **extra):
+        """A business entered without a place_id, linked to a new search."""
+        search = Search.objects.create(user=user or self.user, query=query, results_count=1)
+        business = Business.objects.create(
+            search=search, name=name, phone=phone, address='600 Congress Ave, Austin',
+            latitude=30.2672, longitude=-97.7431, **extra
+        )
+        search.results.add(business)
+        business.search_history.add(search)
+        return search, business
+
+    def test_incremental_merge_moves_links(self):
+        old_search, old = self.unplaced(
+            'pizza', "Tony's Pizza", '(512) 555-0199', email='tony@example.com'
+        )
+        new_search, (new, other) = self.save('pizza austin', [
+            self.place('new-id', 'Tonys Pizza', '+1 512 555 0199', website='https://tonys.example.com'),
+            self.place('other', 'Bookstore', '(512) 555-0123'),
+        ])
+
+        self.assertEqual(deduplicate_businesses([new, other]), 1)
+
+        self.assertFalse(Business.objects.filter(pk=old.pk).exists())
+        kept = Business.objects.get(pk=new.pk)
+        self.assertEqual(kept.email, 'tony@example.com')
+        self.assertEqual(set(kept.searches.all()), {old_search, new_search})
+        self.assertEqual(set(kept.search_history.all()), {old_search, new_search})
+        old_search.refresh_from_db()
+        self.assertEqual(old_search.results_count, 1)
+        self.assertEqual(Business.objects.count(), 2)
+        # A full pass finds nothing left to merge
+        self.assertEqual(deduplicate_businesses(), 0)
+
+    def test_businesses_with_place_ids_never_merged(self):
+        # Two branches in one mall: same name and domain, within 100 m
+        _, (a, b) = self.save('coffee', [
+            self.place('p1', "Joe's Coffee", website='https://joescoffee.com'),
+            self.place('p2', "Joe's Coffee", website='https://joescoffee.com',
+                       lat=30.2673, lng=-97.7432, address='600 Congress Ave Suite 2, Austin'),
+        ])
+        self.assertGreaterEqual(match_score(a, b), settings.DEDUP_MATCH_THRESHOLD)
+        self.assertEqual(deduplicate_businesses(), 0)
+
+        # A row without a place_id matching both is folded into one of them
+        _, unplaced = self.unplaced('coffee shops', "Joe's Coffee", website='https://joescoffee.com')
+        self.assertEqual(deduplicate_businesses([unplaced]), 1)
+        self.assertEqual(
+            sorted(Business.objects.values_list('place_id', flat=True)), ['p1', 'p2']
+        )
+        self.assertEqual(deduplicate_businesses(), 0)
+
+    def test_businesses_seen_by_different_users_not_merged(self):
+        _, (place,) = self.save('pizza', [self.place('p1', "Tony's Pizza", '(512) 555-0199')])
+        other = User.objects.create_user('other@example.com', 'password', name='Other')
+        _, theirs = self.unplaced('pizza', "Tony's Pizza", '(512) 555-0199', user=other)
+        self.assertGreaterEqual(match_score(place, theirs), settings.DEDUP_MATCH_THRESHOLD)
+        self.assertEqual(deduplicate_businesses([theirs]), 0)
+        self.assertEqual(merge_duplicate_groups([[place.pk, theirs.pk]]), 0)
+
+        _, mine = self.unplaced('pizza austin', "Tony's Pizza", '(512) 555-0199')
+        self.assertEqual(deduplicate_businesses([mine]), 1)
+        self.assertEqual(set(Business.objects.values_list('pk', flat=True)), {place.pk, theirs.pk})
+
+
+class RateLimitTests(TestCase):
+    def test_bucket_allows_burst_then_waits(self):
+        bucket = TokenBucket('test', rate=10, burst=3)
+        self.assertEqual([bucket.try_acquire() for _ in range(3)], [0.0, 0.0, 0.0])
+        wait = bucket.try_acquire()
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 0.1)
+        self.assertGreater(bucket.acquire(), 0)
+
+    async def test_async_bucket_allows_burst_then_waits(self):
+        bucket = TokenBucket('test', rate=10, burst=3)
+        self.assertEqual([await bucket.atry_acquire() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertGreater(await bucket.atry_acquire(), 0)
+        self.assertGreater(await bucket.aacquire(), 0)
+
+    def test_usage_counters_accumulate(self):
+        user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        record_api_usage(user.pk, {'places': 2, 'place': 20})
+        record_api_usage(user.pk, {'places': 1, 'places_nearby': 0})
+
+        self.assertEqual(
+            dict(ApiUsage.objects.filter(user=user).values_list('call', 'count')),
+            {'places': 3, 'place': 20}
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/scraper/usage/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+
+
+class BenchmarkTests(TestCase):
+    def test_pipeline_runs_against_fake_servers(self):
+        report = run_benchmark(
+            [25], [4], repeat=1, api_latency=0, site_latency=0, site_size=1000,
+            token_delay=0.1, throttled=False
+        )
+        run = report['runs'][0]
+        self.assertEqual(run['places'], 25)
+        self.assertEqual(run['api_calls'], {'places': 2, 'place': 25})
+        self.assertEqual(run['website_requests'], 25)
+        self.assertGreater(run['db_queries'], 0)
+        # Everything was rolled back
+        self.assertFalse(Business.objects.exists())
+
+    def test_async_service_against_fake_servers(self):
+        report = run_benchmark(
+            [25], [4], repeat=1, api_latency=0, site_latency=0, site_size=1000,
+            token_delay=0.1, throttled=False, async_service=True
+        )
+        run = report['runs'][0]
+        self.assertEqual(run['places'], 25)
+        self.assertEqual(run['api_calls'], {'places': 2, 'place': 25})
+        self.assertEqual(run['emails_found'], 25)
+        self.assertEqual(run['website_requests'], 25)
+
+
+class CrawlerTests(TestCase):
+    def test_contact_links_ranked_and_same_host(self):
+        html = (
+            '<a href="/about">About</a><a href="https://other.test/contact">x</a>'
+            '<a href="/page?id=2">Kontakt</a><a href="mailto:a@b.test">mail</a>'
+        )
+        self.assertEqual(
+            contact_links(html, 'https://site.test/', 3),
+            ['https://site.test/page?id=2', 'https://site.test/about', 'https://site.test/contact']
+        )
+
+    def test_extractor_single_pass(self):
+        page = (
+            '<html><script>var fake = "x@tracker.test";</script><!-- old@shop.test -->'
+            '<p>Mail info&#64;shop.test or jo [at] shop [dot] co [dot] uk</p>'
+            '<a href="mailto:%20sales@shop.test?subject=Hi">Email</a>'
+            '<p>Call 020 7946 0958, open 2023-2024</p>'
+            '<a href="https://x.com/shop">X</a><a href="https://inbox.test/">Inbox</a></html>'
+        ).encode()
+        # Chunks split elements and text; the cap cuts the page
+        extractor, read, truncated = extract_chunks(
+            [page[i:i + 7] for i in range(0, len(page), 7)], max_bytes=len(page) - 7
+        )
+        self.assertEqual(extractor.emails, ['sales@shop.test', 'info@shop.test', 'jo@shop.co.uk'])
+        self.assertEqual(extractor.phones, ['020 7946 0958'])
+        self.assertEqual(extractor.social_links, {'twitter_link': 'https://x.com/shop'})
+        self.assertEqual(extractor.links[-1], ('https://inbox.test/', 'Inbox'))
+        self.assertTrue(truncated)
+        self.assertEqual(read, len(page) - 7)
+
+    def test_extractor_holds_back_open_elements(self):
+        # 'İ' lowercases to two characters; a script arrives in many chunks
+        page = (
+            'İİ<SCRIPT>var a = "<b>fake@tracker.test</b>";' + 'var b = 1 > 0;' * 50
+            + '</SCRIPT><A HREF="mailto:shop@shop.test">Mail</A>'
+        ).encode()
+        extractor, _, _ = extract_chunks([page[i:i + 5] for i in range(0, len(page), 5)])
+        self.assertEqual(extractor.emails, ['shop@shop.test'])
+        self.assertEqual(extractor.links, [('mailto:shop@shop.test', 'Mail')])
+
+    def test_anchor_not_closed_by_longer_end_tags(self):
+        # The page arrives cut right after </abbr>
+        chunks = [b'<a href="/kontakt"><abbr>Ct</abbr>', b' Kontakt</a><p>hi</p>']
+        extractor, _, _ = extract_chunks(chunks)
+        self.assertEqual(extractor.links, [('/kontakt', 'Ct Kontakt')])
+
+    def test_finds_email_on_contact_page(self):
+        with FakeWebsites(latency=0, size=1000, email_page='contact') as sites:
+            crawler = ContactCrawler(limiter=DomainLimiter(concurrency=2, interval=0))
+            self.assertEqual(crawler.find_email(f'{sites.url}/site/abc'), 'info@abc.test')
+            # The homepage, then the contact and about pages
+            self.assertLessEqual(sites.requests['page'], 3)
+
+    def test_slow_page_stops_at_site_budget(self):
+        class DrippingResponse:
+            status_code = 200
+            headers = {'Content-Type': 'text/html'}
+            url = 'https://slow.test/'
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                pass
+
+            def iter_content(self, chunk_size):
+                while True:
+                    time.sleep(0.05)
+                    yield b'<p>'
+
+        session = mock.Mock(get=mock.Mock(return_value=DrippingResponse()))
+        crawler = ContactCrawler(
+            session=session, limiter=DomainLimiter(concurrency=1, interval=0), site_budget=0.3
+        )
+        started = time.monotonic()
+        contacts = crawler.crawl('https://slow.test/')
+        self.assertIsNone(contacts.status)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_contact_links_follow_homepage_redirect(self):
+        class Response:
+            status_code = 200
+            headers = {'Content-Type': 'text/html'}
+
+            def __init__(self, url, body):
+                self.url = url
+                self.body = body
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                pass
+
+            def iter_content(self, chunk_size):
+                yield self.body.encode()
+
+        pages = {
+            # http://old.test/ redirects to the new domain
+            'http://old.test/': Response('https://www.new.test/', '<a href="contact">Contact us</a>'),
+            'https://www.new.test/contact': Response('https://www.new.test/contact', '<p>hi@new.test</p>'),
+        }
+        session = mock.Mock(get=mock.Mock(
+            side_effect=lambda url, **kwargs: pages.get(url, Response(url, ''))
+        ))
+        crawler = ContactCrawler(session=session, limiter=DomainLimiter(concurrency=2, interval=0))
+        self.assertEqual(crawler.find_email('http://old.test/'), 'hi@new.test')
+
+    async def test_async_crawler_finds_email_on_contact_page(self):
+        with FakeWebsites(latency=0, size=1000, email_page='contact') as sites:
+            crawler = AsyncContactCrawler(limiter=AsyncDomainLimiter(concurrency=2, interval=0))
+            contacts = await crawler.crawl(f'{sites.url}/site/abc')
+            self.assertEqual(contacts.email, 'info@abc.test')
+            self.assertEqual(contacts.social_links, {'facebook_link': 'https://www.facebook.com/abc'})
+            self.assertLessEqual(sites.requests['page'], 3)
+
+
+class StubCrawler:
+    """Crawler returning canned results and recording the URLs crawled."""
+    site_budget = 0.5
+    page_timeout = 0.5
+
+    def __init__(self, contacts):
+        self.contacts = contacts
+        self.crawled = []
+
+    def crawl(self, url, etag=None, last_modified=None):
+        self.crawled.append((url, etag))
+        return self.contacts
+
+
+class DomainEnrichmentTests(TestCase):
+    def setUp(self):
+        caches['rate_limit'].clear()
+
+    def test_domain_crawled_once_per_ttl(self):
+        crawler = StubCrawler(
+            SiteContacts(200, 'hi@chain.com', None, {'facebook_link': 'https://facebook.com/chain'}, '"v1"')
+        )
+        enrichment = DomainEnrichmentCache(crawler, ttl=3600, negative_ttl=60)
+        first = enrichment.lookup('https://www.chain.com/locations/1')
+        second = enrichment.lookup('http://shop.chain.com/')
+        self.assertEqual(first, second)
+        self.assertEqual(first['email'], 'hi@chain.com')
+        self.assertEqual(first['facebook_link'], 'https://facebook.com/chain')
+        self.assertEqual(len(crawler.crawled), 1)
+
+        # Expired: the same homepage is revalidated and kept when unchanged
+        DomainEnrichment.objects.update(expires_at=timezone.now())
+        crawler.contacts = SiteContacts(304, None, None, {})
+        self.assertEqual(enrichment.lookup('https://www.chain.com/locations/1'), first)
+        self.assertEqual(crawler.crawled[-1], ('https://www.chain.com/locations/1', '"v1"'))
+        self.assertGreater(DomainEnrichment.objects.get().expires_at, timezone.now())
+
+    def test_dead_sites_cached_briefly_and_locks_respected(self):
+        crawler = StubCrawler(SiteContacts(None, None, None, {}))
+        enrichment = DomainEnrichmentCache(crawler, ttl=3600, negative_ttl=60)
+        self.assertIsNone(enrichment.lookup('https://gone.example')['email'])
+        enrichment.lookup('https://gone.example')
+        entry = DomainEnrichment.objects.get(domain='gone.example')
+        self.assertFalse(entry.reachable)
+        self.assertLess(entry.expires_at, timezone.now() + timedelta(seconds=61))
+        self.assertEqual(len(crawler.crawled), 1)
+
+        # Another worker holds the crawl lock: wait for it instead of crawling
+        caches['rate_limit'].add('domain-lock:busy.example', 1, timeout=1)
+        self.assertIsNone(enrichment.lookup('https://busy.example')['email'])
+        self.assertEqual(len(crawler.crawled), 1)
+
+    # SQLite never closes the in-memory test database
+    @skipUnless(connection.vendor == 'postgresql', 'needs a database connections can be closed on')
+    def test_worker_connections_closed_on_pool_shutdown(self):
+        def query(_):
+            connection.ensure_connection()
+            return connection.connection is not None, connections['default']
+
+        with DatabaseThreadPool(max_workers=2) as pool:
+            results = list(pool.map(query, range(3)))
+        # Kept open between tasks, closed once the pool shuts down
+        self.assertTrue(all(open_during for open_during, _ in results))
+        self.assertTrue(all(wrapper.connection is None for _, wrapper in results))
+        self.assertIsNotNone(connection.connection)
+
+
+class StubMaps:
+    """Places client answering details calls from a dict."""
+
+    def __init__(self, details):
+        self.details = details
+
+    def place(self, place_id, fields=None):
+        return {'status': 'OK', 'result': self.details.get(place_id, {})}
+
+
+class StubEnrichment:
+    crawler = None
+
+    def __init__(self):
+        self.looked_up = []
+
+    def lookup(self, website_url):
+        self.looked_up.append(website_url)
+        return {'email': f'new@{registered_domain(website_url)}', 'phone': None}
+
+
+class RefreshTests(TestCase):
+    def test_refreshes_expired_fields_only(self):
+        user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        search = Search.objects.create(user=user, query='dentists')
+        data = make_business_data(3)
+        data[0]['website'] = 'https://zero.test'
+        with transaction.atomic():
+            save_search_results(search, data)
+        now = timezone.now()
+        # Details and contacts expired; the third business is fresh
+        Business.objects.exclude(place_id='place-2').update(
+            details_fetched_at=now - timedelta(days=40),
+            contacts_fetched_at=now - timedelta(days=10)
+        )
+        service = GoogleMapsService(
+            max_workers=2,
+            client=StubMaps({'place-0': {'formatted_phone_number': '(512) 555-0199', 'website': 'https://zero.test'}}),
+            buckets={name: TokenBucket(name, 1e9, 10 ** 9, alias=None) for name in ('text_search', 'details')},
+            enrichment=StubEnrichment()
+        )
+
+        report = refresh_businesses(batch_size=1, service=service)
+        self.assertEqual(
+            {key: report[key] for key in ('checked', 'changed', 'unchanged', 'skipped')},
+            {'checked': 2, 'changed': 1, 'unchanged': 1, 'skipped': 0}
+        )
+        self.assertEqual(report['fields_changed'], {'phone': 1, 'email': 1})
+        self.assertEqual(report['api_calls'], {'place': 2})
+        refreshed = Business.objects.get(place_id='place-0')
+        self.assertEqual((refreshed.phone, refreshed.email), ('(512) 555-0199', 'new@zero.test'))
+        self.assertEqual(refreshed.normalized_phone, '5125550199')
+        self.assertFalse(due_businesses().exists())
+
+    def test_sweep_batches_expired_rows_and_retries_failures(self):
+        class FailingMaps(StubMaps):
+            requested = []
+
+            def place(self, place_id, fields=None):
+                self.requested.append(place_id)
+                if place_id == 'place-3':
+                    raise TimeoutError('Place Details timed out')
+                return super().place(place_id, fields)
+
+        user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        search = Search.objects.create(user=user, query='dentists')
+        with transaction.atomic():
+            save_search_results(search, make_business_data(6))
+        stale = timezone.now() - timedelta(days=40)
+        Business.objects.exclude(place_id='place-5').update(details_fetched_at=stale)
+        client = FailingMaps({f'place-{i}': {'formatted_phone_number': f'(512) 555-010{i}'} for i in range(6)})
+        service = GoogleMapsService(
+            max_workers=2,
+            client=client,
+            buckets={name: TokenBucket(name, 1e9, 10 ** 9, alias=None) for name in ('text_search', 'details')},
+            enrichment=StubEnrichment()
+        )
+
+        with mock.patch('scraper.refresh._write_changes', wraps=_write_changes) as write:
+            report = refresh_businesses(batch_size=2, service=service)
+        self.assertEqual(sorted(client.requested), ['place-0', 'place-1', 'place-2', 'place-3', 'place-4'])
+        self.assertEqual([len(call.args[0]) for call in write.call_args_list], [2, 1, 1])
+        self.assertEqual(
+            {key: report[key] for key in ('checked', 'changed', 'unchanged', 'skipped')},
+            {'checked': 5, 'changed': 4, 'unchanged': 0, 'skipped': 1}
+        )
+        # The failed row keeps its timestamp and is retried by the next sweep
+        self.assertEqual(list(due_businesses().values_list('place_id', flat=True)), ['place-3'])
+        self.assertEqual(Business.objects.get(place_id='place-3').details_fetched_at, stale)
+
+    def test_sweep_skipped_while_another_worker_holds_the_lock(self):
+        held, release = threading.Event(), threading.Event()
+
+        def other_worker():
+            try:
+                with sweep_lock('refresh-sweep'):
+                    held.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=other_worker)
+        thread.start()
+        held.wait(5)
+        try:
+            with mock.patch('scraper.tasks.refresh_businesses') as refresh:
+                refresh_stale_businesses()
+            refresh.assert_not_called()
+        finally:
+            release.set()
+            thread.join()
+        with mock.patch('scraper.tasks.refresh_businesses') as refresh:
+            refresh_stale_businesses()
+        refresh.assert_called_once()
+
+
+class StubPlaces(StubMaps):
+    """Places client answering text searches from a dict of query -> place ids."""
+
+    def __init__(self, listings, details):
+        super().__init__(details)
+        self.listings = listings
+
+    def places(self, query, **kwargs):
+        if query not in self.listings:
+            raise ValueError(f'no listing for {query}')
+        return {'status': 'OK', 'results': [
+            {'place_id': place_id, 'name': place_id, 'geometry': {'location': {'lat': 30.0, 'lng': -97.0}}}
+            for place_id in self.listings[query]
+        ]}
+
+
+class StubNearby(StubMaps):
+    """Places client answering nearby searches with the places inside the circle, page_size per page."""
+
+    def __init__(self, places, page_size):
+        super().__init__({})
+        self.places = places
+        self.page_size = page_size
+        self.pages = {}
+
+    def places_nearby(self, location=None, radius=None, keyword=None, page_token=None):
+        if page_token:
+            found = self.pages.pop(page_token)
+        else:
+            found = [
+                {'place_id': place_id, 'name': place_id, 'geometry': {'location': {'lat': lat, 'lng': lng}}}
+                for place_id, (lat, lng) in self.places.items()
+                if haversine(*location, lat, lng) <= radius
+            ]
+        result = {'status': 'OK', 'results': found[:self.page_size]}
+        if found[self.page_size:]:
+            result['next_page_token'] = f'page-{len(self.pages)}-{location}'
+            self.pages[result['next_page_token']] = found[self.page_size:]
+        return result
+
+
+class StubPages(StubMaps):
+    """
+    Places client serving a text search as result pages linked by
+    next_page_token. A token in `inactive` fails with INVALID_REQUEST that
+    many times before it works, as a token fetched too early does.
+    """
+
+    def __init__(self, pages, details=None, inactive=None, details_delay=None):
+        super().__init__(details or {})
+        self.pages = pages
+        self.inactive = dict(inactive or {})
+        self.details_delay = details_delay or {}
+        self.tokens_requested = []
+
+    def places(self, query=None, page_token=None, **kwargs):
+        index = 0
+        if page_token:
+            self.tokens_requested.append(page_token)
+            if self.inactive.get(page_token):
+                self.inactive[page_token] -= 1
+                raise googlemaps.exceptions.ApiError('INVALID_REQUEST')
+            index = int(page_token[len('page-'):])
+        result = {'status': 'OK', 'results': [
+            {'place_id': place_id, 'name': place_id, 'geometry': {'location': {'lat': 30.0, 'lng': -97.0}}}
+            for place_id in self.pages[index]
+        ]}
+        if index + 1 < len(self.pages):
+            result['next_page_token'] = f'page-{index + 1}'
+        return result
+
+    def place(self, place_id, fields=None):
+        time.sleep(self.details_delay.get(place_id, 0))
+        return super().place(place_id, fields)
+
+
+@override_settings(GOOGLE_MAPS_PAGE_TOKEN_DELAY=0)
+class SearchPlacesTests(TestCase):
+    def setUp(self):
+        caches['place_details'].clear()
+
+    def service(self, places):
+        return GoogleMapsService(
+            max_workers=4,
+            details_cache=PlaceDetailsCache(),
+            client=places,
+            buckets={name: TokenBucket(name, 1e9, 10 ** 9, alias=None) for name in ('text_search', 'details')},
+            enrichment=StubEnrichment()
+        )
+
+    def test_results_keep_rank_order_when_details_finish_out_of_order(self):
+        # The first places take longest to fetch
+        ranked = ['p1', 'p2', 'p3', 'p4']
+        places = StubPages([ranked], details_delay={'p1': 0.15, 'p2': 0.1, 'p3': 0.05})
+        completed = []
+        businesses = self.service(places).search_places(
+            'dentists', on_results=lambda batch: completed.extend(b['place_id'] for b in batch)
+        )
+        self.assertEqual([b['place_id'] for b in businesses], ranked)
+        self.assertEqual(sorted(completed), ranked)
+        self.assertNotEqual(completed, ranked)
+
+    def test_pages_followed_deduplicated_and_capped(self):
+        places = StubPages([['p1', 'p2'], ['p2', 'p3'], ['p4']])
+        service = self.service(places)
+        businesses = service.search_places('dentists', max_pages=2)
+        self.assertEqual([b['place_id'] for b in businesses], ['p1', 'p2', 'p3'])
+        self.assertEqual(service.pages_fetched, 2)
+        self.assertEqual(places.tokens_requested, ['page-1'])
+        self.assertEqual(dict(service.api_calls), {'places': 2, 'place': 3})
+
+    def test_inactive_page_token_retried(self):
+        places = StubPages([['p1'], ['p2']], inactive={'page-1': 2})
+        service = self.service(places)
+        businesses = service.search_places('dentists')
+        self.assertEqual([b['place_id'] for b in businesses], ['p1', 'p2'])
+        self.assertEqual(places.tokens_requested, ['page-1'] * 3)
+
+        # A token still inactive after PAGE_TOKEN_RETRIES attempts fails the search
+        places = StubPages([['p1'], ['p2']], inactive={'page-1': 3})
+        with self.assertRaises(googlemaps.exceptions.ApiError):
+            self.service(places).search_places('dentists')
+
+
+class TileSweepTests(TestCase):
+    @override_settings(GOOGLE_MAPS_SWEEP_GRID=2, GOOGLE_MAPS_SWEEP_MAX_DEPTH=1, GOOGLE_MAPS_PAGE_TOKEN_DELAY=0)
+    def test_sweep_splits_dense_tiles_and_dedups_before_details(self):
+        user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.captureOnCommitCallbacks():
+            response = client.post('/api/scraper/searches/sweep/', {
+                'keyword': 'dentist', 'south': 30.0, 'west': -97.2, 'north': 30.2, 'east': -97.0
+            }, format='json')
+        self.assertEqual(response.status_code, 202)
+
+        places = StubNearby({
+            # Dense south-west quarter
+            'sw-1': (30.03, -97.17), 'sw-2': (30.04, -97.16), 'sw-3': (30.06, -97.14), 'sw-4': (30.07, -97.13),
+            # Found by all four quarters
+            'center': (30.099, -97.101),
+            # Found by the north-west quarter's circle, outside the box
+            'outside': (30.201, -97.15),
+        }, page_size=3)
+        service = GoogleMapsService(
+            max_workers=2,
+            client=places,
+            details_cache=PlaceDetailsCache(),
+            buckets={name: TokenBucket(name, 1e9, 10 ** 9, alias=None) for name in ('text_search', 'details')},
+            enrichment=StubEnrichment()
+        )
+        with mock.patch('scraper.tasks.GoogleMapsService', return_value=service):
+            run_search_job(response.data['job']['id'])
+
+        job = SearchJob.objects.get(pk=response.data['job']['id'])
+        self.assertEqual(job.status, SearchJob.Status.DONE)
+        # Four quarters, then the dense one split into four
+        self.assertEqual(job.tiles_searched, 8)
+        self.assertEqual(
+            set(job.search.results.values_list('place_id', flat=True)),
+            {'sw-1', 'sw-2', 'sw-3', 'sw-4', 'center'}
+        )
+        # One details call per place, however many tiles found it; the
+        # center alone is found by all four quarters
+        self.assertEqual(service.api_calls['place'], 5)
+        self.assertGreaterEqual(job.details_calls_saved, 3)
+
+
+class PlaceDetailsCacheTests(TestCase):
+    def setUp(self):
+        caches['place_details'].clear()
+        self.enrichment = StubEnrichment()
+        self.service = GoogleMapsService(
+            max_workers=1,
+            details_cache=PlaceDetailsCache(),
+            client=StubPlaces(
+                {'dentists': ['p1']},
+                {'p1': {'formatted_phone_number': '(512) 555-0101', 'website': 'https://one.test'}}
+            ),
+            buckets={name: TokenBucket(name, 1e9, 10 ** 9, alias=None) for name in ('text_search', 'details')},
+            enrichment=self.enrichment
+        )
+
+    def search(self):
+        [business] = self.service.search_places('dentists')
+        return business
+
+    def calls(self):
+        return self.service.api_calls['place'], len(self.enrichment.looked_up)
+
+    def test_hit_partial_expiry_and_miss(self):
+        first = self.search()
+        self.assertEqual((first['phone'], first['email']), ('(512) 555-0101', 'new@one.test'))
+        self.assertEqual(self.search(), first)
+        self.assertEqual(self.calls(), (1, 1))
+
+        # Contacts expire before phone and website: crawl again, no details call
+        cache = self.service.details_cache
+        cache.cache.delete_many([cache._key('p1', field) for field in ('email', 'facebook_link')])
+        self.assertEqual(cache.get('p1').expired, ['email', 'facebook_link'])
+        self.assertEqual(self.search(), first)
+        self.assertEqual(self.calls(), (1, 2))
+
+        # Phone expired, contacts fresh: details call only
+        cache.cache.delete(cache._key('p1', 'phone'))
+        self.assertEqual(self.search(), first)
+        self.assertEqual(self.calls(), (2, 2))
+
+        cache.cache.clear()
+        refetched = self.search()
+        self.assertEqual(refetched, {**first, 'details_fetched_at': mock.ANY, 'contacts_fetched_at': mock.ANY})
+        self.assertGreater(refetched['details_fetched_at'], first['details_fetched_at'])
+        self.assertEqual(self.calls(), (3, 3))
+        self.assertEqual(
+            {key: value for key, value in cache.stats().items() if key != 'hit_rate'},
+            {'hits': 1, 'partial_hits': 3, 'misses': 2}
+        )
+
+    def test_fetch_times_of_cached_fields_kept(self):
+        first = self.search()
+        self.assertIsNotNone(first['details_fetched_at'])
+        self.assertEqual(first['contacts_fetched_at'], first['details_fetched_at'])
+        # Served from the cache: stamped with the time the fields were fetched
+        self.assertEqual(self.search(), first)
+
+        # Each group is as old as its oldest field
+        cache = self.service.details_cache
+        cache.cache.delete(cache._key('p1', 'email'))
+        self.assertEqual(self.search()['contacts_fetched_at'], first['contacts_fetched_at'])
+
+        # A crawl that found nothing leaves the contacts without a fetch time
+        cache.cache.delete(cache._key('p1', 'email'))
+        with mock.patch.object(self.enrichment, 'lookup', return_value={'email': None, 'phone': None}):
+            failed = self.search()
+        self.assertIsNone(failed['contacts_fetched_at'])
+        self.assertEqual(failed['details_fetched_at'], first['details_fetched_at'])
+        self.assertIsNone(self.search()['contacts_fetched_at'])
+
+    async def test_async_get_and_set(self):
+        cache = PlaceDetailsCache()
+        await cache.aset('p2', {'phone': '(512) 555-0102', 'email': None})
+        cached = await cache.aget('p2')
+        self.assertEqual(cached.fields, {'phone': '(512) 555-0102', 'email': None})
+        self.assertEqual(cached, cache.get('p2'))
+
+
+class SearchBatchTests(TestCase):
+    def setUp(self):
+        caches['place_details'].clear()
+        self.user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_batch_fetches_shared_places_once(self):
+        upload = SimpleUploadedFile(
+            'queries.csv', b'city,query\nAustin,dentists austin\nRound Rock,dentists round rock\n'
+            b'Austin,Dentists  Austin\nNowhere,broken\n'
+        )
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/scraper/batches/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        # The repeated query is dropped
+        self.assertEqual(
+            [job['query'] for job in response.data['jobs']],
+            ['dentists austin', 'dentists round rock', 'broken']
+        )
+        self.assertEqual(len(callbacks), 1)
+
+        service = GoogleMapsService(
+            max_workers=2,
+            client=StubPlaces(
+                {'dentists austin': ['p1', 'p2'], 'dentists round rock': ['p2', 'p3']},
+                {'p2': {'formatted_phone_number': '(512) 555-0102'}}
+            ),
+            buckets={name: TokenBucket(name, 1e9, 10 ** 9, alias=None) for name in ('text_search', 'details')},
+            enrichment=StubEnrichment()
+        )
+        with mock.patch('scraper.tasks.GoogleMapsService', return_value=service):
+            run_search_batch(response.data['id'])
+
+        batch = SearchBatch.objects.get()
+        self.assertEqual(
+            (batch.status, batch.queries_searched, batch.places_found, batch.details_calls_saved, batch.results_saved),
+            (SearchJob.Status.DONE, 3, 3, 1, 4)
+        )
+        self.assertEqual(service.api_calls, {'places': 3, 'place': 3})
+        results = self.client.get(f'/api/scraper/batches/{batch.pk}/results/').data
+        self.assertEqual([item['status'] for item in results], ['done', 'done', 'failed'])
+        self.assertEqual(
+            [sorted(Business.objects.get(uuid=uuid).place_id for uuid in item['business_ids']) for item in results],
+            [['p1', 'p2'], ['p2', 'p3'], []]
+        )
+        self.assertEqual(Business.objects.get(place_id='p2').phone, '(512) 555-0102')
+        self.assertEqual(ApiUsage.objects.get(user=self.user, call='place').count, 3)
+
+
+class QueryCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        source = Search.objects.create(
+            user=self.user, query='dentists in Austin TX', normalized_query=normalize_query('dentists in Austin TX')
+        )
+        with transaction.atomic():
+            save_search_results(source, make_business_data(3))
+        self.source_job = SearchJob.objects.create(
+            search=source, status=SearchJob.Status.DONE, finished_at=timezone.now()
+        )
+
+    def create(self, query):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/scraper/searches/', {'query': query}, format='json')
+        self.assertEqual(response.status_code, 202)
+        return response.data, len(callbacks)
+
+    def test_fresh_hit_served_without_a_job(self):
+        data, queued = self.create('  austin TX DENTISTS in ')
+        self.assertEqual((data['job']['status'], data['job']['cache_status'], queued), ('done', 'fresh', 0))
+        self.assertEqual(len(data['results']), 3)
+
+    def test_stale_hit_served_and_refreshed(self):
+        SearchJob.objects.filter(pk=self.source_job.pk).update(
+            finished_at=timezone.now() - timedelta(seconds=settings.QUERY_CACHE_FRESHNESS + 1)
+        )
+        data, queued = self.create('Dentists in Austin TX')
+        self.assertEqual((data['job']['status'], data['job']['cache_status'], queued), ('queued', 'stale', 1))
+        self.assertEqual(len(data['results']), 3)
+
+    def test_stale_hit_reuses_running_refresh(self):
+        SearchJob.objects.filter(pk=self.source_job.pk).update(
+            finished_at=timezone.now() - timedelta(seconds=settings.QUERY_CACHE_FRESHNESS + 1)
+        )
+        self.create('Dentists in Austin TX')
+        data, queued = self.create('dentists in austin tx')
+        self.assertEqual((data['job']['status'], data['job']['cache_status'], queued), ('done', 'refreshing', 0))
+        self.assertEqual(len(data['results']), 3)
+
+        # A refresh whose worker died does not hold back new ones
+        SearchJob.objects.filter(cache_status=SearchJob.CacheStatus.STALE).update(
+            status=SearchJob.Status.RUNNING,
+            started_at=timezone.now() - timedelta(seconds=settings.SEARCH_JOB_TIMEOUT + 1)
+        )
+        data, queued = self.create('dentists in austin tx')
+        self.assertEqual((data['job']['status'], data['job']['cache_status'], queued), ('queued', 'stale', 1))
+
+        # Served without an API call, so it is no source for later searches
+        SearchJob.objects.filter(cache_status=SearchJob.CacheStatus.STALE).update(status=SearchJob.Status.FAILED)
+        data, queued = self.create('dentists in austin tx')
+        self.assertEqual((data['job']['status'], data['job']['cache_status'], queued), ('queued', 'stale', 1))
+
+    def test_searches_of_other_users_not_served(self):
+        other = User.objects.create_user('other@example.com', 'password', name='Other')
+        self.client.force_authenticate(other)
+        data, queued = self.create('dentists in Austin TX')
+        self.assertEqual((data['job']['status'], data['job']['cache_status'], queued), ('queued', 'miss', 1))
+
+        self.source_job.search.shared_with.add(other)
+        data, queued = self.create('dentists in Austin TX')
+        self.assertEqual((data['job']['status'], data['job']['cache_status'], queued), ('done', 'fresh', 0))
+        listed = self.client.get('/api/scraper/businesses/').data
+        self.assertEqual(len(listed['results']), 3)
+
+    def test_miss_queues_a_job(self):
+        data, queued = self.create('dentists in Round Rock TX')
+        self.assertEqual((data['job']['status'], data['job']['cache_status'], queued), ('queued', 'miss', 1))
+        self.assertEqual(data['results'], [])
+
+
+class SearchJobTests(TestCase):
+    def setUp(self):
+        caches['place_details'].clear()
+        self.user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Run queued jobs inline instead of sending them to a broker
+        delay = mock.patch.object(run_search_job, 'delay', side_effect=run_search_job)
+        delay.start()
+        self.addCleanup(delay.stop)
+
+    def service(self, places):
+        return GoogleMapsService(
+            max_workers=2,
+            client=places,
+            buckets={name: TokenBucket(name, 1e9, 10 ** 9, alias=None) for name in ('text_search', 'details')},
+            enrichment=StubEnrichment()
+        )
+
+    def test_create_runs_job_and_poll_reports_it(self):
+        service = self.service(StubPlaces({'dentists': ['p1', 'p2']}, {}))
+        with mock.patch('scraper.tasks.GoogleMapsService', return_value=service), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/scraper/searches/', {'query': 'dentists'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['job']['status'], 'queued')
+
+        job = self.client.get(f"/api/scraper/jobs/{response.data['job']['id']}/").data
+        self.assertEqual(
+            (job['status'], job['places_found'], job['results_saved']),
+            ('done', 2, 2)
+        )
+        listed = self.client.get(f"/api/scraper/jobs/?search={response.data['id']}").data
+        self.assertEqual([item['id'] for item in listed['results']], [job['id']])
+
+    def test_failed_job_reported_once_and_only_to_users_with_access(self):
+        search = Search.objects.create(user=self.user, query='dentists')
+        job = SearchJob.objects.create(search=search)
+
+        class FailingPlaces(StubPlaces):
+            def places(self, query, **kwargs):
+                raise googlemaps.exceptions.ApiError('REQUEST_DENIED', 'Key rejected')
+
+        with mock.patch('scraper.tasks.GoogleMapsService', return_value=self.service(FailingPlaces({}, {}))):
+            run_search_job(job.pk)
+        data = self.client.get(f'/api/scraper/jobs/{job.pk}/').data
+        self.assertEqual(data['status'], 'failed')
+        self.assertIn('REQUEST_DENIED', data['error'])
+
+        # A redelivered job is not run again
+        with mock.patch('scraper.tasks.GoogleMapsService') as service:
+            run_search_job(job.pk)
+        service.assert_not_called()
+
+        other = User.objects.create_user('other@example.com', 'password', name='Other')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/api/scraper/jobs/{job.pk}/').status_code, 404)
+        search.shared_with.add(other)
+        self.assertEqual(self.client.get(f'/api/scraper/jobs/{job.pk}/').status_code, 200)
+
+
+    def test_redelivered_job_taken_over_once_abandoned(self):
+        search = Search.objects.create(user=self.user, query='dentists')
+        started_at = timezone.now() - timedelta(seconds=settings.SEARCH_JOB_TIMEOUT - 60)
+        job = SearchJob.objects.create(search=search, status=SearchJob.Status.RUNNING, started_at=started_at)
+
+        # Its worker may still be running it
+        with mock.patch('scraper.tasks.GoogleMapsService') as service:
+            run_search_job(job.pk)
+        service.assert_not_called()
+
+        # Its worker died: the redelivered task runs it
+        SearchJob.objects.filter(pk=job.pk).update(started_at=started_at - timedelta(seconds=120))
+        service = self.service(StubPlaces({'dentists': ['p1']}, {}))
+        with mock.patch('scraper.tasks.GoogleMapsService', return_value=service):
+            run_search_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.results_saved), (SearchJob.Status.DONE, 1))
+        self.assertGreater(job.started_at, started_at)
+
+
+class JobEventTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        self.search = Search.objects.create(user=self.user, query='dentists')
+        self.job = SearchJob.objects.create(search=self.search, status=SearchJob.Status.RUNNING)
+        with transaction.atomic():
+            append_search_results(self.search, make_business_data(3))
+        SearchJob.objects.filter(pk=self.job.pk).update(
+            status=SearchJob.Status.DONE, places_found=3, details_fetched=3, results_saved=3
+        )
+        self.url = f'/api/scraper/jobs/{self.job.pk}/events/?token={AccessToken.for_user(self.user)}'
+
+    async def read_events(self, headers=None):
+        response = await self.async_client.get(self.url, headers=headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        events = []
+        for block in body.strip().split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in block.split('\n') if ': ' in line)
+            if 'event' in fields:
+                events.append((fields['event'], fields.get('id'), json.loads(fields['data'])))
+        return events
+
+    async def test_streams_results_then_done(self):
+        events = await self.read_events()
+        self.assertEqual([event for event, _, _ in events], ['results', 'progress', 'done'])
+        _, cursor, data = events[0]
+        self.assertEqual(sorted(b['place_id'] for b in data['businesses']), ['place-0', 'place-1', 'place-2'])
+        self.assertEqual(events[-1][2]['results_saved'], 3)
+
+        # A reconnecting client only gets the rows it has not seen
+        events = await self.read_events(headers={'Last-Event-ID': cursor})
+        self.assertEqual([event for event, _, _ in events], ['progress', 'done'])
+
+    async def test_requires_access(self):
+        self.url = f'/api/scraper/jobs/{self.job.pk}/events/?token=invalid'
+        self.assertEqual((await self.async_client.get(self.url)).status_code, 401)
+
+
+class MetricsTests(TestCase):
+    def test_metrics_endpoint_and_server_timing(self):
+        user = User.objects.create_user('owner@example.com', 'password', name='Owner')
+        search = Search.objects.create(user=user, query='dentists')
+        with transaction.atomic():
+            save_search_results(search, make_business_data(3))
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('scraper_rows_written_total{table="business"}', body)
+        self.assertIn('scraper_stage_seconds_bucket{le="0.005",stage="db_upsert"}', body)
+
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/scraper/businesses/')
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"')
+
+    async def test_server_timing_of_async_views_and_pool_threads(self):
+        def fetch():
+            with ContextThreadPool(max_workers=2) as executor:
+                executor.submit(observe_stage, 'worker', 0.002).result()
+            return Search.objects.count()
+
+        async def view(request):
+            await sync_to_async(fetch)()
+            return HttpResponse()
+
+        # Stays on the event loop under ASGI
+        middleware = ServerTimingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().get('/'))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="1 queries", worker;dur=2\.0$')
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
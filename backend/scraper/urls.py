@@ -7,7 +7,11 @@ app_name = 'scraper'
 router = DefaultRouter()
 router.register(r'searches', views.SearchViewSet, basename='search')
 router.register(r'businesses', views.BusinessViewSet, basename='business')
+router.register(r'jobs', views.SearchJobViewSet, basename='job')
+router.register(r'batches', views.SearchBatchViewSet, basename='batch')
+router.register(r'usage', views.ApiUsageViewSet, basename='usage')
 
 urlpatterns = [
+    path('jobs/<int:pk>/events/', views.job_event_stream, name='job-events'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
@@ -1,23 +1,40 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.db import models, transaction
+from django.http import HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.filters import OrderingFilter
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from .models import Search, Business
-from .serializers import SearchSerializer, BusinessSerializer
-from .services import GoogleMapsService
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from .models import Search, Business, SearchJob, SearchBatch, ApiUsage
+from .serializers import (
+    SearchSerializer, SearchListSerializer, BusinessSerializer,
+    BusinessReadSerializer, SearchJobSerializer, SweepSerializer,
+    WithinSerializer, NearbySerializer, ApiUsageSerializer,
+    SearchBatchSerializer, SearchBatchDetailSerializer, SearchBatchCreateSerializer
+)
+from .signals import sync_search_access
+from .queries import normalize_query, normalize_sweep
+from .export import STREAMERS, CONTENT_TYPES, astream, iter_rows
+from .pagination import CustomPagination
+from .filters import BusinessSearchFilter
+from .geo import Bounds
+from .spatial import filter_bounds, rank_by_distance
+from .tasks import start_search_batch, start_search_job
+from .metrics import get_registry
+from .events import job_events
 
 User = get_user_model()
 
-class CustomPagination(PageNumberPagination):
-    page_size = 50
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
 class SearchViewSet(viewsets.ModelViewSet):
     """
     ViewSet for managing search queries and results.
@@ -30,85 +47,79 @@ class SearchViewSet(viewsets.ModelViewSet):
         """
         Get searches for the current user, including those shared with them.
         """
-        return Search.objects.filter(
-            models.Q(user=self.request.user) | 
-            models.Q(shared_with=self.request.user)
-        ).distinct()
+        # SearchAccess has one row per (user, search), so no DISTINCT is needed
+        queryset = Search.objects.filter(access_grants__user=self.request.user)
+        if self.action != 'list':
+            queryset = queryset.prefetch_related('results__search_history')
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return SearchListSerializer
+        return SearchSerializer
+
+    @swagger_auto_schema(
+        operation_description="Create a search and queue a background job to fetch its results",
+        responses={202: SearchSerializer}
+    )
+    def create(self, request, *args, **kwargs):
+        """
+        Create a search and return immediately with its job.
 
-    def perform_create(self, serializer):
+        Poll the job at /jobs/{id}/ until it is done; the search's results
+        are filled in by the worker. Repeated queries are answered from the
+        results of the last equivalent search (see start_search_job).
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            search = serializer.save(
+                user=self.request.user,
+                normalized_query=normalize_query(serializer.validated_data['query'])
+            )
+            job = start_search_job(search)
+
+        # Results may already be linked when served from the query cache
+        models.prefetch_related_objects([search], 'results__search_history')
+        data = dict(serializer.data)
+        data['job'] = SearchJobSerializer(job).data
+        headers = self.get_success_headers(serializer.data)
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers=headers)
+
+    @swagger_auto_schema(
+        operation_description="Sweep a bounding box for a keyword as a background job",
+        request_body=SweepSerializer,
+        responses={202: SearchSerializer}
+    )
+    @action(detail=False, methods=['post'])
+    def sweep(self, request):
         """
-        Create a new search and fetch results from Google Maps.
+        Search a whole area by splitting it into tiles.
+
+        Takes a keyword plus south/west/north/east bounds, or a Google Maps
+        URL whose viewport (and search text, if no keyword is given) is used.
         """
-        try:
-            with transaction.atomic():
-                # Create the search record
-                search = serializer.save(user=self.request.user)
-                
-                # Initialize Google Maps service
-                maps_service = GoogleMapsService()
-                
-                # Get search results
-                businesses_data = maps_service.search_places(search.query)
-                
-                # Lists to store new and existing businesses
-                new_business_objects = []
-                existing_businesses = []
-                
-                # Get existing businesses with place_ids from the new results
-                place_ids = [data['place_id'] for data in businesses_data]
-                existing_business_map = {
-                    b.place_id: b for b in Business.objects.filter(place_id__in=place_ids)
-                }
-                
-                # Process each business
-                for business_data in businesses_data:
-                    existing_business = existing_business_map.get(business_data['place_id'])
-                    
-                    if existing_business:
-                        # Add the new search to the existing business's search history
-                        existing_business.search_history.add(search)
-                        existing_businesses.append(existing_business)
-                    else:
-                        # Create new business
-                        new_business = Business(
-                            search=search,
-                            **business_data
-                        )
-                        new_business_objects.append(new_business)
-                
-                # Bulk create new businesses
-                created_businesses = []
-                if new_business_objects:
-                    created_businesses = Business.objects.bulk_create(new_business_objects)
-                    # Add the search to search_history for new businesses
-                    for business in created_businesses:
-                        business.search_history.add(search)
-                
-                # Combine all businesses for the response and refresh from db
-                all_businesses = list(Business.objects.filter(
-                    models.Q(id__in=[b.id for b in created_businesses]) |
-                    models.Q(id__in=[b.id for b in existing_businesses])
-                ).select_related('search').prefetch_related('search_history'))
-                
-                # Update search with results count
-                search.results_count = len(all_businesses)
-                search.results.set(all_businesses)
-                search.save()
-
-                # Return paginated results
-                page = self.paginate_queryset(all_businesses)
-                if page is not None:
-                    serializer = BusinessSerializer(page, many=True)
-                    return self.get_paginated_response(serializer.data)
-
-                serializer = BusinessSerializer(all_businesses, many=True)
-                return Response(serializer.data)
-                
-        except Exception as e:
-            # Log the error (you should configure proper logging)
-            print(f"Error in perform_create: {str(e)}")
-            # Re-raise the exception to be handled by DRF
-            raise
+        sweep_serializer = SweepSerializer(data=request.data)
+        sweep_serializer.is_valid(raise_exception=True)
+        keyword = sweep_serializer.validated_data['keyword']
+        bounds = sweep_serializer.validated_data['bounds']
+
+        with transaction.atomic():
+            search = Search.objects.create(
+                user=request.user,
+                query=keyword[:255],
+                normalized_query=normalize_sweep(keyword, bounds)
+            )
+            job = start_search_job(
+                search,
+                kind=SearchJob.Kind.SWEEP,
+                params={'keyword': keyword, 'bounds': bounds._asdict()}
+            )
+
+        models.prefetch_related_objects([search], 'results__search_history')
+        data = dict(SearchSerializer(search).data)
+        data['job'] = SearchJobSerializer(job).data
+        return Response(data, status=status.HTTP_202_ACCEPTED)
 
     @swagger_auto_schema(
         operation_description="Share a search with other users",
@@ -136,14 +147,141 @@ class SearchViewSet(viewsets.ModelViewSet):
         return Response({'status': 'search shared'})
 
 
+class SearchJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet for polling the status of background search jobs.
+    """
+    serializer_class = SearchJobSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = CustomPagination
+    # ?search= is the search id here, not a SearchFilter term
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = ['search', 'batch', 'status']
+
+    def get_queryset(self):
+        """
+        Get jobs for searches owned by or shared with the current user.
+        """
+        return SearchJob.objects.filter(search__access_grants__user=self.request.user)
+
+
+class SearchBatchViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.ListModelMixin,
+    viewsets.GenericViewSet
+):
+    """
+    ViewSet for running many search queries as one background job.
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = CustomPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = ['status']
+
+    def get_queryset(self):
+        queryset = SearchBatch.objects.filter(user=self.request.user)
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(
+                models.Prefetch('jobs', SearchJob.objects.select_related('search').order_by('pk'))
+            )
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return SearchBatchCreateSerializer
+        if self.action == 'retrieve':
+            return SearchBatchDetailSerializer
+        return SearchBatchSerializer
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Run many queries as one background job. Takes a JSON list of queries, "
+            "or a multipart CSV upload (file) with one query per row."
+        ),
+        request_body=SearchBatchCreateSerializer,
+        responses={202: SearchBatchDetailSerializer}
+    )
+    def create(self, request, *args, **kwargs):
+        """
+        Create a search per query and queue the batch.
+
+        Poll the batch at /batches/{id}/ for its progress and the job of
+        each query; /batches/{id}/results/ maps each query to its results.
+        Queries fetched recently are served from the query cache.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        queries = serializer.validated_data['queries']
+
+        with transaction.atomic():
+            batch = SearchBatch.objects.create(user=request.user)
+            searches = Search.objects.bulk_create([
+                Search(user=request.user, query=query, normalized_query=normalize_query(query))
+                for query in queries
+            ])
+            # bulk_create skips the signal granting the owner access
+            sync_search_access(search.pk for search in searches)
+            jobs = start_search_batch(batch, searches)
+
+        data = SearchBatchSerializer(batch).data
+        data['jobs'] = [
+            {**job_data, 'query': search.query}
+            for job_data, search in zip(SearchJobSerializer(jobs, many=True).data, searches)
+        ]
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+    @swagger_auto_schema(
+        operation_description="The search and business UUIDs of each query of a batch, in query order"
+    )
+    @action(detail=True, methods=['get'])
+    def results(self, request, pk=None):
+        """Map each query of a batch to its results."""
+        batch = self.get_object()
+        jobs = list(batch.jobs.select_related('search').order_by('pk'))
+        SearchResults = Search.results.through
+        business_ids = {}
+        for search_id, business_uuid in SearchResults.objects.filter(
+            search_id__in=[job.search_id for job in jobs]
+        ).order_by('id').values_list('search_id', 'business__uuid'):
+            business_ids.setdefault(search_id, []).append(business_uuid)
+        return Response([
+            {
+                'search': job.search_id,
+                'query': job.search.query,
+                'status': job.status,
+                'results_count': len(business_ids.get(job.search_id, [])),
+                'business_ids': business_ids.get(job.search_id, []),
+            }
+            for job in jobs
+        ])
+
+
+class ApiUsageViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet for the current user's daily Google Maps API call counts.
+    """
+    serializer_class = ApiUsageSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = CustomPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['date', 'call']
+
+    def get_queryset(self):
+        return ApiUsage.objects.filter(user=self.request.user)
+
+
 class BusinessViewSet(viewsets.ModelViewSet):
     """
     ViewSet for managing business data.
     """
     serializer_class = BusinessSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CustomPagination
+    filter_backends = [DjangoFilterBackend, BusinessSearchFilter, OrderingFilter]
     filterset_fields = ['category', 'rating']
-    search_fields = ['name', 'email', 'phone', 'address']
+    # Used by BusinessSearchFilter's non-PostgreSQL fallback
+    search_fields = ['name', 'category', 'email', 'phone', 'address']
     ordering_fields = ['name', 'rating', 'created_at']
 
     def get_queryset(self):
@@ -151,25 +289,87 @@ class BusinessViewSet(viewsets.ModelViewSet):
         Get businesses from searches owned by or shared with the current user.
         """
         return Business.objects.filter(
-            search__in=Search.objects.filter(
-                models.Q(user=self.request.user) | 
-                models.Q(shared_with=self.request.user)
-            )
-        ).distinct()
+            search__access_grants__user=self.request.user
+        ).prefetch_related('search_history')
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'retrieve', 'within', 'nearby'):
+            return BusinessReadSerializer
+        return BusinessSerializer
+
+    def _distance_response(self, queryset, lat, lng, radius=None, limit=None):
+        """Serialize the businesses nearest to a point, with their distance."""
+        count, ranked = rank_by_distance(queryset, lat, lng, radius=radius, limit=limit)
+        businesses = Business.objects.prefetch_related('search_history').in_bulk(
+            [pk for pk, _ in ranked]
+        )
+        serializer = self.get_serializer([businesses[pk] for pk, _ in ranked], many=True)
+        results = serializer.data
+        for item, (_, distance) in zip(results, ranked):
+            item['distance'] = round(distance, 1)
+        return Response({'count': count, 'results': results})
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Businesses inside a bounding box, nearest to its center first. "
+            "List filters (category, rating, search) apply; distance is in meters."
+        ),
+        query_serializer=WithinSerializer
+    )
+    @action(detail=False, methods=['get'])
+    def within(self, request):
+        """Find businesses inside a bounding box."""
+        params = WithinSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        bounds = params.validated_data['bounds']
+
+        businesses = filter_bounds(self.filter_queryset(self.get_queryset()), bounds)
+        lat, lng = bounds.center
+        return self._distance_response(
+            businesses, lat, lng, limit=params.validated_data['limit']
+        )
 
     @swagger_auto_schema(
-        operation_description="Export selected businesses data",
+        operation_description=(
+            "Businesses within radius meters of a point, nearest first. "
+            "List filters (category, rating, search) apply; distance is in meters."
+        ),
+        query_serializer=NearbySerializer
+    )
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """Find businesses within a radius of a point."""
+        params = NearbySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        lat = params.validated_data['lat']
+        lng = params.validated_data['lng']
+        radius = params.validated_data['radius']
+
+        businesses = filter_bounds(
+            self.filter_queryset(self.get_queryset()),
+            Bounds.around(lat, lng, radius)
+        )
+        return self._distance_response(
+            businesses, lat, lng, radius=radius, limit=params.validated_data['limit']
+        )
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Stream businesses as CSV, NDJSON or XLSX. Exports the given business_ids, "
+            "or every business matching the list filters (category, rating, search, "
+            "ordering) passed as query parameters."
+        ),
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             properties={
                 'business_ids': openapi.Schema(
                     type=openapi.TYPE_ARRAY,
                     items=openapi.Schema(type=openapi.TYPE_STRING),
-                    description="List of business UUIDs to export"
+                    description="List of business UUIDs to export; omit to export the filtered list"
                 ),
                 'format': openapi.Schema(
                     type=openapi.TYPE_STRING,
-                    enum=['csv', 'xlsx'],
+                    enum=list(STREAMERS),
                     description="Export format"
                 )
             }
@@ -177,11 +377,83 @@ class BusinessViewSet(viewsets.ModelViewSet):
     )
     @action(detail=False, methods=['post'])
     def export(self, request):
-        """Export selected businesses to CSV or Excel."""
-        business_ids = request.data.get('business_ids', [])
+        """Stream selected or filtered businesses to CSV, NDJSON or Excel."""
+        business_ids = request.data.get('business_ids')
         export_format = request.data.get('format', 'csv')
-        
-        businesses = self.get_queryset().filter(uuid__in=business_ids)
-        
-        # TODO: Implement export functionality
-        return Response({'status': 'export initiated'})
+        if export_format not in STREAMERS:
+            return Response(
+                {'format': f"Must be one of: {', '.join(STREAMERS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        businesses = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        if business_ids:
+            businesses = businesses.filter(uuid__in=business_ids)
+
+        rows = iter_rows(businesses, chunk_size=settings.EXPORT_CHUNK_SIZE)
+        chunks = STREAMERS[export_format](rows)
+        # An ASGI server would read a sync iterator into memory first; only
+        # ASGI requests carry a scope
+        if getattr(request, 'scope', None) is not None:
+            chunks = astream(chunks)
+        response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[export_format])
+        filename = f"businesses-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+def _stream_user(request):
+    """
+    User of a JWT sent as `Authorization: Bearer <token>` or, since
+    EventSource cannot set headers, as ?token=<token>; None if invalid.
+    """
+    authentication = JWTAuthentication()
+    try:
+        token = request.GET.get('token')
+        if token:
+            return authentication.get_user(authentication.get_validated_token(token.encode()))
+        result = authentication.authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+async def job_event_stream(request, pk):
+    """
+    Server-Sent Events with a search job's progress and its results as they
+    are written (see scraper.events). Resumes after the results already
+    received when the client sends Last-Event-ID.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    user = await sync_to_async(_stream_user)(request)
+    if user is None:
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    job = await SearchJob.objects.filter(
+        pk=pk, search__access_grants__user=user
+    ).values('search_id').afirst()
+    if job is None:
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    after = int(last_event_id) if last_event_id.isdigit() else 0
+    response = StreamingHttpResponse(
+        job_events(pk, job['search_id'], after=after),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies (nginx) from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metrics(request):
+    """
+    Prometheus metrics in the text exposition format.
+
+    Requires `Authorization: Bearer <METRICS_TOKEN>` when METRICS_TOKEN is set.
+    """
+    token = settings.METRICS_TOKEN
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)